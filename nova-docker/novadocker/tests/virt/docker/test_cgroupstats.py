@@ -0,0 +1,122 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import os
+
+import fixtures
+import mock
+
+from nova import test
+from novadocker.virt.docker import cgroupstats
+
+NET_DEV = """Inter-|   Receive                            |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|\
+bytes    packets errs drop fifo colls carrier compressed
+    lo:     100       1    0    0    0     0          0         0 \
+     100       1    0    0    0     0       0          0
+  eth0:  123456     789    1    2    0     0          0         0 \
+   65432     321    3    4    0     0       0          0
+"""
+
+
+class CgroupStatsTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(CgroupStatsTestCase, self).setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        self.reader = cgroupstats.CgroupStatsReader(
+            os.path.join(self.root, '%(controller)s', 'docker'))
+
+    def _write(self, controller, container_id, name, data):
+        group = os.path.join(self.root, controller, 'docker', container_id)
+        if not os.path.isdir(group):
+            os.makedirs(group)
+        with open(os.path.join(group, name), 'w') as f:
+            f.write(data)
+
+    def _container(self, container_id, cpu, rss):
+        self._write('cpuacct', container_id, 'cpuacct.usage', '%d\n' % cpu)
+        self._write('memory', container_id, 'memory.usage_in_bytes',
+                    '%d\n' % (rss * 2))
+        self._write('memory', container_id, 'memory.limit_in_bytes',
+                    '1073741824\n')
+        self._write('memory', container_id, 'memory.stat',
+                    'cache %d\nrss %d\ntotal_rss %d\n' % (rss, rss, rss))
+        self._write('blkio', container_id,
+                    'blkio.throttle.io_service_bytes',
+                    '8:0 Read 4096\n8:0 Write 8192\n8:0 Sync 0\n'
+                    '8:0 Total 12288\nTotal 12288\n')
+        self._write('blkio', container_id, 'blkio.throttle.io_serviced',
+                    '8:0 Read 1\n8:0 Write 2\n8:0 Total 3\nTotal 3\n')
+
+    def test_read_all(self):
+        self._container('aaa', 1000, 4096)
+        self._container('bbb', 2000, 8192)
+        with mock.patch.object(cgroupstats, '_read',
+                               wraps=cgroupstats._read) as read:
+            with mock.patch('os.listdir', wraps=os.listdir) as listdir:
+                stats = self.reader.read_all({'aaa': None, 'bbb': None,
+                                              'gone': None})
+        self.assertEqual(['aaa', 'bbb'], sorted(stats))
+        self.assertEqual(3, listdir.call_count)
+        self.assertFalse([c for c in read.call_args_list
+                          if 'gone' in c[0][0]])
+        self.assertEqual(1000, stats['aaa'].cpu_time)
+        self.assertEqual(8192, stats['aaa'].memory_usage)
+        self.assertEqual(1073741824, stats['aaa'].memory_limit)
+        self.assertEqual(8192, cgroupstats.memory_rss(stats['bbb']))
+        self.assertEqual(cgroupstats.BlkioStats(4096, 8192, 1, 2),
+                         stats['aaa'].blkio['8:0'])
+        self.assertEqual({}, stats['aaa'].net)
+
+    def test_read_all_without_io(self):
+        self._container('aaa', 1000, 4096)
+        with contextlib.nested(
+            mock.patch.object(cgroupstats, '_read',
+                              wraps=cgroupstats._read),
+            mock.patch('os.listdir', wraps=os.listdir)
+        ) as (read, listdir):
+            stats = self.reader.read_all({'aaa': 1234}, io=False)
+        self.assertEqual(2, listdir.call_count)
+        self.assertFalse([c for c in read.call_args_list
+                          if 'blkio' in c[0][0] or 'net/dev' in c[0][0]])
+        self.assertEqual(1000, stats['aaa'].cpu_time)
+        self.assertEqual(4096, cgroupstats.memory_rss(stats['aaa']))
+        self.assertEqual({}, stats['aaa'].blkio)
+        self.assertEqual({}, stats['aaa'].net)
+
+    def test_read_net_from_proc(self):
+        self._container('aaa', 1000, 4096)
+        real_read = cgroupstats._read
+
+        def fake_read(path):
+            if path == '/proc/1234/net/dev':
+                return NET_DEV
+            return real_read(path)
+
+        with mock.patch.object(cgroupstats, '_read', side_effect=fake_read):
+            stats = self.reader.read('aaa', 1234)
+        self.assertEqual(['eth0'], stats.net.keys())
+        self.assertEqual(cgroupstats.NetStats(123456, 789, 1, 2,
+                                              65432, 321, 3, 4),
+                         stats.net['eth0'])
+
+    def test_read_without_cgroups(self):
+        self.assertIsNone(self.reader.read('aaa'))
+
+    def test_memory_rss_falls_back_to_usage(self):
+        stats = cgroupstats.ContainerStats(0, 4096, 0, {}, {}, {})
+        self.assertEqual(4096, cgroupstats.memory_rss(stats))
@@ -0,0 +1,89 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.utils import units
+
+from nova import test
+from novadocker.virt.docker import commitment
+
+
+def _container(name, memory=0, shares=0, cpuset='', env=None):
+    if env is None:
+        env = ['%s=%s-uuid' % (commitment.ENV_INSTANCE, name)]
+    return {'Id': name + '_id', 'Name': '/' + name,
+            'Config': {'Memory': memory, 'CpuShares': shares,
+                       'Cpuset': cpuset, 'Env': env}}
+
+
+class CommitmentLedgerTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(CommitmentLedgerTestCase, self).setUp()
+        self.ledger = commitment.CommitmentLedger()
+
+    def test_totals(self):
+        self.ledger.record('a', 'a_id', 2, 512 * units.Mi, [0, 1])
+        self.ledger.record('b', 'b_id', 1, 0, [1])
+        totals = self.ledger.totals({'a': units.Mi, 'b': 64 * units.Mi})
+        self.assertEqual(commitment.Totals(2, 3, 576 * units.Mi, 2), totals)
+        self.assertTrue(self.ledger.release('a'))
+        self.assertFalse(self.ledger.release('a'))
+        self.assertEqual(commitment.Totals(1, 1, 64 * units.Mi, 1),
+                         self.ledger.totals({'b': 64 * units.Mi}))
+
+    def test_reconcile(self):
+        self.ledger.record('kept', 'kept_id', 4, units.Gi)
+        self.ledger.record('gone', 'gone_id', 1, units.Gi)
+        added, removed = self.ledger.reconcile([
+            _container('kept', units.Gi),
+            _container('kept_vol'),
+            _container('new', 256 * units.Mi, shares=2048),
+            _container('pinned', cpuset='2-4')])
+        self.assertEqual((['new', 'pinned'], ['gone']), (added, removed))
+        # cpushare mode leaves no trace of the vCPUs on the container.
+        self.assertEqual(4, self.ledger.get('kept').vcpus)
+        self.assertEqual(2, self.ledger.get('new').vcpus)
+        pinned = self.ledger.get('pinned')
+        self.assertEqual((3, (2, 3, 4)), (pinned.vcpus, pinned.cpus))
+        self.assertEqual({'kept': 'kept_id', 'new': 'new_id',
+                          'pinned': 'pinned_id'},
+                         self.ledger.container_ids())
+        self.assertNotEqual(0, self.ledger.reconciled_at)
+
+    def test_reconcile_unpinned(self):
+        self.ledger.reconcile([_container('a', cpuset='2-4')], pinned=False)
+        self.assertEqual((), self.ledger.get('a').cpus)
+        self.assertEqual(0, self.ledger.totals().pinned_cpus)
+
+    def test_reconcile_after_restart(self):
+        env = ['%s=%s' % item for item in
+               commitment.instance_env({'uuid': 'fake-uuid'}, 4).items()]
+        names = commitment.name_pattern('instance-%08x')
+        self.ledger.reconcile([
+            _container('marked', env=env),
+            _container('instance-0000002a', units.Gi, env=[]),
+            _container('registry', units.Gi, env=['PATH=/bin'])],
+            names=names)
+        self.assertEqual(4, self.ledger.get('marked').vcpus)
+        self.assertEqual(1, self.ledger.get('instance-0000002a').vcpus)
+        self.assertIsNone(self.ledger.get('registry'))
+        self.assertEqual(commitment.Totals(2, 5, units.Gi, 0),
+                         self.ledger.totals())
+
+    def test_name_pattern(self):
+        pattern = commitment.name_pattern('inst-%(uuid)s-x')
+        self.assertTrue(pattern.match('inst-fake-uuid-x'))
+        self.assertFalse(pattern.match('inst-fake-uuid'))
+        self.assertIsNone(commitment.name_pattern('%(uuid)s'))
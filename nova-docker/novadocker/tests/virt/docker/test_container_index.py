@@ -0,0 +1,111 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from nova import test
+from novadocker.virt.docker import container_index
+
+
+def _inspect(container_id, name, running=True):
+    return {'Id': container_id, 'Name': '/' + name,
+            'State': {'Running': running}}
+
+
+class ContainerIndexTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ContainerIndexTestCase, self).setUp()
+        self.docker = mock.Mock()
+        self.docker.containers.return_value = [
+            {'Id': 'id1', 'Names': ['/inst-1']},
+            {'Id': 'id2', 'Names': ['/inst-2']}]
+        self.docker.inspect_container.side_effect = (
+            lambda ref: _inspect(ref, 'inst-' + ref[-1]))
+        self.index = container_index.ContainerIndex(lambda: self.docker)
+
+    def _go_live(self):
+        self.index.resync()
+        self.index._live = True
+        self.docker.containers.reset_mock()
+
+    def test_passthrough_when_not_live(self):
+        self.assertEqual(['inst-1', 'inst-2'], self.index.list_names())
+        info = self.index.inspect('inst-2')
+        self.assertEqual('id2', info['Id'])
+        self.docker.containers.assert_called_with(
+            all=True, filters={'name': 'inst-2'})
+
+    def test_live_lookups_do_not_list(self):
+        self._go_live()
+        self.assertTrue(self.index.exists('inst-1'))
+        self.assertFalse(self.index.exists('inst-3'))
+        self.assertEqual('id1', self.index.get_id('inst-1'))
+        self.assertEqual('id1', self.index.get_id('inst-1'))
+        self.assertFalse(self.docker.containers.called)
+        self.docker.inspect_container.assert_called_once_with('id1')
+
+    def test_state_event_invalidates(self):
+        self._go_live()
+        self.index.inspect('inst-1')
+        self.index._handle_event({'status': 'die', 'id': 'id1'})
+        self.index.inspect('inst-1')
+        self.assertEqual(2, self.docker.inspect_container.call_count)
+
+    def test_create_and_destroy_events(self):
+        self._go_live()
+        self.index._handle_event('{"status": "create", "id": "id3"}')
+        self.assertTrue(self.index.exists('inst-3'))
+        self.index._handle_event({'status': 'destroy', 'id': 'id3'})
+        self.assertFalse(self.index.exists('inst-3'))
+
+    def test_get_name(self):
+        self._go_live()
+        self.assertEqual('inst-1', self.index.get_name('id1'))
+        self.assertEqual('inst-2', self.index.get_name('inst-2'))
+        self.assertIsNone(self.index.get_name('id3'))
+
+    def test_image_events_ignored(self):
+        self._go_live()
+        self.index._handle_event({'status': 'untag', 'id': 'busybox'})
+        self.assertFalse(self.docker.inspect_container.called)
+
+    def test_wait_for_pid_immediate(self):
+        self.docker.inspect_container.side_effect = None
+        self.docker.inspect_container.return_value = {'State': {'Pid': 42}}
+        self.assertEqual(42, self.index.wait_for_pid('id1', 5))
+        self.docker.inspect_container.assert_called_once_with('id1')
+
+    def test_wait_for_pid_woken_by_event(self):
+        states = [{'State': {'Pid': 0}}, {'State': {'Pid': 42}}]
+        self.docker.inspect_container.side_effect = lambda ref: states.pop(0)
+
+        def fake_wait(waiter, timeout):
+            # The start event arrives while the waiter is blocked.
+            self.index._wake('id1')
+            return True
+
+        with mock.patch('threading._Event.wait', fake_wait):
+            self.assertEqual(42, self.index.wait_for_pid('id1', 5))
+        self.assertEqual({}, self.index._waiters)
+
+    @mock.patch('time.time')
+    def test_wait_for_pid_timeout(self, fake_time):
+        fake_time.side_effect = [100, 100.1, 106]
+        self.docker.inspect_container.side_effect = None
+        self.docker.inspect_container.return_value = {'State': {'Pid': 0}}
+        with mock.patch('threading._Event.wait') as wait:
+            self.assertIsNone(self.index.wait_for_pid('id1', 5))
+        wait.assert_called_once_with(container_index._PID_POLL_MIN)
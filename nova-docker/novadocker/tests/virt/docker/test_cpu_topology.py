@@ -0,0 +1,114 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+from nova import test
+from novadocker.virt.docker import cpu_topology
+
+
+def make_sysfs(root, sockets, cores, threads):
+    """Build a fake /sys/devices/system with one NUMA node per socket.
+
+    CPUs are numbered like Linux does on x86: all first threads, then all
+    second threads, so the siblings of cpu N are N + k * sockets * cores.
+    """
+    per_thread = sockets * cores
+    total = per_thread * threads
+    cpu_root = os.path.join(root, 'cpu')
+    os.makedirs(cpu_root)
+    with open(os.path.join(cpu_root, 'online'), 'w') as f:
+        f.write('0-%d\n' % (total - 1))
+    node_cpus = {}
+    for cpu in range(total):
+        core_index = cpu % per_thread
+        socket = core_index // cores
+        core = core_index % cores
+        siblings = [core_index + t * per_thread for t in range(threads)]
+        topo = os.path.join(cpu_root, 'cpu%d' % cpu, 'topology')
+        os.makedirs(topo)
+        for name, value in (('physical_package_id', socket),
+                            ('core_id', core),
+                            ('thread_siblings_list',
+                             ','.join(str(s) for s in siblings))):
+            with open(os.path.join(topo, name), 'w') as f:
+                f.write('%s\n' % value)
+        node_cpus.setdefault(socket, []).append(cpu)
+    for node, cpus in node_cpus.items():
+        node_dir = os.path.join(root, 'node', 'node%d' % node)
+        os.makedirs(node_dir)
+        with open(os.path.join(node_dir, 'cpulist'), 'w') as f:
+            f.write(','.join(str(c) for c in cpus) + '\n')
+
+
+class HostTopologyTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HostTopologyTestCase, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def _topology(self, sockets=2, cores=4, threads=2):
+        make_sysfs(self.root, sockets, cores, threads)
+        return cpu_topology.HostTopology.from_sysfs(self.root)
+
+    def _usage(self, topology, busy=()):
+        usage = dict((cpu, 0) for cpu in topology.cpus)
+        for cpu in busy:
+            usage[cpu] += 1
+        return usage
+
+    def test_parse_cpulist(self):
+        self.assertEqual([0, 1, 2, 3, 8, 10, 11],
+                         cpu_topology.parse_cpulist('0-3,8,10-11\n'))
+
+    def test_from_sysfs(self):
+        topology = self._topology()
+        self.assertEqual(16, len(topology.cpus))
+        self.assertEqual(1, topology.node_of(4))
+        self.assertEqual(1, topology.node_of(12))
+        self.assertEqual([0, 8], topology.cpus[8].siblings)
+
+    def test_missing_sysfs(self):
+        self.assertIsNone(cpu_topology.HostTopology.from_sysfs(
+            os.path.join(self.root, 'missing')))
+
+    def test_packs_onto_one_node(self):
+        topology = self._topology()
+        # Node 0 is partly busy, so a 4 CPU container goes to node 1.
+        usage = self._usage(topology, busy=[0, 1])
+        cpus = topology.place(4, usage)
+        self.assertEqual([1], topology.mems_for(cpus))
+
+    def test_prefer_siblings(self):
+        topology = self._topology()
+        cpus = topology.place(4, self._usage(topology),
+                              cpu_topology.SIBLINGS_PREFER)
+        self.assertEqual([0, 1, 8, 9], cpus)
+
+    def test_avoid_siblings(self):
+        topology = self._topology()
+        cpus = topology.place(4, self._usage(topology),
+                              cpu_topology.SIBLINGS_AVOID)
+        self.assertEqual([0, 1, 2, 3], cpus)
+        self.assertEqual([0], topology.mems_for(cpus))
+
+    def test_spreads_when_no_node_fits(self):
+        topology = self._topology(sockets=2, cores=2, threads=1)
+        cpus = topology.place(3, self._usage(topology))
+        self.assertEqual(3, len(cpus))
+        self.assertEqual([0, 1], topology.mems_for(cpus))
@@ -0,0 +1,71 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import mock
+
+from nova import test
+from nova import utils
+from novadocker.virt.docker import cpuset_info
+from novadocker.virt.docker import hostinfo
+
+
+class CpusetLedgerTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(CpusetLedgerTestCase, self).setUp()
+        self.stubs.Set(hostinfo, 'get_cpu_info', lambda: 8)
+
+    def _write_cgroup(self, root, container_id, cpus):
+        path = os.path.join(root, container_id)
+        os.makedirs(path)
+        with open(os.path.join(path, 'cpuset.cpus'), 'w') as f:
+            f.write(cpus + '\n')
+
+    def test_rebuild_from_cgroups(self):
+        with utils.tempdir() as root:
+            self._write_cgroup(root, 'id1', '1-2')
+            self._write_cgroup(root, 'id2', '2,3')
+            self._write_cgroup(root, 'id3', '0-7')
+            self._write_cgroup(root, 'other', '4')
+            ledger = cpuset_info.CpusetLedger('0', root)
+            ledger.rebuild({'id1': 'inst-1', 'id2': 'inst-2',
+                            'id3': 'inst-3'})
+        self.assertEqual([1, 2], ledger.get('inst-1'))
+        self.assertIsNone(ledger.get('inst-3'))
+        usage = ledger.usage()
+        self.assertNotIn(0, usage)
+        self.assertEqual(2, usage[2])
+        self.assertEqual(0, usage[4])
+
+    def test_allocate_least_used(self):
+        ledger = cpuset_info.CpusetLedger('0', '/nonexistent')
+        ledger.assign('busy', [1, 2, 3])
+        cpus = ledger.allocate('inst-1', 2)
+        self.assertEqual([4, 5], cpus)
+        # A second call for the same container keeps its CPUs.
+        self.assertEqual([4, 5], ledger.allocate('inst-1', 2))
+        ledger.release('inst-1')
+        self.assertEqual(0, ledger.usage()[4])
+
+    @mock.patch.object(utils, 'execute')
+    def test_allocate_needs_no_subprocess(self, execute):
+        ledger = cpuset_info.CpusetLedger('-1', '/nonexistent')
+        ledger.allocate('inst-1', 4)
+        self.assertFalse(execute.called)
+        self.assertEqual('0,1,2,3', cpuset_info.format_cpuset(
+            ledger.get('inst-1')))
+        self.assertEqual(8, hostinfo.get_cpu_info())
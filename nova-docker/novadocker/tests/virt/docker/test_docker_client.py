@@ -452,3 +452,30 @@ class DockerHTTPClientTestCase(test.NoDBTestCase):
         client.load_repository('XXX', data)
 
         self.mox.VerifyAll()
+
+
+class CaseInsensitiveDictTestCase(test.NoDBTestCase):
+
+    def _decode(self, body):
+        return jsonutils.loads(
+            body, object_pairs_hook=docker_client.CaseInsensitiveDict)
+
+    def test_lookup_any_case(self):
+        data = self._decode('{"Id": "XXX", "State": {"Running": true}}')
+        self.assertEqual('XXX', data['Id'])
+        self.assertEqual('XXX', data['id'])
+        self.assertTrue(data.get('state')['running'])
+        self.assertIn('ID', data)
+        self.assertIsNone(data.get('missing'))
+
+    def test_no_duplicate_keys(self):
+        data = self._decode('{"Id": "XXX", "Names": ["/a"]}')
+        self.assertEqual(['Id', 'Names'], sorted(data.keys()))
+
+    def test_filter_data(self):
+        @docker_client.filter_data
+        def fake():
+            return [{'Id': 'XXX', 'Config': {'Memory': 1}}]
+        data = fake()
+        self.assertEqual('XXX', data[0]['id'])
+        self.assertEqual(1, data[0]['config']['memory'])
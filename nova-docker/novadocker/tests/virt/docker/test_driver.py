@@ -15,12 +15,17 @@
 
 import contextlib
 import socket
+import time
 
+from eventlet import greenthread
 import mock
 
+from nova.compute import flavors
+from nova.compute import power_state
 from nova.compute import task_states
 from nova import context
 from nova import exception
+from nova.image import glance
 from nova.openstack.common import jsonutils
 from nova.openstack.common import units
 from nova import test
@@ -30,7 +35,10 @@ from nova.tests import utils
 from nova.tests.virt.test_virt_drivers import _VirtDriverTestCase
 from novadocker.tests.virt.docker import mock_client
 import novadocker.virt.docker
+from novadocker.virt.docker import cgroupstats
+from novadocker.virt.docker import client as docker_client
 from novadocker.virt.docker import hostinfo
+from novadocker.virt.docker import migration
 from novadocker.virt.docker import network
 
 
@@ -70,7 +78,7 @@ class DockerDriverTestCase(_VirtDriverTestCase, test.TestCase):
         self.connection.init_host(None)
 
     def test_driver_capabilities(self):
-        self.assertFalse(self.connection.capabilities['has_imagecache'])
+        self.assertTrue(self.connection.capabilities['has_imagecache'])
         self.assertFalse(self.connection.capabilities['supports_recreate'])
 
     # NOTE(bcwaldon): This exists only because _get_running_instance on the
@@ -142,6 +150,69 @@ class DockerDriverTestCase(_VirtDriverTestCase, test.TestCase):
             }
             self.assertEqual(expected_stats, stats)
 
+    def test_get_available_resource_counts_commitments(self):
+        memory = {'total': 4 * units.Gi, 'used': 2 * units.Gi}
+        disk = {'total': 50 * units.Gi, 'available': 25 * units.Gi,
+                'used': 25 * units.Gi}
+        stats = cgroupstats.ContainerStats(
+            cpu_time=0, memory_usage=units.Gi, memory_limit=units.Gi,
+            memory_stat={'rss': 768 * units.Mi}, blkio={}, net={})
+        self.connection._commitments.record('limited', 'a_id', 2, units.Gi)
+        self.connection._commitments.record('unlimited', 'b_id', 1, 0)
+        self.connection._commitments.reconciled_at = time.time()
+        with contextlib.nested(
+            mock.patch.object(hostinfo, 'get_memory_usage',
+                              return_value=memory),
+            mock.patch.object(hostinfo, 'get_disk_usage',
+                              return_value=disk),
+            mock.patch.object(self.connection._cgroup_stats, 'read_all',
+                              return_value={'a_id': stats, 'b_id': stats}),
+            mock.patch.object(self.connection, 'get_instances_info')
+        ) as (get_memory_usage, get_disk_usage, read_all, instances_info):
+            res = self.connection.get_available_resource(nodename='test')
+        self.assertFalse(instances_info.called)
+        self.assertEqual(3, res['vcpus_used'])
+        # 512 MB of host overhead, the limit of one container and the
+        # resident memory of the other.
+        self.assertEqual(512 + 1024 + 768, res['memory_mb_used'])
+
+    def test_spawned_container_counted_in_available_resource(self):
+        driver = self.connection
+        instance = {'name': 'fake_name'}
+        memory = {'total': 4 * units.Gi, 'used': 2 * units.Gi}
+        disk = {'total': 50 * units.Gi, 'available': 25 * units.Gi,
+                'used': 25 * units.Gi}
+        driver._commitments.reconciled_at = time.time()
+        with contextlib.nested(
+            mock.patch.object(driver, '_prepare_image',
+                              return_value=('image_name', {})),
+            mock.patch.object(driver, '_get_cpu_set', return_value=None),
+            mock.patch.object(driver, '_create_volume_containers',
+                              return_value=False),
+            mock.patch.object(driver, '_create_container_args',
+                              return_value={}),
+            mock.patch.object(driver, '_create_container',
+                              return_value=docker_client.CaseInsensitiveDict(
+                                  {'Id': 'fake_id', 'Warnings': None})),
+            mock.patch.object(driver, '_get_memory_limit_bytes',
+                              return_value=units.Gi),
+            mock.patch.object(driver, '_exist_container', return_value=False),
+            mock.patch.object(self.mock_client, 'update_start', create=True),
+            mock.patch.object(flavors, 'extract_flavor',
+                              return_value={'vcpus': 2}),
+            mock.patch.object(hostinfo, 'get_memory_usage',
+                              return_value=memory),
+            mock.patch.object(hostinfo, 'get_disk_usage',
+                              return_value=disk),
+            mock.patch.object(driver._cgroup_stats, 'read_all',
+                              return_value={})
+        ) as mocks:
+            driver.spawn(None, instance, {}, None, None)
+            res = driver.get_available_resource(nodename='test')
+        mocks[-1].assert_called_once_with({'fake_id': None}, io=False)
+        self.assertEqual(2, res['vcpus_used'])
+        self.assertEqual(2048 + 1024, res['memory_mb_used'])
+
     def test_create_container(self, image_info=None, instance_href=None):
         if instance_href is None:
             instance_href = utils.get_test_instance()
@@ -286,6 +357,187 @@ class DockerDriverTestCase(_VirtDriverTestCase, test.TestCase):
             pid = driver._find_container_pid("fake_container_id")
             self.assertEqual(pid, '12345')
 
+    def test_get_info_served_from_snapshot(self):
+        driver = novadocker.virt.docker.driver.DockerDriver(None)
+        info = {'Id': 'fake_id', 'Name': '/fake_name',
+                'State': {'Running': True},
+                'Config': {'Memory': units.Mi, 'CpuShares': 2048}}
+        with contextlib.nested(
+            mock.patch.object(self.mock_client, 'containers', create=True,
+                              return_value=[{'Id': 'fake_id',
+                                             'Names': ['/fake_name']}]),
+            mock.patch.object(self.mock_client, 'inspect_container',
+                              return_value=info)
+        ) as (containers, inspect_container):
+            driver.get_info({'name': 'fake_name'})
+            res = driver.get_info({'name': 'fake_name'})
+            self.assertEqual(1, containers.call_count)
+            self.assertEqual(1, inspect_container.call_count)
+            self.assertEqual(power_state.RUNNING, res['state'])
+            self.assertEqual(2, res['num_cpu'])
+
+    def test_stale_snapshot_rebuilt_once(self):
+        driver = novadocker.virt.docker.driver.DockerDriver(None)
+        calls = []
+
+        def rebuild():
+            calls.append(1)
+            greenthread.sleep(0)
+            driver._info_snapshot = {'fake_name': {'state': 1}}
+            driver._info_snapshot_time = time.time()
+
+        with mock.patch.object(driver, 'get_instances_info',
+                               side_effect=rebuild):
+            threads = [greenthread.spawn(driver._get_snapshot_info,
+                                         'fake_name') for _ in range(5)]
+            results = [thread.wait() for thread in threads]
+            driver._get_snapshot_info('fake_name')
+        self.assertEqual(1, len(calls))
+        self.assertEqual([{'state': 1}] * 5, results)
+
+    def test_power_off_drops_only_its_snapshot_entry(self):
+        driver = novadocker.virt.docker.driver.DockerDriver(None)
+        stopped = {'Id': 'id1', 'Name': '/inst-1',
+                   'State': {'Running': False},
+                   'Config': {'Memory': units.Mi, 'CpuShares': 1024}}
+        driver._index.store(dict(stopped, State={'Running': True}))
+        driver._info_snapshot = {'inst-1': {'state': power_state.RUNNING},
+                                 'inst-2': {'state': power_state.RUNNING}}
+        driver._info_snapshot_time = time.time()
+        with contextlib.nested(
+            mock.patch.object(driver, 'get_instances_info'),
+            mock.patch.object(driver, '_find_container_by_name',
+                              return_value=stopped),
+            mock.patch.object(driver._cgroup_stats, 'read',
+                              return_value=None)
+        ) as (rebuild, byname, read):
+            driver._invalidate_container('id1')
+            res1 = driver.get_info({'name': 'inst-1'})
+            res2 = driver.get_info({'name': 'inst-2'})
+        self.assertFalse(rebuild.called)
+        self.assertEqual(power_state.SHUTDOWN, res1['state'])
+        self.assertEqual(power_state.RUNNING, res2['state'])
+
+    def test_get_info_and_diagnostics_from_cgroups(self):
+        driver = novadocker.virt.docker.driver.DockerDriver(None)
+        info = {'Id': 'fake_id', 'Name': '/fake_name',
+                'State': {'Running': True, 'Pid': 1234},
+                'Config': {'Memory': 512 * units.Mi, 'CpuShares': 1024}}
+        stats = cgroupstats.ContainerStats(
+            cpu_time=5000000, memory_usage=96 * units.Mi,
+            memory_limit=512 * units.Mi,
+            memory_stat={'rss': 64 * units.Mi, 'cache': 32 * units.Mi},
+            blkio={'8:0': cgroupstats.BlkioStats(4096, 8192, 1, 2)},
+            net={'eth0': cgroupstats.NetStats(10, 1, 0, 0, 20, 2, 0, 0)})
+        self.flags(info_cache_ttl=0, group='docker')
+        with contextlib.nested(
+            mock.patch.object(driver, '_find_container_by_name',
+                              return_value=info),
+            mock.patch.object(driver._cgroup_stats, 'read',
+                              return_value=stats),
+            mock.patch.object(hostinfo, 'get_container_disk_usage',
+                              return_value=3 * units.Mi)
+        ) as (byname, read, disk_usage):
+            res = driver.get_info({'name': 'fake_name'})
+            diags = driver.get_diagnostics({'name': 'fake_name'})
+            instance_diags = driver.get_instance_diagnostics(
+                {'name': 'fake_name'})
+        self.assertEqual([mock.call('fake_id', 1234, io=False),
+                          mock.call('fake_id', 1234, io=True),
+                          mock.call('fake_id', 1234, io=True)],
+                         read.call_args_list)
+        self.assertEqual(512 * units.Ki, res['max_mem'])
+        self.assertEqual(64 * units.Ki, res['mem'])
+        self.assertEqual(5000000, res['cpu_time'])
+        self.assertEqual(5000000, diags['cpu0_time'])
+        self.assertEqual(64 * units.Ki, diags['memory-rss'])
+        self.assertEqual(8192, diags['8:0_write'])
+        self.assertEqual(20, diags['eth0_tx'])
+        self.assertEqual(3 * units.Mi, diags['rootfs_used'])
+        disk_usage.assert_called_with('fake_id')
+        self.assertEqual(64, instance_diags.memory_details.used)
+        self.assertEqual(512, instance_diags.memory_details.maximum)
+        self.assertEqual(1, len(instance_diags.nic_details))
+
+    def test_spawn_plugs_while_fetching_the_image(self):
+        driver = novadocker.virt.docker.driver.DockerDriver(None)
+        instance = {'name': 'fake_name'}
+        network_info = [{'id': 'vif1'}]
+        calls = []
+
+        def prepare_image(*args):
+            # Give the other stages a chance to run first.
+            greenthread.sleep(0)
+            calls.append('image')
+            return 'image_name', {'Config': {'Cmd': ['sh']}}
+
+        with contextlib.nested(
+            mock.patch.object(driver, '_prepare_image',
+                              side_effect=prepare_image),
+            mock.patch.object(driver, '_get_cpu_set', return_value='2-3'),
+            mock.patch.object(driver, 'plug_vifs',
+                              side_effect=lambda *a: calls.append('plug')),
+            mock.patch.object(driver, '_create_volume_containers',
+                              return_value=False),
+            mock.patch.object(driver, '_create_container_args',
+                              return_value={}),
+            mock.patch.object(driver, '_create_container',
+                              return_value='fake_id'),
+            mock.patch.object(driver, '_start_container')
+        ) as (prepare, cpuset, plug, volumes, args, create, start):
+            driver.spawn(None, instance, {}, None, None, network_info)
+        self.assertEqual(['plug', 'image'], calls)
+        self.assertEqual('2-3', args.call_args[1]['cpuset'])
+        start.assert_called_once_with('fake_id', instance, network_info,
+                                      plugged=True)
+
+    def test_spawn_failure_rolls_back_the_stages(self):
+        driver = novadocker.virt.docker.driver.DockerDriver(None)
+        instance = {'name': 'fake_name'}
+        network_info = [{'id': 'vif1'}]
+        with contextlib.nested(
+            mock.patch.object(driver, '_prepare_image',
+                              side_effect=exception.ImageNotFound(
+                                  image_id='fake')),
+            mock.patch.object(driver, '_get_cpu_set', return_value='2-3'),
+            mock.patch.object(driver, 'plug_vifs'),
+            mock.patch.object(driver, 'unplug_vifs'),
+            mock.patch.object(driver, '_release_cpu_set'),
+            mock.patch.object(driver, '_create_container')
+        ) as (prepare, cpuset, plug, unplug, release, create):
+            self.assertRaises(exception.ImageNotFound, driver.spawn, None,
+                              instance, {}, None, None, network_info)
+        plug.assert_called_once_with(instance, network_info)
+        unplug.assert_called_once_with(instance, network_info)
+        release.assert_called_once_with(instance)
+        self.assertFalse(create.called)
+
+    def test_spawn_start_failure_rolls_back_the_stages(self):
+        driver = novadocker.virt.docker.driver.DockerDriver(None)
+        instance = {'name': 'fake_name'}
+        network_info = [{'id': 'vif1'}]
+        with contextlib.nested(
+            mock.patch.object(driver, '_prepare_image',
+                              return_value=('image_name', {})),
+            mock.patch.object(driver, '_get_cpu_set', return_value='2-3'),
+            mock.patch.object(driver, 'plug_vifs'),
+            mock.patch.object(driver, 'unplug_vifs'),
+            mock.patch.object(driver, '_release_cpu_set'),
+            mock.patch.object(driver, '_create_volume_containers',
+                              return_value=False),
+            mock.patch.object(driver, '_create_container_args',
+                              return_value={}),
+            mock.patch.object(driver, '_create_container',
+                              return_value='fake_id'),
+            mock.patch.object(driver, '_start_container',
+                              side_effect=exception.NovaException('boom'))
+        ) as (prepare, cpuset, plug, unplug, release, volumes, args, create,
+              start):
+            self.assertRaises(exception.NovaException, driver.spawn, None,
+                              instance, {}, None, None, network_info)
+        unplug.assert_called_once_with(instance, network_info)
+        release.assert_called_once_with(instance)
+
     @mock.patch.object(novadocker.tests.virt.docker.mock_client.MockClient,
                        'load_repository')
     @mock.patch.object(novadocker.tests.virt.docker.mock_client.MockClient,
@@ -331,6 +583,29 @@ class DockerDriverTestCase(_VirtDriverTestCase, test.TestCase):
         self.assertEqual(snapshot['container_format'], 'docker')
         self.assertEqual(snapshot['name'], snapshot_name)
 
+    def test_snapshot_failure_releases_the_export(self):
+        raw = mock.Mock()
+        image_service = mock.Mock()
+        image_service.show.return_value = {'name': 'snap'}
+        image_service.update.side_effect = RuntimeError('glance down')
+        instance = {'uuid': 'fake_uuid', 'name': 'fake_name',
+                    'project_id': 'fake', 'ramdisk_id': None,
+                    'os_type': None}
+        with contextlib.nested(
+            mock.patch.object(self.connection, '_get_container_id',
+                              return_value='fake_id'),
+            mock.patch.object(glance, 'get_remote_image_service',
+                              return_value=(image_service, 'fake_image')),
+            mock.patch.object(self.mock_client, 'commit', create=True),
+            mock.patch.object(self.mock_client, 'get_image',
+                              return_value=raw)
+        ):
+            self.assertRaises(exception.NovaException,
+                              self.connection.snapshot, self.context,
+                              instance, 'fake_image', mock.Mock())
+        raw.close.assert_called_once_with()
+        raw.release_conn.assert_called_once_with()
+
     def test_get_image_name(self):
         instance_ref = utils.get_test_instance()
         image_info = utils.get_test_image_info(None, instance_ref)
@@ -348,3 +623,33 @@ class DockerDriverTestCase(_VirtDriverTestCase, test.TestCase):
                         return_value=(result, None)):
             uptime = self.connection.get_host_uptime(None)
             self.assertEqual(result, uptime)
+
+    def test_precopy_migration_stops_before_final_commit(self):
+        self.flags(migration_precopy=True, group='docker')
+        driver = novadocker.virt.docker.driver.DockerDriver(None)
+        calls = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(driver, '_find_container_by_name',
+                              return_value={'Id': 'ct_id',
+                                            'Image': 'base_id'}),
+            mock.patch.object(driver, 'power_off', calls.power_off),
+            mock.patch.object(self.mock_client, 'commit', calls.commit,
+                              create=True),
+            mock.patch.object(migration, 'remote_layers',
+                              calls.remote_layers),
+            mock.patch.object(migration, 'stream_image', calls.stream_image),
+        ):
+            driver._stream_migration({'name': 'inst'}, 'ct_id', 'dest',
+                                     0, 0)
+        layers = calls.remote_layers.return_value
+        self.assertEqual([
+            mock.call.remote_layers('dest'),
+            mock.call.stream_image(self.mock_client, 'base_id', 'dest',
+                                   skip_layers=layers),
+            mock.call.power_off({'name': 'inst'}, 0, 0),
+            mock.call.commit(container='ct_id', repository='inst',
+                             tag='latest'),
+            mock.call.remote_layers('dest'),
+            mock.call.stream_image(self.mock_client, 'inst', 'dest',
+                                   skip_layers=layers),
+        ], calls.mock_calls)
@@ -13,31 +13,88 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
 import posix
 
 import mock
 
+from nova.openstack.common import processutils
 from nova import test
+from novadocker.virt.docker import hostfacts
 from novadocker.virt.docker import hostinfo
+from novadocker.virt.docker import storage
 
 
 class HostInfoTestCase(test.NoDBTestCase):
 
     def setUp(self):
         super(HostInfoTestCase, self).setUp()
-        self.stubs.Set(hostinfo, 'statvfs', self.statvfs)
+        self.stubs.Set(storage, 'statvfs', self.statvfs)
+        self.stubs.Set(storage, '_probe', None)
+        hostfacts.reset()
+        self.addCleanup(hostfacts.reset)
 
-    def statvfs(self):
+    def statvfs(self, path):
         seq = (4096, 4096, 10047582, 7332259, 6820195,
                2564096, 2271310, 2271310, 1024, 255)
         return posix.statvfs_result(sequence=seq)
 
     def test_get_disk_usage(self):
+        self.flags(docker_storage_type='overlayfs', group='docker')
         disk_usage = hostinfo.get_disk_usage()
         self.assertEqual(disk_usage['total'], 41154895872)
         self.assertEqual(disk_usage['available'], 27935518720)
         self.assertEqual(disk_usage['used'], 11121963008)
 
+    @mock.patch('nova.utils.execute')
+    def test_get_disk_usage_device_mapper(self, execute):
+        self.flags(docker_storage_type='device_mapper',
+                   thinpool_name='docker-253:0-1234-pool', group='docker')
+        execute.side_effect = [
+            ('0 209715200 thin-pool 1 179/524288 1024/1638400 - rw '
+             'discard_passdown queue_if_no_space\n', ''),
+            ('0 209715200 thin-pool 253:1 253:2 128 32768 1 '
+             'skip_block_zeroing\n', '')]
+        disk_usage = hostinfo.get_disk_usage()
+        block = 128 * 512
+        self.assertEqual(1638400 * block, disk_usage['total'])
+        self.assertEqual(1024 * block, disk_usage['used'])
+        # The usage is cached, dmsetup is not run again.
+        hostinfo.get_disk_usage()
+        self.assertEqual(2, execute.call_count)
+
+    @mock.patch('nova.utils.execute',
+                return_value=('0 20971520 thin 2048 20971519\n', ''))
+    def test_get_container_disk_usage_device_mapper(self, execute):
+        self.flags(docker_storage_type='device_mapper',
+                   thinpool_name='docker-253:0-1234-pool', group='docker')
+        self.assertEqual(2048 * 512,
+                         hostinfo.get_container_disk_usage('abc'))
+        execute.assert_called_once_with('dmsetup', 'status',
+                                        'docker-253:0-1234-abc',
+                                        run_as_root=True)
+
+    @mock.patch('nova.utils.execute', return_value=('', ''))
+    def test_get_disk_usage_no_thin_pool(self, execute):
+        self.flags(docker_storage_type='device_mapper', thinpool_name='',
+                   group='docker')
+        self.assertEqual({'total': 0, 'used': 0, 'available': 0},
+                         hostinfo.get_disk_usage())
+        self.assertIsNone(hostinfo.get_container_disk_usage('abc'))
+
+    @mock.patch('nova.utils.execute')
+    def test_get_disk_usage_dmsetup_failure(self, execute):
+        self.flags(docker_storage_type='device_mapper',
+                   thinpool_name='docker-253:0-1234-pool', group='docker')
+        execute.side_effect = processutils.ProcessExecutionError(
+            exit_code=1, cmd='dmsetup')
+        self.assertEqual({'total': 0, 'used': 0, 'available': 0},
+                         hostinfo.get_disk_usage())
+        self.assertIsNone(hostinfo.get_container_disk_usage('abc'))
+        # A failed read is not cached.
+        hostinfo.get_disk_usage()
+        self.assertEqual(3, execute.call_count)
+
     def test_get_memory_usage(self):
         meminfo_str = """MemTotal:        1018784 kB
 MemFree:         220060 kB
@@ -73,3 +130,36 @@ Inactive:         50616 kB
             'clone_children 0 0']
         path = hostinfo.get_cgroup_devices_path()
         self.assertEqual('/cgroup/devices', path)
+
+    def test_get_memory_usage_reuses_file(self):
+        meminfo_str = """MemTotal:        1018784 kB
+MemFree:         220060 kB
+Buffers:           21640 kB
+Cached:           63364 kB
+"""
+        with mock.patch('__builtin__.open',
+                        mock.mock_open(read_data=meminfo_str),
+                        create=True) as m:
+            hostinfo.get_memory_usage()
+            usage = hostinfo.get_memory_usage()
+            m.assert_called_once_with('/proc/meminfo')
+            self.assertEqual(2, m.return_value.seek.call_count)
+            self.assertEqual(usage['used'], 730849280)
+
+    def test_get_cpu_info_cached(self):
+        cpuinfo_str = """processor	: 0
+model name	: Fake CPU
+processor	: 1
+model name	: Fake CPU
+"""
+        with contextlib.nested(
+            mock.patch('__builtin__.open',
+                       mock.mock_open(read_data=cpuinfo_str), create=True),
+            mock.patch('novadocker.virt.docker.cpu_topology.HostTopology.'
+                       'from_sysfs', return_value=None)
+        ) as (m, from_sysfs):
+            self.assertEqual(2, hostinfo.get_cpu_info())
+            self.assertEqual(2, hostinfo.get_cpu_info())
+            self.assertEqual(1, m.call_count)
+            self.assertEqual('Fake CPU',
+                             hostfacts.static_facts()['model_name'])
@@ -0,0 +1,142 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+from nova import test
+from novadocker.virt.docker import host_monitor
+from novadocker.virt.docker import hostparsers
+
+
+def fixture(name):
+    path = os.path.join(os.path.dirname(__file__), 'fixtures', name)
+    with open(path) as f:
+        return f.read()
+
+
+class HostParsersTestCase(test.NoDBTestCase):
+
+    def test_parse_dmidecode(self):
+        records = hostparsers.parse_dmidecode(fixture('dmidecode_hp.txt'))
+        self.assertEqual([0, 3, 4, 4, 16, 17, 17, 17, 17],
+                         [record.type for record in records])
+        bios = records[0]
+        self.assertEqual('0x0000', bios.handle)
+        self.assertEqual('BIOS Information', bios.name)
+        self.assertEqual('P89', bios.properties['Version'])
+        self.assertEqual(['PCI is supported', 'PNP is supported',
+                          'BIOS is upgradeable'],
+                         bios.properties['Characteristics'])
+        self.assertEqual('2.55', bios.properties['Firmware Revision'])
+        self.assertEqual(
+            'Intel(R) Xeon(R) CPU E5-2630 v3 @ 2.40GHz',
+            hostparsers.dmi_value(records, 4, 'Version'))
+        self.assertEqual('', hostparsers.dmi_value(records, 4, 'Missing'))
+
+    def test_parse_lscpu_by_key(self):
+        for name, cpus, mhz in (('lscpu_el6.txt', 32, 2400.0),
+                                ('lscpu_el7.txt', 48, 2199.902)):
+            cpu = hostparsers.parse_lscpu(fixture(name))
+            self.assertEqual('x86_64', cpu.architecture)
+            self.assertEqual('GenuineIntel', cpu.vendor)
+            self.assertEqual(cpus, cpu.cpus)
+            self.assertEqual(2, cpu.sockets)
+            self.assertEqual(2, cpu.threads_per_core)
+            self.assertEqual(2, cpu.numa_nodes)
+            self.assertEqual(mhz, cpu.mhz)
+            self.assertEqual('VT-x', cpu.virtualization)
+
+    def test_parse_storcli_drives(self):
+        drives = hostparsers.parse_storcli_drives(fixture('storcli.txt'))
+        self.assertEqual(['252:0', '252:1', '252:2', '252:3', '252:4'],
+                         [drive.slot for drive in drives])
+        self.assertEqual(['Onln', 'Onln', 'Onln', 'UGood', 'Offln'],
+                         [drive.state for drive in drives])
+        self.assertEqual('3.637 TB', drives[3].size)
+        self.assertEqual('SATA', drives[2].interface)
+        self.assertEqual('SSD', drives[2].medium)
+        self.assertEqual('INTEL SSDSC2BB480G7', drives[2].model)
+        self.assertEqual('D', drives[3].columns['Sp'])
+        self.assertEqual('-', drives[3].columns['DG'])
+
+    def test_parse_storcli_no_drives(self):
+        self.assertEqual([], hostparsers.parse_storcli_drives(
+            'Controller = 0\nStatus = Failure\n'))
+
+    def test_parse_hpssacli_drives(self):
+        drives = hostparsers.parse_hpssacli_drives(fixture('hpssacli.txt'))
+        self.assertEqual(4, len(drives))
+        self.assertEqual(hostparsers.HpDrive('1I:1:3', '1I', '1', '3',
+                                             '1.2 TB', 'Predictive Failure'),
+                         drives[2])
+
+    def test_parse_ipmi_sensors(self):
+        sensors = hostparsers.parse_ipmi_sensors(fixture('ipmitool_hp.txt'))
+        self.assertEqual(115.0, sensors['Power Supply 1'].value)
+        self.assertEqual('Watts', sensors['Power Supply 1'].unit)
+        self.assertEqual('ok', sensors['Power Supply 1'].status)
+        self.assertIsNone(sensors['Sys. Health LED'].value)
+
+
+class HostMonitorParseTestCase(test.NoDBTestCase):
+
+    def test_cpu_info_ignores_lscpu_line_order(self):
+        dmi = hostparsers.parse_dmidecode(fixture('dmidecode_inspur.txt'))
+        cpu_info = host_monitor.parse_cpu_info(fixture('lscpu_el7.txt'), dmi)
+        self.assertEqual({'arch': 'x86_64',
+                          'vendor': 'GenuineIntel',
+                          'cpus': '48',
+                          'socket': '2',
+                          'core_per_socket': '12',
+                          'thread_per_core': '2',
+                          'numa_nodes': '2',
+                          'cpu_mhz': '2199.902',
+                          'virtualization': 'VT-x',
+                          'version': 'Intel(R) Xeon(R) CPU E5-2650 v4 @ '
+                                     '2.20GHz'},
+                         cpu_info)
+
+    def test_hp_host(self):
+        dmi = hostparsers.parse_dmidecode(fixture('dmidecode_hp.txt'))
+        self.assertEqual('HP', host_monitor.chassis_vendor(dmi))
+        self.assertEqual({'vendor': 'HP', 'version': 'P89',
+                          'runtime_size': '64', 'rom_size': '8192'},
+                         host_monitor.parse_bios_info(dmi))
+        mem_info = host_monitor.parse_mem_info(dmi)
+        self.assertEqual('4', mem_info['total_slots'])
+        self.assertEqual('2', mem_info['unused_slots'])
+        chassis = host_monitor.parse_chassis_info(
+            dmi, fixture('ipmitool_hp.txt'))
+        self.assertEqual('115', chassis['power1'])
+        self.assertEqual('125', chassis['power2'])
+        self.assertEqual('240.0', chassis['total_power'])
+        self.assertEqual('Safe', chassis['power_supply_state'])
+        disks = host_monitor.parse_disk_info('HP', fixture('hpssacli.txt'))
+        self.assertEqual('4', disks['num'])
+        self.assertEqual(['300', '300', '1.2', '1.2'], disks['disk_size'])
+        self.assertEqual('Failed', disks['disk_state'][3])
+
+    def test_inspur_host(self):
+        dmi = hostparsers.parse_dmidecode(fixture('dmidecode_inspur.txt'))
+        self.assertEqual('Inspur', host_monitor.chassis_vendor(dmi))
+        chassis = host_monitor.parse_chassis_info(
+            dmi, fixture('ipmitool_inspur.txt'))
+        self.assertEqual('308.000', chassis['total_power'])
+        disks = host_monitor.parse_disk_info('Inspur', fixture('storcli.txt'))
+        self.assertEqual('5', disks['num'])
+        self.assertEqual(['558.406', '558.406', '446.625', '3.637',
+                          '446.625'], disks['disk_size'])
+        self.assertEqual(['SAS', 'SAS', 'SATA', 'SATA', 'SATA'],
+                         disks['disk_type'])
@@ -0,0 +1,121 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+import mock
+from oslo.utils import units
+
+from nova import test
+from novadocker.virt.docker import imagecache
+from novadocker.virt.docker import metrics
+
+
+def _image(image_id, parent, size, tags=None, created=0):
+    return {'Id': image_id, 'ParentId': parent, 'Size': size,
+            'RepoTags': tags or ['<none>:<none>'], 'Created': created}
+
+
+# base (1G) <- app1 (1G) and base <- app2 (2G), plus a separate old image.
+IMAGES = [
+    _image('base', '', units.Gi),
+    _image('app1', 'base', units.Gi, ['app1:latest'], created=30),
+    _image('app2', 'base', 2 * units.Gi, ['app2:latest'], created=20),
+    _image('old', '', units.Gi, ['old:v1'], created=10),
+]
+
+
+class ImageCacheTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.state_file = os.path.join(
+            self.useFixture(fixtures.TempDir()).path, 'cache.json')
+        self.flags(image_cache_state_file=self.state_file, group='docker')
+        metrics.reset()
+        self.docker = mock.Mock()
+        self.docker.images.return_value = IMAGES
+        self.docker.containers.return_value = []
+        self.pull = mock.Mock()
+        self.cache = imagecache.ImageCacheManager(lambda: self.docker,
+                                                  self.pull)
+
+    def test_layer_graph(self):
+        graph = imagecache.LayerGraph(IMAGES)
+        self.assertEqual(['app2', 'base'], graph.chain('app2'))
+        self.assertEqual('app1', graph.resolve('app1'))
+        self.assertEqual('old', graph.resolve('old:v1'))
+        self.assertIsNone(graph.resolve('missing'))
+        self.assertEqual(5 * units.Gi, graph.total_size())
+
+    def test_no_eviction_without_budget(self):
+        self.assertEqual([], self.cache.evict())
+        self.assertFalse(self.docker.images.called)
+
+    def test_evicts_least_recently_used_first(self):
+        self.flags(image_cache_max_gb=4, group='docker')
+        self.assertEqual(['old'], self.cache.evict())
+        self.docker.remove_image.assert_called_once_with('old:v1')
+
+    def test_shared_layers_are_not_counted_as_freed(self):
+        self.flags(image_cache_max_gb=2, group='docker')
+        self.cache.record_lookup({'name': 'old:v1', 'id': 'g-old'}, True)
+        # app2 frees 2G, app1 alone only 1G as base is still used by
+        # app2 when app1 goes first.
+        self.assertEqual(['app2', 'app1'], self.cache.evict())
+        self.docker.remove_image.assert_has_calls(
+            [mock.call('app2:latest'), mock.call('app1:latest')])
+        self.assertEqual({'value': 2},
+                         metrics.snapshot()['image_cache_evictions'])
+
+    def test_images_in_use_are_kept(self):
+        self.flags(image_cache_max_gb=1, group='docker')
+        self.docker.containers.return_value = [{'Image': 'app1'},
+                                               {'Image': 'old:v1'}]
+        self.assertEqual(['app2'], self.cache.evict())
+
+    def test_record_lookup(self):
+        self.cache.record_lookup({'name': 'app1', 'id': 'g-app1'}, True)
+        self.cache.record_lookup({'name': 'app2', 'id': 'g-app2'}, False)
+        self.cache.record_lookup({'name': 'app2', 'id': 'g-app2'}, True)
+        stats = metrics.snapshot()
+        self.assertEqual(2, stats['image_cache_hits']['value'])
+        self.assertEqual(1, stats['image_cache_misses']['value'])
+        reloaded = imagecache.ImageCacheManager(lambda: self.docker,
+                                                self.pull)
+        self.assertEqual(['app1:latest', 'app2:latest'],
+                         sorted(reloaded.state))
+
+    def test_wanted_ids(self):
+        self.flags(image_prefetch=['g-pinned'], image_prefetch_history=1,
+                   group='docker')
+        self.cache.record_lookup({'name': 'app1', 'id': 'g-app1'}, True)
+        self.cache.record_lookup({'name': 'app2', 'id': 'g-app2'}, True)
+        self.assertEqual(['g-pinned', 'g-app2'], self.cache._wanted_ids())
+
+    @mock.patch('nova.image.glance.get_default_image_service')
+    def test_prefetch_loads_missing_images(self, get_service):
+        self.flags(image_prefetch=['g-app1', 'g-app3'], group='docker')
+        get_service.return_value.show.side_effect = lambda ctx, image_id: {
+            'id': image_id, 'name': image_id[2:], 'container_format': 'docker'}
+        self.docker.inspect_image.side_effect = (
+            lambda name: {'Id': name} if name == 'app1' else None)
+        context = mock.Mock(user_id='user', project_id='project')
+        self.assertEqual(['g-app3'], self.cache.prefetch(context))
+        self.pull.assert_called_once_with(
+            context, {'id': 'g-app3', 'name': 'app3',
+                      'container_format': 'docker'},
+            {'user_id': 'user', 'project_id': 'project'})
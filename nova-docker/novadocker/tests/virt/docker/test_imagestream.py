@@ -0,0 +1,111 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import StringIO
+import zlib
+
+from nova import test
+from novadocker.virt.docker import imagestream
+
+CHUNKS = ['a' * 10, 'b' * 10, 'c' * 5]
+CHECKSUM = hashlib.md5(''.join(CHUNKS)).hexdigest()
+
+
+class VerifiedStreamTestCase(test.NoDBTestCase):
+
+    def test_stream_with_checksum(self):
+        stream = imagestream.verified_stream(iter(CHUNKS), checksum=CHECKSUM)
+        self.assertEqual(CHUNKS, list(stream))
+
+    def test_stream_without_checksum(self):
+        self.assertEqual(CHUNKS, list(imagestream.verified_stream(CHUNKS)))
+
+    def test_mismatch_withholds_last_chunk(self):
+        received = []
+        stream = imagestream.verified_stream(iter(CHUNKS), image_id='img',
+                                             checksum='0' * 32)
+
+        def consume():
+            for chunk in stream:
+                received.append(chunk)
+
+        self.assertRaises(imagestream.ChecksumMismatch, consume)
+        self.assertEqual(CHUNKS[:-1], received)
+
+    def test_source_failure_propagates(self):
+        def chunks():
+            yield 'a'
+            raise IOError('glance went away')
+
+        stream = imagestream.verified_stream(chunks())
+        self.assertRaises(IOError, list, stream)
+
+    def test_read_ahead_is_bounded(self):
+        read = []
+
+        def chunks():
+            for i in range(100):
+                read.append(i)
+                yield str(i)
+
+        stream = imagestream.verified_stream(chunks(), max_chunks=4)
+        next(stream)
+        # One chunk is held back, at most four wait in the queue and one
+        # more is blocked on the full queue.
+        self.assertTrue(len(read) <= 7, read)
+        stream.close()
+
+
+class UploadStreamTestCase(test.NoDBTestCase):
+
+    DATA = ''.join(chr(i % 7 + 65) for i in range(100000))
+
+    def _read_all(self, stream, size=4096):
+        out = []
+        while True:
+            data = stream.read(size)
+            if not data:
+                return ''.join(out)
+            out.append(data)
+
+    def test_plain(self):
+        stream = imagestream.UploadStream(StringIO.StringIO(self.DATA),
+                                          chunk_size=1000)
+        self.assertIsNone(stream.tell())
+        stream.seek(0, 2)
+        data = self._read_all(stream)
+        self.assertEqual(self.DATA, data)
+        self.assertEqual(hashlib.md5(self.DATA).hexdigest(), stream.checksum)
+        self.assertEqual(len(self.DATA), stream.bytes_read)
+        self.assertEqual(len(self.DATA), stream.bytes_sent)
+
+    def test_compressed(self):
+        stream = imagestream.UploadStream(StringIO.StringIO(self.DATA),
+                                          chunk_size=1000, compress=True)
+        data = self._read_all(stream)
+        self.assertEqual(self.DATA,
+                         zlib.decompress(data, 16 + zlib.MAX_WBITS))
+        self.assertEqual(hashlib.md5(data).hexdigest(), stream.checksum)
+        self.assertTrue(stream.bytes_sent < stream.bytes_read)
+
+    def test_progress(self):
+        reports = []
+        stream = imagestream.UploadStream(
+            StringIO.StringIO(self.DATA), chunk_size=1000,
+            progress=lambda *args: reports.append(args), progress_interval=0)
+        self._read_all(stream, size=50000)
+        self.assertEqual([False, False, True], [r[3] for r in reports])
+        self.assertEqual((len(self.DATA), len(self.DATA)), reports[-1][:2])
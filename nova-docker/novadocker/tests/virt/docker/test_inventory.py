@@ -0,0 +1,149 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from nova.openstack.common import processutils
+from nova import test
+from novadocker.virt.docker import host_monitor
+from novadocker.virt.docker import inventory
+
+DMIDECODE = """# dmidecode 2.12
+SMBIOS 2.8 present.
+
+Handle 0x0000, DMI type 0, 24 bytes
+BIOS Information
+\tVendor: HP
+\tVersion: P89
+\tRuntime Size: 64 kB
+\tROM Size: 8192 kB
+
+Handle 0x0300, DMI type 3, 21 bytes
+Chassis Information
+\tManufacturer: HP
+\tBoot-up State: Safe
+\tPower Supply State: Safe
+\tThermal State: Safe
+
+Handle 0x0400, DMI type 4, 42 bytes
+Processor Information
+\tVersion: Intel(R) Xeon(R) CPU E5-2630 v3 @ 2.40GHz
+
+Handle 0x1100, DMI type 17, 40 bytes
+Memory Device
+\tRank: 2
+
+Handle 0x1101, DMI type 17, 40 bytes
+Memory Device
+\tRank: Unknown
+"""
+
+LSCPU = """Architecture:          x86_64
+CPU op-mode(s):        32-bit, 64-bit
+Byte Order:            Little Endian
+CPU(s):                32
+On-line CPU(s) list:   0-31
+Thread(s) per core:    2
+Core(s) per socket:    8
+Socket(s):             2
+NUMA node(s):          2
+Vendor ID:             GenuineIntel
+CPU family:            6
+Model:                 63
+Stepping:              2
+CPU MHz:               2400.000
+BogoMIPS:              4800.00
+Virtualization:        VT-x
+"""
+
+HPSSACLI = """
+   physicaldrive 1I:1:1 (port 1I:box 1:bay 1, 300 GB): OK
+   physicaldrive 1I:1:2 (port 1I:box 1:bay 2, 300 GB): Failed
+"""
+
+SENSORS = """Power Supply 1   | 120        | Watts
+Power Supply 2   | 130        | Watts
+"""
+
+
+class HostInventoryTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(HostInventoryTestCase, self).setUp()
+        self.commands = []
+        self.outputs = {'dmidecode': DMIDECODE, 'lscpu': LSCPU,
+                        'hpssacli': HPSSACLI, 'ipmitool': SENSORS}
+        self.inventory = inventory.HostInventory()
+        self.stubs.Set(host_monitor, 'execute', self._execute)
+        self.stubs.Set(host_monitor, 'get_software_info',
+                       lambda: {'kernel_version': '3.10.0'})
+        self.time = 1000.0
+        patcher = mock.patch('time.time', side_effect=lambda: self.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _execute(self, *cmd, **kwargs):
+        self.commands.append(cmd[0])
+        out = self.outputs[cmd[0]]
+        if isinstance(out, Exception):
+            raise out
+        return out, ''
+
+    def test_collect(self):
+        info = self.inventory.collect()
+        self.assertEqual('HP', info['bios_info']['vendor'])
+        self.assertEqual('8192', info['bios_info']['rom_size'])
+        self.assertEqual('Intel(R) Xeon(R) CPU E5-2630 v3 @ 2.40GHz',
+                         info['cpu_info']['version'])
+        self.assertEqual('32', info['cpu_info']['cpus'])
+        self.assertEqual('2', info['mem_info']['total_slots'])
+        self.assertEqual('1', info['mem_info']['unused_slots'])
+        self.assertEqual(['1I:1:1', '1I:1:2'], info['disk_info']['disk_map'])
+        self.assertEqual(['OK', 'Failed'], info['disk_info']['disk_state'])
+        self.assertEqual('250.0', info['chassis_info']['total_power'])
+        self.assertEqual('Safe', info['chassis_info']['thermal_state'])
+        self.assertEqual({'kernel_version': '3.10.0'}, info['soft_info'])
+        self.assertEqual(['dmidecode', 'hpssacli', 'ipmitool', 'lscpu'],
+                         sorted(self.commands))
+
+    def test_static_facts_are_cached(self):
+        self.inventory.collect()
+        del self.commands[:]
+        self.time += 10
+        self.inventory.collect()
+        self.assertEqual([], self.commands)
+
+    def test_power_and_disks_refresh_on_their_ttl(self):
+        self.flags(inventory_power_ttl=60, inventory_disk_ttl=300,
+                   group='docker')
+        self.inventory.collect()
+        del self.commands[:]
+        self.time += 61
+        self.inventory.collect()
+        self.assertEqual(['ipmitool'], self.commands)
+        del self.commands[:]
+        self.time += 240
+        self.inventory.collect()
+        self.assertEqual(['hpssacli', 'ipmitool'], sorted(self.commands))
+
+    def test_failed_collection_is_retried(self):
+        self.outputs['lscpu'] = processutils.ProcessExecutionError()
+        info = self.inventory.collect()
+        self.assertEqual({}, info['cpu_info'])
+        self.outputs['lscpu'] = LSCPU
+        del self.commands[:]
+        info = self.inventory.collect()
+        self.assertEqual(['lscpu'], self.commands)
+        self.assertEqual('x86_64', info['cpu_info']['arch'])
@@ -0,0 +1,159 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import StringIO
+import tarfile
+import zlib
+
+import mock
+
+from nova.openstack.common import processutils
+from nova import test
+from nova import utils
+from novadocker.virt.docker import migration
+
+
+def _save_tarball(layers):
+    """A 'docker save' style tarball of the given layer ids."""
+    buf = StringIO.StringIO()
+    tar = tarfile.open(fileobj=buf, mode='w')
+    for layer in layers:
+        info = tarfile.TarInfo(layer)
+        info.type = tarfile.DIRTYPE
+        tar.addfile(info)
+        for name, data in (('json', '{"id": "%s"}' % layer),
+                           ('layer.tar', layer * 100)):
+            info = tarfile.TarInfo('%s/%s' % (layer, name))
+            info.size = len(data)
+            tar.addfile(info, StringIO.StringIO(data))
+    info = tarfile.TarInfo('repositories')
+    info.size = 2
+    tar.addfile(info, StringIO.StringIO('{}'))
+    tar.close()
+    return buf.getvalue()
+
+
+class LayerFilterTestCase(test.NoDBTestCase):
+
+    def test_filter_layers(self):
+        source = StringIO.StringIO(_save_tarball(['base', 'mid', 'top']))
+        target = StringIO.StringIO()
+        skipped = migration.filter_layers(source, target,
+                                          set(['base', 'mid', 'other']))
+        self.assertEqual(set(['base', 'mid']), skipped)
+        tar = tarfile.open(fileobj=StringIO.StringIO(target.getvalue()))
+        self.assertEqual(['top', 'top/json', 'top/layer.tar',
+                          'repositories'], tar.getnames())
+        self.assertEqual('top' * 100,
+                         tar.extractfile('top/layer.tar').read())
+
+    @mock.patch.object(utils, 'execute',
+                       return_value=('aaa\nbbb\n\n', ''))
+    def test_remote_layers(self, execute):
+        self.assertEqual(set(['aaa', 'bbb']),
+                         migration.remote_layers('dest-host'))
+        execute.assert_called_once_with(
+            'ssh', '-o', 'BatchMode=yes', 'dest-host',
+            'docker images -a -q --no-trunc')
+
+    @mock.patch.object(utils, 'execute',
+                       side_effect=processutils.ProcessExecutionError)
+    def test_remote_layers_unknown(self, execute):
+        self.assertEqual(set(), migration.remote_layers('dest-host'))
+
+
+class StreamImageTestCase(test.NoDBTestCase):
+
+    DATA = 'layer' * 10000
+
+    def setUp(self):
+        super(StreamImageTestCase, self).setUp()
+        self.docker = mock.Mock()
+        self.docker.get_image.side_effect = (
+            lambda name: StringIO.StringIO(self.DATA))
+        self.sent = []
+        self.proc = mock.Mock()
+        self.proc.stdin.write.side_effect = self.sent.append
+        self.proc.stdout.read.return_value = ''
+        self.proc.stderr.read.return_value = ''
+        self.proc.wait.return_value = 0
+        patcher = mock.patch.object(migration.subprocess, 'Popen',
+                                    return_value=self.proc)
+        self.popen = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stream_compressed(self):
+        self.flags(migration_chunk_size=4096, group='docker')
+        sent = migration.stream_image(self.docker, 'inst-1', 'dest-host')
+        self.popen.assert_called_once_with(
+            ['ssh', '-o', 'BatchMode=yes', 'dest-host', 'docker load'],
+            stdin=mock.ANY, stdout=mock.ANY, stderr=mock.ANY)
+        self.docker.get_image.assert_called_once_with('inst-1')
+        data = ''.join(self.sent)
+        self.assertEqual(len(data), sent)
+        self.assertEqual(self.DATA,
+                         zlib.decompress(data, 16 + zlib.MAX_WBITS))
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in self.sent))
+        self.proc.stdin.close.assert_called_once_with()
+
+    def test_stream_uncompressed(self):
+        self.flags(migration_compression=False, group='docker')
+        migration.stream_image(self.docker, 'inst-1', 'dest-host')
+        self.assertEqual(self.DATA, ''.join(self.sent))
+
+    def test_remote_load_failure(self):
+        self.proc.wait.return_value = 1
+        self.proc.stderr.read.return_value = 'no space left'
+        self.assertRaises(processutils.ProcessExecutionError,
+                          migration.stream_image, self.docker, 'inst-1',
+                          'dest-host')
+
+    def test_broken_pipe_kills_ssh(self):
+        self.proc.stdin.write.side_effect = IOError('broken pipe')
+        self.proc.poll.return_value = None
+        self.assertRaises(IOError, migration.stream_image, self.docker,
+                          'inst-1', 'dest-host')
+        self.proc.kill.assert_called_once_with()
+
+    def test_failure_releases_the_image_stream(self):
+        source = mock.Mock()
+        source.read.side_effect = IOError('connection reset')
+        self.docker.get_image.side_effect = None
+        self.docker.get_image.return_value = source
+        self.proc.poll.return_value = None
+        self.assertRaises(IOError, migration.stream_image, self.docker,
+                          'inst-1', 'dest-host')
+        source.close.assert_called_once_with()
+        source.release_conn.assert_called_once_with()
+
+    def test_output_read_while_writing(self):
+        self.flags(migration_compression=False,
+                   migration_chunk_size=4096, group='docker')
+        reads = []
+        self.proc.stdout.read.side_effect = (
+            lambda: reads.append(len(self.sent)) or 'Loaded image')
+        migration.stream_image(self.docker, 'inst-1', 'dest-host')
+        # The output was drained before the whole image was written.
+        self.assertLess(reads[0], len(self.sent))
+
+    def test_stream_only_missing_layers(self):
+        self.DATA = _save_tarball(['base', 'top'])
+        sent = migration.stream_image(self.docker, 'inst-1', 'dest-host',
+                                      skip_layers=set(['base']))
+        data = zlib.decompress(''.join(self.sent), 16 + zlib.MAX_WBITS)
+        tar = tarfile.open(fileobj=StringIO.StringIO(data))
+        self.assertEqual(['top', 'top/json', 'top/layer.tar',
+                          'repositories'], tar.getnames())
+        self.assertEqual(len(''.join(self.sent)), sent)
@@ -0,0 +1,89 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import fixtures
+import mock
+
+from nova import test
+from nova import utils
+from novadocker.virt.docker import netns
+
+# Far above any pid_max, so never alive.
+DEAD_PID = 2 ** 30
+
+
+class NetnsRegistryTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(NetnsRegistryTestCase, self).setUp()
+        self.root = self.useFixture(fixtures.TempDir()).path
+        self.registry = netns.NetnsRegistry(self.root)
+
+    def _link(self, name, target):
+        os.symlink(target, os.path.join(self.root, name))
+
+    def test_scan_existing_links(self):
+        self._link('ct1', '/proc/%d/ns/net' % os.getpid())
+        self._link('ct2', '/proc/%d/ns/net' % DEAD_PID)
+        open(os.path.join(self.root, 'named'), 'w').close()
+        self.assertEqual({'ct1': os.getpid(), 'ct2': DEAD_PID,
+                          'named': None}, self.registry.entries)
+
+    @mock.patch.object(utils, 'execute')
+    def test_link_and_unlink_without_processes(self, execute):
+        self.registry.link('ct1', 1234)
+        path = os.path.join(self.root, 'ct1')
+        self.assertEqual('/proc/1234/ns/net', os.readlink(path))
+        self.registry.link('ct1', 4321)
+        self.assertEqual('/proc/4321/ns/net', os.readlink(path))
+        self.assertTrue(self.registry.exists('ct1'))
+
+        self.assertTrue(self.registry.unlink('ct1'))
+        self.assertFalse(os.path.lexists(path))
+        self.assertFalse(self.registry.unlink('ct1'))
+        self.assertFalse(execute.called)
+        self.assertEqual([], os.listdir(self.root))
+
+    @mock.patch.object(utils, 'execute')
+    def test_link_falls_back_to_rootwrap(self, execute):
+        self.stubs.Set(self.registry, '_writable', lambda: False)
+        self.registry.link('ct1', 1234)
+        execute.assert_called_once_with(
+            'ln', '-sf', '/proc/1234/ns/net',
+            os.path.join(self.root, 'ct1'), run_as_root=True)
+        self.assertEqual(1234, self.registry.entries['ct1'])
+
+    @mock.patch.object(utils, 'execute')
+    def test_sweep_removes_dead_links(self, execute):
+        self._link('alive', '/proc/%d/ns/net' % os.getpid())
+        self._link('dead', '/proc/%d/ns/net' % DEAD_PID)
+        open(os.path.join(self.root, 'named'), 'w').close()
+        self.assertEqual(['dead'], self.registry.sweep())
+        self.assertEqual(['alive', 'named'], sorted(os.listdir(self.root)))
+        self.assertFalse(self.registry.exists('dead'))
+        self.assertFalse(execute.called)
+
+    @mock.patch.object(utils, 'execute')
+    def test_sweep_batches_rootwrap_deletes(self, execute):
+        self._link('dead1', '/proc/%d/ns/net' % DEAD_PID)
+        self._link('dead2', '/proc/%d/ns/net' % (DEAD_PID + 1))
+        self.stubs.Set(self.registry, '_writable', lambda: False)
+        self.assertEqual(['dead1', 'dead2'], self.registry.sweep())
+        execute.assert_called_once_with(
+            'ip', '-batch', '-',
+            process_input='netns delete dead1\nnetns delete dead2\n',
+            run_as_root=True)
@@ -22,25 +22,34 @@ from nova import utils
 from nova.tests import utils as test_utils
 
 from nova.openstack.common import processutils
+from novadocker.virt.docker import netns
 from novadocker.virt.docker import network
 
 import mock
 
 
 class NetworkTestCase(test.NoDBTestCase):
+    def _registry(self, names):
+        registry = netns.NetnsRegistry()
+        registry._entries = dict((name, None) for name in names)
+        self.stubs.Set(registry, '_writable', lambda: False)
+        self.stubs.Set(netns, 'get_registry', lambda: registry)
+        return registry
+
     @mock.patch.object(utils, 'execute')
     def test_teardown_delete_network(self, utils_mock):
         id = "second-id"
-        utils_mock.return_value = ("first-id\nsecond-id\nthird-id\n", None)
+        registry = self._registry(["first-id", "second-id", "third-id"])
         network.teardown_network(id)
         utils_mock.assert_called_with('ip', 'netns', 'delete', id,
                                       run_as_root=True)
+        self.assertFalse(registry.exists(id))
 
     @mock.patch.object(utils, 'execute')
     def test_teardown_network_not_in_list(self, utils_mock):
-        utils_mock.return_value = ("first-id\nsecond-id\nthird-id\n", None)
+        self._registry(["first-id", "second-id", "third-id"])
         network.teardown_network("not-in-list")
-        utils_mock.assert_called_with('ip', '-o', 'netns', 'list')
+        self.assertFalse(utils_mock.called)
 
     @mock.patch.object(network, 'LOG')
     @mock.patch.object(utils, 'execute',
@@ -48,11 +57,24 @@ class NetworkTestCase(test.NoDBTestCase):
     def test_teardown_network_fails(self, utils_mock, log_mock):
         # Call fails but method should not fail.
         # Error will be caught and logged.
-        utils_mock.return_value = ("first-id\nsecond-id\nthird-id\n", None)
+        self._registry(["first-id", "second-id", "third-id"])
         id = "third-id"
         network.teardown_network(id)
         log_mock.warning.assert_called_with(mock.ANY, id)
 
+    @mock.patch.object(utils, 'execute', return_value=(
+        '1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue\\    '
+        'link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00\n'
+        '7: eth0@if8: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500\n'
+        '9: eth2@if10: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500\n', ''))
+    def test_next_ifname(self, utils_mock):
+        self.assertEqual('eth1', network.next_ifname('fake_id'))
+        utils_mock.assert_called_once_with('ip', 'netns', 'exec', 'fake_id',
+                                           'ip', '-o', 'link', 'show',
+                                           run_as_root=True)
+        self.assertEqual(set(['lo', 'eth0', 'eth2']),
+                         network.list_interfaces('fake_id'))
+
     def test_find_gateway(self):
         instance = {'uuid': uuid.uuid4()}
         network_info = test_utils.get_test_network_info()
@@ -0,0 +1,63 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from eventlet import event
+
+from nova import test
+from novadocker.virt.docker import metrics
+from novadocker.virt.docker import pipeline
+
+
+class PipelineTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(PipelineTestCase, self).setUp()
+        metrics.reset()
+        self.stages = pipeline.Pipeline('test')
+
+    def test_stages_overlap(self):
+        ready = event.Event()
+        order = []
+
+        def slow():
+            ready.wait()
+            order.append('slow')
+            return 'image'
+
+        def fast():
+            order.append('fast')
+            ready.send()
+
+        self.stages.start('slow', slow)
+        self.stages.start('fast', fast)
+        self.assertEqual('image', self.stages.wait('slow'))
+        self.assertEqual(['fast', 'slow'], order)
+        self.assertEqual(['fast', 'slow'],
+                         [stage for stage, _ in self.stages.timings])
+        self.assertEqual(1, metrics.snapshot()['test_slow_time']['count'])
+
+    def test_failures(self):
+        def fail():
+            raise RuntimeError('boom')
+
+        self.stages.start('fail', fail)
+        self.assertEqual(3, self.stages.run('add', lambda a, b: a + b, 1, 2))
+        self.assertRaises(RuntimeError, self.stages.wait, 'fail')
+        self.stages.wait_all()
+        self.assertFalse(self.stages.succeeded('fail'))
+        self.assertTrue(self.stages.succeeded('add'))
+        self.assertIn('fail ', self.stages.summary())
+        self.stages.finish()
+        self.assertEqual(1, metrics.snapshot()['test_time']['count'])
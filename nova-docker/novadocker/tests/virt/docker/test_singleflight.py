@@ -0,0 +1,70 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+from eventlet import event
+
+from nova import test
+from novadocker.virt.docker import metrics
+from novadocker.virt.docker import singleflight
+
+
+class SingleFlightTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(SingleFlightTestCase, self).setUp()
+        metrics.reset()
+        self.flight = singleflight.SingleFlight('pull')
+        self.release = event.Event()
+        self.calls = []
+
+    def _pull(self, key):
+        self.calls.append(key)
+        result = self.release.wait()
+        if isinstance(result, Exception):
+            raise result
+        return '%s-%s' % (key, result)
+
+    def _start(self, count, key='img'):
+        threads = [eventlet.spawn(self.flight.do, key, self._pull, key)
+                   for _i in range(count)]
+        # Let every greenthread reach the flight before releasing it.
+        eventlet.sleep(0)
+        return threads
+
+    def test_concurrent_calls_coalesced(self):
+        threads = self._start(5)
+        other = self._start(1, key='other')
+        self.assertEqual(4, self.flight.waiters('img'))
+        self.release.send('loaded')
+        self.assertEqual(['img-loaded'] * 5, [t.wait() for t in threads])
+        self.assertEqual('other-loaded', other[0].wait())
+        self.assertEqual(['img', 'other'], self.calls)
+        stats = metrics.snapshot()
+        self.assertEqual(2, stats['pull_calls']['value'])
+        self.assertEqual(4, stats['pull_coalesced']['value'])
+        self.assertEqual(0, self.flight.waiters('img'))
+
+    def test_failure_shared_then_retried(self):
+        threads = self._start(3)
+        self.release.send(IOError('glance down'))
+        for thread in threads:
+            self.assertRaises(IOError, thread.wait)
+
+        self.release = event.Event()
+        self.release.send('loaded')
+        self.assertEqual('img-loaded', self.flight.do('img', self._pull,
+                                                      'img'))
+        self.assertEqual(['img', 'img'], self.calls)
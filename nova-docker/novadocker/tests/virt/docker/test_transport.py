@@ -0,0 +1,63 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import test
+import novadocker.virt.docker.client as docker_client
+from novadocker.virt.docker import transport
+
+
+class TransportTestCase(test.NoDBTestCase):
+
+    def test_pool_stats(self):
+        stats = transport.PoolStats()
+        stats.on_create()
+        stats.on_acquire(0.5)
+        stats.on_release()
+        stats.on_acquire(0.1)
+        stats.on_acquire(0)
+        res = stats.as_dict(idle=1)
+        self.assertEqual(2, res['in_use'])
+        self.assertEqual(1, res['idle'])
+        self.assertEqual(3, res['acquired'])
+        self.assertEqual(0.5, res['max_wait_time'])
+        self.assertAlmostEqual(2.0 / 3, res['reuse_rate'])
+
+    def test_make_unix_pool(self):
+        pool = transport.make_pool('unix://var/run/docker.sock', 60, 4)
+        self.assertIsInstance(pool, transport.UnixHTTPConnectionPool)
+        self.assertEqual('/var/run/docker.sock', pool.socket_path)
+        self.assertEqual(0, pool.idle())
+
+    def test_make_tcp_pool(self):
+        pool = transport.make_pool('tcp://10.0.0.1:4243', 60, 4)
+        self.assertIsInstance(pool, transport.HTTPConnectionPool)
+        self.assertEqual(('10.0.0.1', 4243), (pool.host, pool.port))
+
+    def test_exhausted_pool_times_out(self):
+        pool = transport.make_pool('tcp://10.0.0.1:4243', 60, 1,
+                                   pool_timeout=0.01)
+        pool._get_conn()
+        self.assertRaises(transport.urllib3.exceptions.EmptyPoolError,
+                          pool._get_conn)
+        self.assertEqual(1, pool.stats.as_dict(pool.idle())['exhausted'])
+
+    def test_get_client_is_shared(self):
+        first = docker_client.get_client('unix:///var/run/docker.sock',
+                                         '1.17', 60)
+        second = docker_client.get_client('unix:///var/run/docker.sock',
+                                          '1.17', 60)
+        self.assertIs(first, second)
+        self.assertIn('unix:///var/run/docker.sock',
+                      docker_client.get_pool_stats())
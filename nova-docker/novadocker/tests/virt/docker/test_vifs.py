@@ -13,11 +13,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
+import fixtures
 import mock
 
 from nova.network import model as network_model
 from nova import test
 import novadocker.virt.docker
+from novadocker.virt.docker import netns
+from novadocker.virt.docker import network
 
 
 class DockerGenericVIFDriverTestCase(test.TestCase):
@@ -171,6 +176,85 @@ class DockerGenericVIFDriverTestCase(test.TestCase):
                                 'uuid': 'instance_uuid'}, network_info)
             ex.assert_has_calls(calls)
 
+    @mock.patch('nova.network.linux_net.create_ovs_vif_port')
+    @mock.patch('novadocker.virt.docker.links.dump_links',
+                return_value=set(['lo', 'eth0']))
+    def test_plug_ovs_hybird_batch(self, dump_links, create_port):
+        self.flags(lock_path=self.useFixture(fixtures.TempDir()).path)
+        vif = {'network': {'bridge': 'br-int'},
+               'address': '00:11:22:33:44:55',
+               'id': '920be2f4-2b98-411e-890a-69bcabb2a5a0',
+               'type': network_model.VIF_TYPE_OVS}
+        with mock.patch('nova.utils.execute') as ex:
+            driver = novadocker.virt.docker.vifs.DockerGenericVIFDriver()
+            driver.plug_ovs_hybird({'name': 'fake_instance',
+                                    'uuid': 'instance_uuid'}, vif)
+        script = ex.call_args_list[0][1]['process_input'].splitlines()
+        self.assertEqual(
+            ['link add name qbr920be2f4-2b type bridge',
+             'link add name qvb920be2f4-2b type veth '
+             'peer name qvo920be2f4-2b',
+             'link set qvb920be2f4-2b up',
+             'link set qvb920be2f4-2b promisc on',
+             'link set qvo920be2f4-2b up',
+             'link set qvo920be2f4-2b promisc on',
+             'link set qbr920be2f4-2b up',
+             'link set qvb920be2f4-2b master qbr920be2f4-2b',
+             'link add name tap920be2f4-2b type veth '
+             'peer name ns920be2f4-2b',
+             'link set tap920be2f4-2b up',
+             'link set ns920be2f4-2b up',
+             'link set tap920be2f4-2b master qbr920be2f4-2b'], script)
+        self.assertEqual(2, ex.call_count)
+        self.assertEqual('tee', ex.call_args_list[1][0][0])
+        create_port.assert_called_once_with(
+            'br-int', 'qvo920be2f4-2b', vif['id'], vif['address'],
+            'instance_uuid')
+
+    @mock.patch('nova.network.linux_net.create_ovs_vif_port')
+    @mock.patch('novadocker.virt.docker.links.dump_links')
+    def test_plug_ovs_hybird_existing_links(self, dump_links, create_port):
+        self.flags(lock_path=self.useFixture(fixtures.TempDir()).path)
+        dump_links.return_value = set(['qbr920be2f4-2b', 'qvb920be2f4-2b',
+                                       'qvo920be2f4-2b', 'tap920be2f4-2b',
+                                       'ns920be2f4-2b'])
+        vif = {'network': {'bridge': 'br-int'},
+               'address': '00:11:22:33:44:55',
+               'id': '920be2f4-2b98-411e-890a-69bcabb2a5a0',
+               'type': network_model.VIF_TYPE_OVS}
+        with mock.patch('nova.utils.execute') as ex:
+            driver = novadocker.virt.docker.vifs.DockerGenericVIFDriver()
+            driver.plug_ovs_hybird({'name': 'fake_instance',
+                                    'uuid': 'instance_uuid'}, vif)
+        self.assertFalse(ex.called)
+        self.assertFalse(create_port.called)
+
+    @mock.patch('nova.openstack.common.lockutils.lock')
+    @mock.patch('novadocker.virt.docker.links.dump_links')
+    def test_plug_ovs_hybird_locks_each_vif(self, dump_links, lock):
+        dump_links.side_effect = lambda: set(['qbr920be2f4-2b',
+                                              'qvo920be2f4-2b',
+                                              'tap920be2f4-2b',
+                                              'ns920be2f4-2b',
+                                              'qbr5b8a61c3-77',
+                                              'qvo5b8a61c3-77',
+                                              'tap5b8a61c3-77',
+                                              'ns5b8a61c3-77'])
+        driver = novadocker.virt.docker.vifs.DockerGenericVIFDriver()
+        for vif_id in ('920be2f4-2b98-411e-890a-69bcabb2a5a0',
+                       '5b8a61c3-7731-4c05-9c1e-2a5f5c1d8b4e'):
+            driver.plug_ovs_hybird({'name': 'fake_instance',
+                                    'uuid': 'instance_uuid'},
+                                   {'network': {'bridge': 'br-int'},
+                                    'id': vif_id,
+                                    'type': network_model.VIF_TYPE_OVS})
+        self.assertEqual(
+            [mock.call('docker-vif-links-920be2f4-2b',
+                       lock_file_prefix='nova-', external=True),
+             mock.call('docker-vif-links-5b8a61c3-77',
+                       lock_file_prefix='nova-', external=True)],
+            lock.call_args_list)
+
     @mock.patch.object(novadocker.virt.docker.driver.DockerDriver,
                        '_find_container_by_name',
                        return_value={'id': 'fake_id'})
@@ -183,73 +267,53 @@ class DockerGenericVIFDriverTestCase(test.TestCase):
                       '/var/run/netns/fake_id', run_as_root=True),
             mock.call('ip', 'link', 'set', 'ns920be2f4-2b', 'netns',
                       'fake_id', run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id', 'ip', 'link',
-                      'set', 'ns920be2f4-2b', 'address', '00:11:22:33:44:55',
+            mock.call('ip', 'netns', 'exec', 'fake_id', 'ip', '-batch', '-',
+                      process_input=(
+                          'link set lo up\n'
+                          'link set ns920be2f4-2b name eth0\n'
+                          'link set eth0 address 00:11:22:33:44:55\n'
+                          'addr add 10.11.12.3/24 brd + dev eth0\n'
+                          'link set eth0 up\n'
+                          'route replace default via 10.11.12.1 dev eth0\n'
+                          'route replace 169.254.169.254/32 via 10.11.12.2\n'),
                       run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id',
-                      'ifconfig', 'ns920be2f4-2b', '10.11.12.3/24',
-                      run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id', 'ip', 'route',
-                      'replace', 'default', 'via', '10.11.12.1', 'dev',
-                      'ns920be2f4-2b', run_as_root=True)
         ]
         network_info = [
             {'network': {'bridge': 'br100',
                          'subnets': [{'gateway': {'address': '10.11.12.1'},
                                       'cidr': '10.11.12.0/24',
                                       'ips': [{'address': '10.11.12.3',
-                                               'type': 'fixed', 'version': 4}]
+                                               'type': 'fixed', 'version': 4}],
+                                      'meta': {'dhcp_server': '10.11.12.2'}
                                       }]},
              'address': '00:11:22:33:44:55',
              'id': '920be2f4-2b98-411e-890a-69bcabb2a5a0',
              'type': network_model.VIF_TYPE_BRIDGE}]
-        with mock.patch('nova.utils.execute') as ex:
+        registry = netns.NetnsRegistry()
+        with contextlib.nested(
+            mock.patch('nova.utils.execute'),
+            mock.patch.object(netns, 'get_registry', return_value=registry),
+            mock.patch.object(registry, '_writable', return_value=False),
+            mock.patch('os.path.isdir', return_value=True),
+        ) as (ex, _get_registry, _writable, _isdir):
             driver = novadocker.virt.docker.driver.DockerDriver(object)
             driver._attach_vifs({'name': 'fake_instance'}, network_info)
             ex.assert_has_calls(calls)
+        self.assertEqual(1234, registry.entries['fake_id'])
 
     @mock.patch.object(novadocker.virt.docker.driver.DockerDriver,
-                       '_find_container_by_name',
-                       return_value={'id': 'fake_id'})
+                       '_get_container_id', return_value='fake_id')
     @mock.patch.object(novadocker.virt.docker.driver.DockerDriver,
-                       '_find_container_pid',
-                       return_value=1234)
-    def test_attach_vifs_two_interfaces(self, mock_find_by_name,
-                                        mock_find_pid):
-        calls = [
-            mock.call('ln', '-sf', '/proc/1234/ns/net',
-                      '/var/run/netns/fake_id', run_as_root=True),
-            # interface 1
-            mock.call('ip', 'link', 'set', 'ns920be2f4-2b', 'netns', 'fake_id',
-                      run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id', 'ip', 'link',
-                      'set', 'ns920be2f4-2b', 'address', '00:11:22:33:44:55',
-                      run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id',
-                      'ifconfig', 'ns920be2f4-2b', '10.11.12.3/24',
-                      run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id', 'ip', 'route',
-                      'replace', 'default', 'via', '10.11.12.1', 'dev',
-                      'ns920be2f4-2b', run_as_root=True),
-            # interface 2
-            mock.call('ip', 'link', 'set', 'ns920be2f4-2b', 'netns', 'fake_id',
-                      run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id', 'ip', 'link',
-                      'set', 'ns920be2f4-2b', 'address', '00:11:22:33:44:66',
-                      run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id',
-                      'ifconfig', 'ns920be2f4-2b', '10.13.12.3/24',
-                      run_as_root=True),
-            mock.call('ip', 'netns', 'exec', 'fake_id', 'ip', 'route',
-                      'replace', 'default', 'via', '10.13.12.1', 'dev',
-                      'ns920be2f4-2b', run_as_root=True)
-        ]
+                       '_find_container_pid', return_value=1234)
+    def test_attach_vifs_two_interfaces(self, mock_find_pid,
+                                        mock_get_container_id):
         network_info = [
             {'network': {'bridge': 'br100',
                          'subnets': [{'gateway': {'address': '10.11.12.1'},
                                       'cidr': '10.11.12.0/24',
                                       'ips': [{'address': '10.11.12.3',
                                                'type': 'fixed', 'version': 4}],
+                                      'meta': {'dhcp_server': '10.11.12.2'}
                                       }]},
              'address': '00:11:22:33:44:55',
              'type': network_model.VIF_TYPE_BRIDGE,
@@ -258,12 +322,169 @@ class DockerGenericVIFDriverTestCase(test.TestCase):
                          'subnets': [{'gateway': {'address': '10.13.12.1'},
                                       'cidr': '10.13.12.0/24',
                                       'ips': [{'address': '10.13.12.3',
-                                               'type': 'fixed', 'version': 4}]
+                                               'type': 'fixed', 'version': 4}],
+                                      'meta': {}
                                       }]},
              'address': '00:11:22:33:44:66',
              'type': network_model.VIF_TYPE_BRIDGE,
-             'id': '920be2f4-2b98-411e-890a-69bcabb2a5a0'}]
-        with mock.patch('nova.utils.execute') as ex:
+             'id': '5b8a61c3-7731-4c05-9c1e-2a5f5c1d8b4e'}]
+        registry = netns.NetnsRegistry()
+        with contextlib.nested(
+            mock.patch('nova.utils.execute'),
+            mock.patch('nova.utils.spawn_n'),
+            mock.patch.object(netns, 'get_registry', return_value=registry),
+            mock.patch.object(registry, '_writable', return_value=False),
+            mock.patch('os.path.isdir', return_value=True),
+        ) as (ex, _spawn_n, _get_registry, _writable, _isdir):
             driver = novadocker.virt.docker.driver.DockerDriver(object)
             driver._attach_vifs({'name': 'fake_instance'}, network_info)
-            ex.assert_has_calls(calls)
+        # interface 1
+        ex.assert_any_call('ip', 'link', 'set', 'ns920be2f4-2b', 'netns',
+                           'fake_id', run_as_root=True)
+        ex.assert_any_call(
+            'ip', 'netns', 'exec', 'fake_id', 'ip', '-batch', '-',
+            process_input=('link set lo up\n'
+                           'link set ns920be2f4-2b name eth0\n'
+                           'link set eth0 address 00:11:22:33:44:55\n'
+                           'addr add 10.11.12.3/24 brd + dev eth0\n'
+                           'link set eth0 up\n'
+                           'route replace default via 10.11.12.1 dev eth0\n'
+                           'route replace 169.254.169.254/32 via '
+                           '10.11.12.2\n'),
+            run_as_root=True)
+        # interface 2
+        ex.assert_any_call('ip', 'link', 'set', 'ns5b8a61c3-77', 'netns',
+                           'fake_id', run_as_root=True)
+        ex.assert_any_call(
+            'ip', 'netns', 'exec', 'fake_id', 'ip', '-batch', '-',
+            process_input=('link set ns5b8a61c3-77 name eth1\n'
+                           'link set eth1 address 00:11:22:33:44:66\n'
+                           'addr add 10.13.12.3/24 brd + dev eth1\n'
+                           'link set eth1 up\n'),
+            run_as_root=True)
+        # One namespace link, then one move and one batch per interface.
+        self.assertEqual(5, ex.call_count)
+
+    @mock.patch('nova.utils.spawn_n')
+    @mock.patch('nova.utils.execute')
+    def test_attach_sec_interface(self, ex, spawn_n):
+        vif = {'network': {'bridge': 'br100',
+                           'subnets': [{'gateway': {'address': '10.13.12.1'},
+                                        'cidr': '10.13.12.0/24',
+                                        'ips': [{'address': '10.13.12.3',
+                                                 'type': 'fixed',
+                                                 'version': 4}],
+                                        'meta': {}
+                                        }]},
+               'address': '00:11:22:33:44:66',
+               'type': network_model.VIF_TYPE_BRIDGE,
+               'id': '920be2f4-2b98-411e-890a-69bcabb2a5a0'}
+        driver = novadocker.virt.docker.vifs.DockerGenericVIFDriver()
+        driver.attach({'name': 'fake_instance'}, vif, 'fake_id', sec_if=True)
+        ex.assert_called_with(
+            'ip', 'netns', 'exec', 'fake_id', 'ip', '-batch', '-',
+            process_input=('link set ns920be2f4-2b name eth1\n'
+                           'link set eth1 address 00:11:22:33:44:66\n'
+                           'addr add 10.13.12.3/24 brd + dev eth1\n'
+                           'link set eth1 up\n'),
+            run_as_root=True)
+        spawn_n.assert_called_once_with(mock.ANY, 'fake_id', 'eth1',
+                                        '10.13.12.3')
+
+    def _vif(self, vif_id, address, ip, gateway):
+        return {'network': {'bridge': 'br100',
+                            'subnets': [{'gateway': {'address': gateway},
+                                         'cidr': ip.rsplit('.', 1)[0] +
+                                         '.0/24',
+                                         'ips': [{'address': ip,
+                                                  'type': 'fixed',
+                                                  'version': 4}],
+                                         'meta': {}}]},
+                'address': address,
+                'type': network_model.VIF_TYPE_BRIDGE,
+                'id': vif_id}
+
+    @mock.patch('nova.utils.spawn_n')
+    @mock.patch('nova.utils.execute')
+    def test_attach_vifs_named_by_position(self, ex, spawn_n):
+        network_info = [
+            self._vif('11111111-aaaa', '00:11:22:33:44:01', '10.1.0.3',
+                      '10.1.0.1'),
+            self._vif('22222222-bbbb', '00:11:22:33:44:02', '10.2.0.3',
+                      '10.2.0.1'),
+            self._vif('33333333-cccc', '00:11:22:33:44:03', '10.3.0.3',
+                      '10.3.0.1'),
+        ]
+        driver = novadocker.virt.docker.driver.DockerDriver(object)
+        with contextlib.nested(
+            mock.patch.object(driver, '_get_container_id',
+                              return_value='fake_id'),
+            mock.patch.object(driver, '_find_container_pid',
+                              return_value=1234),
+            mock.patch.object(netns, 'get_registry'),
+        ):
+            driver._attach_vifs({'name': 'fake_instance'}, network_info)
+        batches = [c[1]['process_input'] for c in ex.call_args_list
+                   if 'process_input' in c[1]]
+        self.assertEqual(3, len(batches))
+        for index, vif in enumerate(network_info):
+            ifname = 'eth%d' % index
+            batch = [b for b in batches
+                     if 'ns%s name %s\n' % (vif['id'][:11], ifname) in b]
+            self.assertEqual(1, len(batch))
+            self.assertEqual(index == 0, 'route replace default' in batch[0])
+
+    @mock.patch('nova.utils.spawn_n')
+    @mock.patch('nova.utils.execute')
+    def test_setup_network_rolls_back_every_vif(self, ex, spawn_n):
+        network_info = [
+            self._vif('11111111-aaaa', '00:11:22:33:44:01', '10.1.0.3',
+                      '10.1.0.1'),
+            self._vif('22222222-bbbb', '00:11:22:33:44:02', '10.2.0.3',
+                      '10.2.0.1'),
+        ]
+        driver = novadocker.virt.docker.driver.DockerDriver(object)
+        vif_driver = mock.Mock()
+        vif_driver.attach.side_effect = [None, RuntimeError('boom')]
+        driver.vif_driver = vif_driver
+        with contextlib.nested(
+            mock.patch.object(driver, '_get_container_id',
+                              return_value='fake_id'),
+            mock.patch.object(driver, '_find_container_pid',
+                              return_value=1234),
+            mock.patch.object(netns, 'get_registry'),
+        ):
+            self.assertRaises(RuntimeError, driver._setup_network,
+                              {'name': 'fake_instance'}, network_info)
+        self.assertEqual(2, vif_driver.plug.call_count)
+        vif_driver.unplug.assert_has_calls(
+            [mock.call({'name': 'fake_instance'}, vif)
+             for vif in network_info])
+
+    @mock.patch('nova.utils.spawn_n')
+    @mock.patch('nova.utils.execute')
+    def test_attach_failure_is_raised(self, ex, spawn_n):
+        ex.side_effect = RuntimeError('boom')
+        vif = self._vif('11111111-aaaa', '00:11:22:33:44:01', '10.1.0.3',
+                        '10.1.0.1')
+        driver = novadocker.virt.docker.vifs.DockerGenericVIFDriver()
+        self.assertRaises(RuntimeError, driver.attach,
+                          {'name': 'fake_instance'}, vif, 'fake_id')
+        self.assertFalse(spawn_n.called)
+
+    def test_attach_interface_takes_next_free_name(self):
+        vif = self._vif('44444444-dddd', '00:11:22:33:44:04', '10.4.0.3',
+                        '10.4.0.1')
+        driver = novadocker.virt.docker.driver.DockerDriver(object)
+        instance = {'name': 'fake_instance'}
+        with contextlib.nested(
+            mock.patch.object(driver.vif_driver, 'plug'),
+            mock.patch.object(driver.vif_driver, 'attach'),
+            mock.patch.object(driver, '_get_container_id',
+                              return_value='fake_id'),
+            mock.patch.object(network, 'next_ifname', return_value='eth2')
+        ) as (plug, attach, get_id, next_ifname):
+            driver.attach_interface(instance, None, vif)
+        next_ifname.assert_called_once_with('fake_id')
+        attach.assert_called_once_with(instance, vif, 'fake_id',
+                                       sec_if=True, ifname='eth2')
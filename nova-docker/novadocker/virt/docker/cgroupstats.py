@@ -0,0 +1,208 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Resource usage of the containers, read from their cgroups.
+
+Docker does not expose these counters through its API in the versions
+the driver supports, but every container has a cgroup per controller
+under <controller>/docker/<container id>. One pass lists each controller
+directory once and reads the counters of all the wanted containers from
+it; network counters come from /proc/<pid>/net/dev, which shows the
+interfaces of the namespace the process is in.
+"""
+
+import collections
+import errno
+import os
+
+from oslo.config import cfg
+
+CONF = cfg.CONF
+
+cgroupstats_opts = [
+    cfg.StrOpt('cgroup_stats_path',
+               default='/sys/fs/cgroup/%(controller)s/docker',
+               help='cgroup directory holding the group of each container '
+                    'for a controller, used to read the resource usage '
+                    'of the containers.'),
+]
+
+CONF.register_opts(cgroupstats_opts, 'docker')
+
+ContainerStats = collections.namedtuple(
+    'ContainerStats', ['cpu_time', 'memory_usage', 'memory_limit',
+                       'memory_stat', 'blkio', 'net'])
+
+BlkioStats = collections.namedtuple(
+    'BlkioStats', ['read_bytes', 'write_bytes', 'read_ops', 'write_ops'])
+
+NetStats = collections.namedtuple(
+    'NetStats', ['rx_bytes', 'rx_packets', 'rx_errors', 'rx_drop',
+                 'tx_bytes', 'tx_packets', 'tx_errors', 'tx_drop'])
+
+# Fields of a /proc/net/dev line, after the interface name.
+_NET_DEV_FIELDS = {'rx_bytes': 0, 'rx_packets': 1, 'rx_errors': 2,
+                   'rx_drop': 3, 'tx_bytes': 8, 'tx_packets': 9,
+                   'tx_errors': 10, 'tx_drop': 11}
+
+
+def memory_rss(stats):
+    """Resident memory of a container in bytes, its usage if unknown."""
+    stat = stats.memory_stat
+    for key in ('total_rss', 'rss'):
+        if key in stat:
+            return stat[key] + stat.get(key + '_huge', 0)
+    return stats.memory_usage
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def _int(text):
+    try:
+        return int(text.strip())
+    except (AttributeError, ValueError):
+        return 0
+
+
+def parse_memory_stat(text):
+    stat = {}
+    for line in (text or '').splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            stat[parts[0]] = int(parts[1])
+    return stat
+
+
+def parse_blkio(service_bytes, serviced):
+    """Per device counters from blkio.throttle.io_service_bytes/serviced.
+
+    :returns: dict 'major:minor' -> BlkioStats
+    """
+    counters = {}
+    for text, unit in ((service_bytes, 'bytes'), (serviced, 'ops')):
+        for line in (text or '').splitlines():
+            parts = line.split()
+            if len(parts) != 3 or parts[1] not in ('Read', 'Write'):
+                continue
+            device = counters.setdefault(parts[0], {})
+            key = '%s_%s' % (parts[1].lower(), unit)
+            device[key] = device.get(key, 0) + _int(parts[2])
+    return dict((device, BlkioStats(values.get('read_bytes', 0),
+                                    values.get('write_bytes', 0),
+                                    values.get('read_ops', 0),
+                                    values.get('write_ops', 0)))
+                for device, values in counters.items())
+
+
+def parse_net_dev(text):
+    """Per interface counters of a /proc/net/dev, loopback left out.
+
+    :returns: dict interface name -> NetStats
+    """
+    interfaces = {}
+    for line in (text or '').splitlines():
+        name, sep, values = line.partition(':')
+        name = name.strip()
+        if not sep or name == 'lo' or '|' in values:
+            continue
+        fields = values.split()
+        if len(fields) < 16:
+            continue
+        interfaces[name] = NetStats(**dict(
+            (key, int(fields[index]))
+            for key, index in _NET_DEV_FIELDS.items()))
+    return interfaces
+
+
+class CgroupStatsReader(object):
+    """Reads the resource usage of many containers in one pass."""
+
+    def __init__(self, path=None):
+        """:param path: cgroup_stats_path template, from the
+                     configuration by default
+        """
+        self._path = path
+
+    def _dir(self, controller):
+        path = self._path or CONF.docker.cgroup_stats_path
+        return path % {'controller': controller}
+
+    def _groups(self, controller):
+        root = self._dir(controller)
+        try:
+            return root, set(os.listdir(root))
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                raise
+            return root, set()
+
+    def read_all(self, pids, io=True):
+        """Read the counters of every container of pids.
+
+        :param pids: dict container id -> PID of its process, None for
+                     containers which are not running
+        :param io: whether to read the blkio and network counters too;
+                   without them only the cpuacct and memory groups are
+                   read and blkio and net are left empty
+        :returns: dict container id -> ContainerStats, for the containers
+                  which have cgroups
+        """
+        cpuacct_root, cpuacct = self._groups('cpuacct')
+        memory_root, memory = self._groups('memory')
+        blkio_root, blkio = self._groups('blkio') if io else (None, set())
+
+        stats = {}
+        for container_id, pid in pids.items():
+            if not (container_id in cpuacct or container_id in memory):
+                continue
+            cpu_time = 0
+            if container_id in cpuacct:
+                cpu_time = _int(_read(os.path.join(
+                    cpuacct_root, container_id, 'cpuacct.usage')))
+            memory_usage = memory_limit = 0
+            memory_stat = {}
+            if container_id in memory:
+                group = os.path.join(memory_root, container_id)
+                memory_usage = _int(_read(os.path.join(
+                    group, 'memory.usage_in_bytes')))
+                memory_limit = _int(_read(os.path.join(
+                    group, 'memory.limit_in_bytes')))
+                memory_stat = parse_memory_stat(_read(os.path.join(
+                    group, 'memory.stat')))
+            devices = {}
+            if container_id in blkio:
+                group = os.path.join(blkio_root, container_id)
+                devices = parse_blkio(
+                    _read(os.path.join(group,
+                                       'blkio.throttle.io_service_bytes')),
+                    _read(os.path.join(group, 'blkio.throttle.io_serviced')))
+            net = {}
+            if pid and io:
+                net = parse_net_dev(_read('/proc/%s/net/dev' % pid))
+            stats[container_id] = ContainerStats(cpu_time, memory_usage,
+                                                 memory_limit, memory_stat,
+                                                 devices, net)
+        return stats
+
+    def read(self, container_id, pid=None, io=True):
+        """ContainerStats of one container, None if it has no cgroup."""
+        return self.read_all({container_id: pid}, io=io).get(container_id)
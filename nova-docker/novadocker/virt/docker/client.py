@@ -14,41 +14,118 @@
 #    under the License.
 
 import functools
-import inspect
+import threading
+
 import six
 from nova.openstack.common import log as logging
 from oslo.config import cfg
+from oslo.serialization import jsonutils
 from docker import client
 from docker import tls
+from novadocker.virt.docker import transport
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+client_opts = [
+    cfg.IntOpt('api_pool_size',
+               default=10,
+               help='Maximum number of connections kept open to the Docker '
+                    'API endpoint. Callers wait for a free connection once '
+                    'all are in use; the event stream and image transfers '
+                    'each hold one for their whole duration.'),
+    cfg.IntOpt('api_pool_timeout',
+               default=30,
+               help='Seconds a Docker API call waits for a free connection '
+                    'when all api_pool_size are in use before it fails.'),
+]
+
+CONF.register_opts(client_opts, 'docker')
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class CaseInsensitiveDict(dict):
+    """dict whose string keys can also be looked up in lower case.
+
+    Different versions of Docker disagree on the case of some keys ("Id"
+    vs "id"), so callers may use either. The lower-cased index is only
+    built on the first lookup that misses; payloads read with their
+    original key case cost nothing over a plain dict.
+    """
+
+    def _lower_keys(self):
+        lower = self.__dict__.get('_lower')
+        if lower is None:
+            lower = dict((k.lower(), k) for k in self
+                         if isinstance(k, six.string_types))
+            self.__dict__['_lower'] = lower
+        return lower
+
+    def __missing__(self, key):
+        if isinstance(key, six.string_types):
+            real_key = self._lower_keys().get(key.lower())
+            if real_key is not None and real_key != key:
+                return dict.__getitem__(self, real_key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+        return (isinstance(key, six.string_types) and
+                key.lower() in self._lower_keys())
+
+    has_key = __contains__
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self.__dict__.pop('_lower', None)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.__dict__.pop('_lower', None)
+        dict.__delitem__(self, key)
+
+
+def _case_insensitive(obj):
+    if isinstance(obj, list):
+        return [_case_insensitive(o) for o in obj]
+    if isinstance(obj, dict) and not isinstance(obj, CaseInsensitiveDict):
+        return CaseInsensitiveDict((k, _case_insensitive(v))
+                                   for k, v in six.iteritems(obj))
+    return obj
+
 
 def filter_data(f):
-    """Decorator that post-processes data returned by Docker.
-     This will avoid any surprises with different versions of Docker.
+    """Decorator that makes data returned by f case-insensitive.
+
+    Only needed for data that does not come from the Docker API, such as
+    fakes in tests: DockerHTTPClient decodes its JSON responses straight
+    into CaseInsensitiveDict.
     """
     @functools.wraps(f, assigned=[])
     def wrapper(*args, **kwds):
-        out = f(*args, **kwds)
-
-        def _filter(obj):
-            if isinstance(obj, list):
-                new_list = []
-                for o in obj:
-                    new_list.append(_filter(o))
-                obj = new_list
-            if isinstance(obj, dict):
-                for k, v in obj.items():
-                    if isinstance(k, six.string_types):
-                        obj[k.lower()] = _filter(v)
-            return obj
-        return _filter(out)
+        return _case_insensitive(f(*args, **kwds))
     return wrapper
 
+
 class DockerHTTPClient(client.Client):
-    def __init__(self, url='unix://var/run/docker.sock',api_version="1.17", api_timeout=120):
+    """Docker API client.
+
+    JSON responses are decoded directly into CaseInsensitiveDict, so no
+    pass is made over the payload after decoding. Streaming calls such as
+    get_image, attach and events never decode JSON through _result and
+    return the raw response untouched.
+    """
+
+    def __init__(self, url='unix://var/run/docker.sock',api_version="1.17", api_timeout=120,
+                 pool_size=None):
         ssl_config = False
         #__init__(self, base_url=None, version=None, timeout=60, tls=False)
         super(DockerHTTPClient, self).__init__(
@@ -57,12 +134,29 @@ class DockerHTTPClient(client.Client):
             timeout=api_timeout,
             tls=ssl_config
         )
-        self._setup_decorators()
+        self.endpoint = url
+        self._pool = None
+        if pool_size:
+            # Replace the adapter docker-py mounted for this scheme with one
+            # backed by a bounded, instrumented pool.
+            self._pool = transport.make_pool(
+                url, api_timeout, pool_size,
+                pool_timeout=CONF.docker.api_pool_timeout)
+            scheme = self.base_url.split('://', 1)[0] + '://'
+            self.mount(scheme, transport.PooledAdapter(self._pool))
+
+    def pool_stats(self):
+        if self._pool is None:
+            return {}
+        return self._pool.stats.as_dict(self._pool.idle())
 
-    def _setup_decorators(self):
-        for name, member in inspect.getmembers(self, inspect.ismethod):
-            if not name.startswith('_'):
-                setattr(self, name, filter_data(member))
+    def _result(self, response, json=False, binary=False):
+        if not json:
+            return super(DockerHTTPClient, self)._result(response,
+                                                         binary=binary)
+        self._raise_for_status(response)
+        return jsonutils.loads(response.text,
+                               object_pairs_hook=CaseInsensitiveDict)
 
     def pause(self, container_id):
         url = self._url("/containers/{0}/pause".format(container_id))
@@ -81,3 +175,26 @@ class DockerHTTPClient(client.Client):
     def get_container_logs(self, container_id):
         return self.attach(container_id, 1, 1, 0, 1)
 
+
+def get_client(url, api_version, api_timeout):
+    """Return the process-wide client for a Docker endpoint.
+
+    Every caller in the process shares the client, and with it the
+    connection pool, of the endpoint.
+    """
+    key = (url, api_version, api_timeout)
+    with _clients_lock:
+        docker = _clients.get(key)
+        if docker is None:
+            docker = DockerHTTPClient(url, api_version=api_version,
+                                      api_timeout=api_timeout,
+                                      pool_size=CONF.docker.api_pool_size)
+            _clients[key] = docker
+    return docker
+
+
+def get_pool_stats():
+    """Return the connection pool statistics of every endpoint in use."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return dict((docker.endpoint, docker.pool_stats()) for docker in clients)
@@ -0,0 +1,188 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Ledger of the resources committed to the containers of the host.
+
+Every container the driver starts is recorded with the vCPUs of its
+flavor, its memory limit and the CPUs it is pinned to, and forgotten
+when it is removed, so the totals reported to the resource tracker cost
+nothing to compute. The ledger is reconciled against the inspected
+containers from time to time to pick up containers started or removed
+behind the driver's back, and to rebuild it after a restart: the
+containers of instances carry the instance UUID and the flavor vCPUs in
+their environment, which cpushare mode leaves no other trace of.
+"""
+
+import collections
+import re
+import threading
+import time
+
+from novadocker.virt.docker import cpuset_info
+
+Commitment = collections.namedtuple('Commitment',
+                                    ['container_id', 'vcpus', 'memory',
+                                     'cpus'])
+
+Totals = collections.namedtuple('Totals',
+                                ['containers', 'vcpus', 'memory',
+                                 'pinned_cpus'])
+
+# Containers holding the volumes of an instance, not instances themselves.
+VOLUME_SUFFIX = '_vol'
+
+# Environment variables marking the container of an instance.
+ENV_INSTANCE = 'NOVA_INSTANCE_UUID'
+ENV_VCPUS = 'NOVA_VCPUS'
+
+_DIRECTIVE = re.compile(r'%(\([^)]*\))?[-#0 +]*\d*[a-zA-Z]')
+
+
+def instance_env(instance, vcpus):
+    """Environment recording an instance and its vCPUs on its container."""
+    return {ENV_INSTANCE: instance['uuid'], ENV_VCPUS: str(vcpus)}
+
+
+def container_env(container):
+    env = {}
+    for item in (container.get('Config') or {}).get('Env') or ():
+        key, _sep, value = item.partition('=')
+        env[key] = value
+    return env
+
+
+def name_pattern(template):
+    """Regex matching the names instance_name_template gives instances.
+
+    Used to recognize the containers of instances created before they
+    were marked in their environment. None if the template has no fixed
+    text, as the pattern would match every container.
+    """
+    # split() also returns the group of each directive after its text.
+    literals = _DIRECTIVE.split(template)[::2]
+    if not ''.join(literals):
+        return None
+    return re.compile('^%s$' % '.+'.join(re.escape(literal)
+                                         for literal in literals))
+
+
+def from_container(container, previous=None, pinned=True):
+    """The Commitment of an inspected container.
+
+    The vCPUs are those recorded in the environment of the container, or
+    else those of the CPU shares (1024 per vCPU) or of the cpuset;
+    without any, the previously recorded value is kept, one vCPU
+    otherwise.
+
+    :param pinned: whether a cpuset pins the container to its CPUs, as
+                   in the cpuset and mix modes, rather than only keeping
+                   it off the system CPUs
+    """
+    config = container.get('Config') or {}
+    host_config = container.get('HostConfig') or {}
+    memory = config.get('Memory') or host_config.get('Memory') or 0
+    cpuset = config.get('Cpuset') or host_config.get('CpusetCpus') or ''
+    cpus = (tuple(cpuset_info.parse_cpuset(cpuset))
+            if cpuset and pinned else ())
+    shares = config.get('CpuShares') or host_config.get('CpuShares') or 0
+    vcpus = container_env(container).get(ENV_VCPUS, '')
+    if vcpus.isdigit():
+        vcpus = int(vcpus)
+    elif shares >= 1024:
+        vcpus = shares // 1024
+    elif previous is not None:
+        vcpus = previous.vcpus
+    elif cpus:
+        vcpus = len(cpus)
+    else:
+        vcpus = 1
+    return Commitment(container['Id'], vcpus, memory, cpus)
+
+
+class CommitmentLedger(object):
+    """vCPUs, memory and CPU pins committed to each container, by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.reconciled_at = 0
+
+    def record(self, name, container_id, vcpus, memory, cpus=()):
+        with self._lock:
+            self._entries[name] = Commitment(container_id, int(vcpus),
+                                             int(memory or 0),
+                                             tuple(cpus or ()))
+
+    def release(self, name):
+        with self._lock:
+            return self._entries.pop(name, None) is not None
+
+    def get(self, name):
+        with self._lock:
+            return self._entries.get(name)
+
+    def container_ids(self):
+        """dict name -> container id of every entry."""
+        with self._lock:
+            return dict((name, entry.container_id)
+                        for name, entry in self._entries.items())
+
+    def reconcile(self, containers, pinned=True, names=None):
+        """Replace the entries by those of the inspected containers.
+
+        Only the containers of instances count: those marked in their
+        environment and, if names is given, those whose name matches it.
+
+        :param containers: every container of the host, as inspected
+        :param pinned: see from_container
+        :param names: compiled name_pattern
+        :returns: (names added, names removed)
+        """
+        entries = {}
+        with self._lock:
+            previous = dict(self._entries)
+        for container in containers:
+            name = container['Name'].lstrip('/')
+            if name.endswith(VOLUME_SUFFIX):
+                continue
+            if (ENV_INSTANCE not in container_env(container) and
+                    not (names and names.match(name))):
+                continue
+            entries[name] = from_container(container, previous.get(name),
+                                           pinned)
+        with self._lock:
+            self._entries = entries
+            self.reconciled_at = time.time()
+        added = sorted(set(entries) - set(previous))
+        removed = sorted(set(previous) - set(entries))
+        return added, removed
+
+    def totals(self, usage=None):
+        """Sum of the commitments.
+
+        :param usage: dict name -> memory used, counted for the containers
+                      without a memory limit
+        """
+        usage = usage or {}
+        with self._lock:
+            entries = self._entries.items()
+        pinned = set()
+        vcpus = memory = 0
+        for name, entry in entries:
+            vcpus += entry.vcpus
+            memory += entry.memory or usage.get(name, 0)
+            pinned.update(entry.cpus)
+        return Totals(len(entries), vcpus, memory, len(pinned))
@@ -0,0 +1,326 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+In-process index of the containers known to the local Docker daemon.
+
+The index is seeded with a single ``containers(all=True)`` call and kept
+current by following the Docker ``/events`` stream, so name/id lookups and
+inspect results are served from memory instead of costing a list plus an
+inspect round trip every time. A full resync only happens when the event
+stream (re)connects. Until the watcher is connected the index simply
+passes lookups through to the Docker API.
+"""
+
+import threading
+import time
+
+from oslo.serialization import jsonutils
+
+from docker import errors
+from nova.i18n import _
+from nova.openstack.common import log
+from nova import utils
+
+LOG = log.getLogger(__name__)
+
+# Container events which change what inspect_container would return.
+_CONTAINER_EVENTS = ('create', 'start', 'restart', 'die', 'kill', 'stop',
+                     'pause', 'unpause', 'rename', 'oom', 'destroy')
+
+_RECONNECT_DELAY = 1
+_RECONNECT_DELAY_MAX = 30
+
+# Poll interval bounds of wait_for_pid when no event wakes it up first.
+_PID_POLL_MIN = 0.005
+_PID_POLL_MAX = 0.5
+
+_registered = None
+
+
+def register(index):
+    """Make index the one shared by ContainerUtils and the VIF drivers."""
+    global _registered
+    _registered = index
+
+
+def get_registered():
+    return _registered
+
+
+def container_ref(ref):
+    """Return the id of a container given either its id or a create result."""
+    # create_container returns a dict, everything else takes a plain id.
+    if isinstance(ref, dict):
+        return ref.get('Id') or ref.get('id')
+    return ref
+
+
+def _container_name(names):
+    if names:
+        return names[0][1:]
+
+
+class ContainerIndex(object):
+    """Name/id index of containers, kept in sync by Docker events."""
+
+    def __init__(self, get_client):
+        self._get_client = get_client
+        self._lock = threading.RLock()
+        self._by_name = {}
+        self._by_id = {}
+        self._info = {}
+        self._live = False
+        self._watching = False
+        self._listeners = []
+        self._waiters = {}
+
+    @property
+    def docker(self):
+        return self._get_client()
+
+    @property
+    def live(self):
+        """True while the event stream is connected and the index is seeded."""
+        return self._live
+
+    def start(self):
+        """Start following the Docker event stream in a greenthread."""
+        with self._lock:
+            if self._watching:
+                return
+            if not hasattr(self.docker, 'events'):
+                LOG.warning(_('Docker client has no events API, container '
+                              'lookups will not be cached.'))
+                return
+            self._watching = True
+        utils.spawn_n(self._watch)
+
+    def add_listener(self, callback):
+        """Call callback(name) whenever an event changes a container."""
+        self._listeners.append(callback)
+
+    def stop(self):
+        with self._lock:
+            self._watching = False
+            self._live = False
+
+    def resync(self):
+        """Rebuild the index from a single containers(all=True) call."""
+        containers = self.docker.containers(all=True)
+        with self._lock:
+            self._by_name = {}
+            self._by_id = {}
+            self._info = {}
+            for ct in containers:
+                name = _container_name(ct.get('Names'))
+                if not name:
+                    continue
+                self._by_id[ct['Id']] = name
+                self._by_name[name] = ct['Id']
+        LOG.debug('Container index resynced with %d containers',
+                  len(self._by_id))
+
+    def _watch(self):
+        delay = _RECONNECT_DELAY
+        while self._watching:
+            try:
+                stream = self.docker.events()
+                # Seed after subscribing so nothing between the list and
+                # the first event is lost.
+                self.resync()
+                self._live = True
+                delay = _RECONNECT_DELAY
+                for event in stream:
+                    if not self._watching:
+                        break
+                    self._handle_event(event)
+            except Exception as e:
+                LOG.warning(_('Docker event stream failed: %s'), e)
+            self._live = False
+            if self._watching:
+                time.sleep(delay)
+                delay = min(delay * 2, _RECONNECT_DELAY_MAX)
+
+    def _handle_event(self, event):
+        if not isinstance(event, dict):
+            event = jsonutils.loads(event)
+        status = event.get('status')
+        container_id = event.get('id')
+        if status not in _CONTAINER_EVENTS or not container_id:
+            return
+        with self._lock:
+            name = self._by_id.get(container_id)
+        if status == 'destroy':
+            self.forget(container_id)
+        elif status in ('create', 'rename') or not name:
+            # The name is only known after an inspect.
+            self.refresh(container_id)
+        else:
+            self.invalidate(container_id)
+        for callback in self._listeners:
+            callback(name or self._by_id.get(container_id))
+        self._wake(container_id)
+
+    def _wake(self, container_id):
+        with self._lock:
+            waiters = self._waiters.pop(container_id, ())
+        for waiter in waiters:
+            waiter.set()
+
+    def wait_for_pid(self, ref, timeout):
+        """Wait until the container has a PID and return it.
+
+        The container is inspected right away, which already succeeds for
+        nearly every start. Otherwise the next event of the container, or
+        a poll backing off from a few milliseconds, triggers a re-inspect.
+
+        :returns: the PID, or None if there is none after timeout seconds
+        """
+        container_id = container_ref(ref)
+        deadline = time.time() + timeout
+        delay = _PID_POLL_MIN
+        while True:
+            # Subscribe before inspecting so an event sent in between
+            # is not missed.
+            waiter = threading.Event()
+            with self._lock:
+                self._waiters.setdefault(container_id, []).append(waiter)
+            try:
+                info = self.docker.inspect_container(container_id)
+                pid = info['State']['Pid'] if info else None
+                # Pid is equal to zero if it isn't assigned yet
+                if pid:
+                    return pid
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                waiter.wait(min(delay, remaining))
+                delay = min(delay * 2, _PID_POLL_MAX)
+            finally:
+                with self._lock:
+                    waiters = self._waiters.get(container_id, [])
+                    if waiter in waiters:
+                        waiters.remove(waiter)
+                    if not waiters:
+                        self._waiters.pop(container_id, None)
+
+    def _add(self, container_id, name, info=None):
+        with self._lock:
+            old_name = self._by_id.get(container_id)
+            if old_name and self._by_name.get(old_name) == container_id:
+                del self._by_name[old_name]
+            self._by_id[container_id] = name
+            self._by_name[name] = container_id
+            if info:
+                self._info[container_id] = info
+
+    def _resolve(self, ref):
+        ref = container_ref(ref)
+        with self._lock:
+            if ref in self._by_id:
+                return ref
+            return self._by_name.get(ref)
+
+    def store(self, info):
+        """Record inspect data obtained elsewhere, e.g. by a bulk pass."""
+        self._add(info['Id'], info['Name'].lstrip('/'), info)
+
+    def refresh(self, ref):
+        """Re-inspect a single container and update the index with it."""
+        ref = container_ref(ref)
+        if not ref:
+            return {}
+        try:
+            info = self.docker.inspect_container(ref)
+        except errors.APIError as e:
+            if e.response.status_code != 404:
+                raise
+            info = None
+        if not info:
+            self.forget(ref)
+            return {}
+        self.store(info)
+        return info
+
+    def invalidate(self, ref):
+        """Drop the cached inspect data of a container."""
+        container_id = self._resolve(ref)
+        with self._lock:
+            self._info.pop(container_id, None)
+
+    def forget(self, ref):
+        """Remove a container from the index."""
+        with self._lock:
+            container_id = self._resolve(ref)
+            if not container_id:
+                return
+            name = self._by_id.pop(container_id, None)
+            if name and self._by_name.get(name) == container_id:
+                del self._by_name[name]
+            self._info.pop(container_id, None)
+
+    def list_names(self):
+        if not self._live:
+            return [_container_name(ct['Names'])
+                    for ct in self.docker.containers(all=True)]
+        with self._lock:
+            return list(self._by_name)
+
+    def exists(self, name):
+        if not self._live:
+            return name in self.list_names()
+        with self._lock:
+            return name in self._by_name
+
+    def get_name(self, ref):
+        """Name of a container recorded in the index, None otherwise."""
+        container_id = self._resolve(ref)
+        with self._lock:
+            return self._by_id.get(container_id)
+
+    def get_id(self, name):
+        return self.inspect(name).get('Id')
+
+    def inspect(self, name):
+        """Return inspect_container data for the named container or {}."""
+        if not self._live:
+            return self._find_by_name(name)
+        with self._lock:
+            container_id = self._by_name.get(name)
+            info = self._info.get(container_id)
+        if not container_id:
+            return {}
+        if info:
+            return info
+        return self.refresh(container_id)
+
+    def is_running(self, name):
+        info = self.inspect(name)
+        if not info:
+            return False
+        return bool(info['State'].get('Running'))
+
+    def _find_by_name(self, name):
+        try:
+            containers = self.docker.containers(all=True,
+                                                filters={'name': name})
+            for ct in containers:
+                if ct and _container_name(ct['Names']) == name:
+                    return self.docker.inspect_container(ct['Id'])
+        except errors.APIError as e:
+            if e.response.status_code != 404:
+                raise
+        return {}
@@ -0,0 +1,182 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Host CPU topology and NUMA/SMT aware cpuset placement.
+
+The topology is read from sysfs (``/sys/devices/system/cpu`` and
+``/sys/devices/system/node``). Placement packs a container onto a single
+NUMA node whenever one has enough usable CPUs and, depending on the
+sibling policy, fills whole cores or spreads over distinct cores.
+"""
+
+import os
+
+from nova.openstack.common import log
+
+LOG = log.getLogger(__name__)
+
+SIBLINGS_PREFER = 'prefer'
+SIBLINGS_AVOID = 'avoid'
+SIBLINGS_IGNORE = 'ignore'
+SIBLING_POLICIES = (SIBLINGS_PREFER, SIBLINGS_AVOID, SIBLINGS_IGNORE)
+
+
+def parse_cpulist(cpulist):
+    """Parse a kernel cpu list such as '0-3,8,10-11' into ints."""
+    cpus = []
+    for part in cpulist.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+class CpuInfo(object):
+    def __init__(self, cpu, node, socket, core, siblings):
+        self.cpu = cpu
+        self.node = node
+        self.socket = socket
+        self.core = core
+        self.siblings = siblings
+
+
+class HostTopology(object):
+    """CPUs of the host grouped by NUMA node and physical core."""
+
+    def __init__(self, cpus):
+        self.cpus = dict((info.cpu, info) for info in cpus)
+
+    @classmethod
+    def from_sysfs(cls, root='/sys/devices/system'):
+        cpu_root = os.path.join(root, 'cpu')
+        online = _read(os.path.join(cpu_root, 'online'))
+        if online is None:
+            return None
+        node_of = {}
+        node_root = os.path.join(root, 'node')
+        if os.path.isdir(node_root):
+            for entry in os.listdir(node_root):
+                if not entry.startswith('node') or not entry[4:].isdigit():
+                    continue
+                cpulist = _read(os.path.join(node_root, entry, 'cpulist'))
+                for cpu in parse_cpulist(cpulist or ''):
+                    node_of[cpu] = int(entry[4:])
+        cpus = []
+        for cpu in parse_cpulist(online):
+            topo = os.path.join(cpu_root, 'cpu%d' % cpu, 'topology')
+            socket = _read(os.path.join(topo, 'physical_package_id'))
+            core = _read(os.path.join(topo, 'core_id'))
+            siblings = _read(os.path.join(topo, 'thread_siblings_list'))
+            socket = int(socket) if socket is not None else 0
+            cpus.append(CpuInfo(
+                cpu,
+                node_of.get(cpu, socket),
+                socket,
+                (socket, int(core) if core is not None else cpu),
+                parse_cpulist(siblings) if siblings else [cpu]))
+        return cls(cpus)
+
+    def node_of(self, cpu):
+        info = self.cpus.get(cpu)
+        return info.node if info else 0
+
+    def mems_for(self, cpus):
+        return sorted(set(self.node_of(cpu) for cpu in cpus))
+
+    def place(self, num, usage, policy=SIBLINGS_IGNORE):
+        """Choose num CPUs among the keys of usage.
+
+        :param usage: number of containers pinned to each usable CPU
+        :param policy: one of SIBLING_POLICIES
+        :returns: list of chosen CPUs
+        """
+        nodes = {}
+        for cpu in usage:
+            nodes.setdefault(self.node_of(cpu), []).append(cpu)
+
+        fitting = []
+        for node, cpus in nodes.items():
+            if len(cpus) < num:
+                continue
+            chosen = self._pick(cpus, num, usage, policy)
+            load = sum(usage[cpu] for cpu in chosen)
+            node_load = sum(usage[cpu] for cpu in cpus)
+            fitting.append(((load, float(node_load) / len(cpus), node),
+                            chosen))
+        if fitting:
+            return sorted(min(fitting)[1])
+
+        # No single node is big enough: take the least loaded nodes first.
+        chosen = []
+        order = sorted(nodes, key=lambda n: (
+            float(sum(usage[c] for c in nodes[n])) / len(nodes[n]), n))
+        for node in order:
+            want = min(num - len(chosen), len(nodes[node]))
+            chosen.extend(self._pick(nodes[node], want, usage, policy))
+            if len(chosen) >= num:
+                break
+        return sorted(chosen)
+
+    def _core_of(self, cpu):
+        info = self.cpus.get(cpu)
+        return info.core if info else (None, cpu)
+
+    def _pick(self, cpus, num, usage, policy):
+        by_load = sorted(cpus, key=lambda cpu: (usage[cpu], cpu))
+        if policy == SIBLINGS_IGNORE:
+            return by_load[:num]
+
+        cores = {}
+        for cpu in by_load:
+            cores.setdefault(self._core_of(cpu), []).append(cpu)
+
+        if policy == SIBLINGS_PREFER:
+            # Fill whole cores, least loaded core first, so the container
+            # shares caches with itself rather than with its neighbours.
+            ordered = sorted(cores.values(), key=lambda threads: (
+                float(sum(usage[c] for c in threads)) / len(threads),
+                -len(threads), threads[0]))
+            chosen = []
+            for threads in ordered:
+                chosen.extend(threads[:num - len(chosen)])
+                if len(chosen) >= num:
+                    break
+            return chosen
+
+        # SIBLINGS_AVOID: one thread per core first, then second threads.
+        chosen = []
+        depth = 0
+        while len(chosen) < num:
+            layer = [threads[depth] for threads in cores.values()
+                     if len(threads) > depth]
+            if not layer:
+                break
+            layer.sort(key=lambda cpu: (usage[cpu], cpu))
+            chosen.extend(layer[:num - len(chosen)])
+            depth += 1
+        return chosen
@@ -1,6 +1,11 @@
 #!/usr/bin/python
+import heapq
+import os
+import threading
+
 from nova import utils
 from nova.openstack.common import log
+from novadocker.virt.docker import cpu_topology
 from novadocker.virt.docker import hostinfo
 
 LOG = log.getLogger(__name__)
@@ -131,6 +136,140 @@ class ParseCpuset(object):
     def get_cpu_list(self):
         return self.cpu_list
 
+
+def format_cpuset(cpus):
+    return ','.join(str(cpu) for cpu in sorted(cpus))
+
+
+def parse_cpuset(cpuset_str):
+    parser = ParseCpuset()
+    parser.parse(cpuset_str.strip())
+    return [int(cpu) for cpu in parser.get_cpu_list() if cpu != '']
+
+
+class CpusetLedger(object):
+    """In-memory account of the CPUs pinned to each running container.
+
+    Rebuilt once from the cpuset cgroups of the running containers and
+    then kept up to date by the driver as containers start and stop, so
+    picking CPUs for a new container needs no subprocess at all.
+    """
+
+    def __init__(self, system_cpuset, cgroup_path, topology=None,
+                 sibling_policy=cpu_topology.SIBLINGS_IGNORE):
+        self.cgroup_path = cgroup_path
+        self.topology = topology
+        self.sibling_policy = sibling_policy
+        self.cpu_num = hostinfo.get_cpu_info()
+        self.sys_cpus = set()
+        if system_cpuset != '-1':
+            self.sys_cpus = set(parse_cpuset(system_cpuset))
+        self._lock = threading.Lock()
+        self._usage = dict((cpu, 0) for cpu in self.usable_cpus())
+        self._allocations = {}
+
+    def usable_cpus(self):
+        return [cpu for cpu in range(self.cpu_num)
+                if cpu not in self.sys_cpus]
+
+    def rebuild(self, names_by_id):
+        """Reload allocations from the cgroups of the running containers.
+
+        :param names_by_id: container name of every known container id
+        """
+        allocations = {}
+        try:
+            entries = os.listdir(self.cgroup_path)
+        except OSError:
+            LOG.warning('Cannot read cpuset cgroups from %s',
+                        self.cgroup_path)
+            entries = []
+        for container_id in entries:
+            name = names_by_id.get(container_id)
+            if not name:
+                continue
+            cpus_file = os.path.join(self.cgroup_path, container_id,
+                                     'cpuset.cpus')
+            try:
+                with open(cpus_file) as f:
+                    cpus = parse_cpuset(f.read())
+            except (IOError, OSError):
+                continue
+            # Containers which are not pinned may run on every CPU and are
+            # not counted against any of them.
+            if cpus and len(cpus) < self.cpu_num:
+                allocations[name] = cpus
+        with self._lock:
+            self._allocations = {}
+            self._usage = dict((cpu, 0) for cpu in self.usable_cpus())
+            for name, cpus in allocations.items():
+                self._add(name, cpus)
+        LOG.debug('Cpuset ledger rebuilt with %d pinned containers',
+                  len(allocations))
+
+    def _add(self, name, cpus):
+        self._allocations[name] = cpus
+        for cpu in cpus:
+            if cpu in self._usage:
+                self._usage[cpu] += 1
+
+    def _pick(self, num):
+        if self.topology is not None:
+            return self.topology.place(num, self._usage, self.sibling_policy)
+        return heapq.nsmallest(num, self._usage,
+                               key=lambda cpu: (self._usage[cpu], cpu))
+
+    def mems_for(self, cpus):
+        """NUMA nodes to use as cpuset.mems for cpus, None if unknown."""
+        if self.topology is None:
+            return None
+        return self.topology.mems_for(cpus)
+
+    def set_mems(self, container_id, mems):
+        """Bind a running container's memory to the given NUMA nodes."""
+        mems_file = os.path.join(self.cgroup_path, container_id,
+                                 'cpuset.mems')
+        utils.execute('tee', mems_file,
+                      process_input=format_cpuset(mems),
+                      run_as_root=True)
+
+    def allocate(self, name, num):
+        """Pin num of the least used CPUs to a container.
+
+        A container which already holds an allocation keeps it.
+        """
+        with self._lock:
+            cpus = self._allocations.get(name)
+            if cpus is None:
+                cpus = self._pick(num)
+                self._add(name, cpus)
+            return list(cpus)
+
+    def assign(self, name, cpus):
+        """Record CPUs a container was pinned to outside allocate()."""
+        with self._lock:
+            self._release(name)
+            self._add(name, list(cpus))
+
+    def release(self, name):
+        with self._lock:
+            self._release(name)
+
+    def _release(self, name):
+        for cpu in self._allocations.pop(name, []):
+            if cpu in self._usage:
+                self._usage[cpu] = max(self._usage[cpu] - 1, 0)
+
+    def get(self, name):
+        with self._lock:
+            cpus = self._allocations.get(name)
+            return list(cpus) if cpus is not None else None
+
+    def usage(self):
+        with self._lock:
+            return dict(self._usage)
+
+
 if __name__ == '__main__':
     cpustats = CpusetStatsMap()
     cpustats.get_map()
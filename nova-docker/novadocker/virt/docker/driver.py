@@ -17,11 +17,15 @@
 A Docker Hypervisor which allows running Linux Containers instead of VMs.
 """
 
+import functools
 import os
 import socket
+import sys
+import threading
 import time
 import uuid
 
+from eventlet import greenpool
 from oslo.config import cfg
 from oslo.serialization import jsonutils
 from oslo.utils import importutils
@@ -37,23 +41,39 @@ from nova.openstack.common import fileutils
 from nova.openstack.common import log
 from nova.openstack.common import excutils
 from nova.openstack.common import loopingcall
+from nova import rpc
 from nova import utils
 from nova import utils as nova_utils
 from nova import objects
+from nova.virt import diagnostics
 from nova.virt import driver
 from nova.virt import images
+from novadocker.virt.docker import cgroupstats
 from novadocker.virt.docker import client as docker_client
+from novadocker.virt.docker import commitment
+from novadocker.virt.docker import container_index
+from novadocker.virt.docker import hostfacts
 from novadocker.virt.docker import hostinfo
-from novadocker.virt.docker import host_monitor
+from novadocker.virt.docker import imagecache
+from novadocker.virt.docker import imagestream
+from novadocker.virt.docker import inventory
+from novadocker.virt.docker import metrics
+from novadocker.virt.docker import migration
+from novadocker.virt.docker import cpu_topology
 from novadocker.virt.docker import cpuset_info
+from novadocker.virt.docker import netns
 from novadocker.virt.docker import network
+from novadocker.virt.docker import pipeline
+from novadocker.virt.docker import singleflight
 from novadocker.virt import hostutils
 from docker import errors
 from docker import utils as docker_utils
 
 CONF = cfg.CONF
+CONF.import_opt('host', 'nova.netconf')
 CONF.import_opt('my_ip', 'nova.netconf')
 CONF.import_opt('instances_path', 'nova.compute.manager')
+CONF.import_opt('instance_name_template', 'nova.db.api')
 
 docker_opts = [
     cfg.StrOpt('host_url',
@@ -93,7 +113,70 @@ docker_opts = [
                     'Support list : device_mapper/overlayfs'),
     cfg.BoolOpt('delete_migration_source',
                default=False,
-                help='Migration Source Node delete the tar from snapshot dir.')
+                help='Migration Source Node delete the tar from snapshot dir.'),
+    cfg.BoolOpt('watch_events',
+                default=True,
+                help='Follow the Docker event stream to keep an in-memory '
+                     'index of containers instead of listing and inspecting '
+                     'them on every lookup.'),
+    cfg.IntOpt('info_cache_ttl',
+               default=10,
+               help='Seconds a bulk snapshot of container states is used '
+                    'to answer get_info before it is rebuilt. 0 disables '
+                    'the snapshot.'),
+    cfg.StrOpt('cpuset_cgroup_path',
+               default='/sys/fs/cgroup/cpuset/docker',
+               help='cgroup directory holding the cpuset group of each '
+                    'running container.'),
+    cfg.StrOpt('cpuset_sibling_policy',
+               default='ignore',
+               help='How cpuset/mix mode treats hyperthread siblings: '
+                    'prefer (fill whole cores), avoid (one thread per core '
+                    'first) or ignore. Containers are packed onto a single '
+                    'NUMA node whenever one has enough CPUs.'),
+    cfg.IntOpt('inspect_concurrency',
+               default=16,
+               help='Number of concurrent inspect calls made when building '
+                    'the container state snapshot.'),
+    cfg.IntOpt('netns_sweep_interval',
+               default=600,
+               help='Seconds between sweeps removing the network namespace '
+                    'links of containers whose process is gone. 0 disables '
+                    'the sweep.'),
+    cfg.BoolOpt('image_stream',
+                default=True,
+                help='Stream images from Glance straight into Docker '
+                     'instead of through a file under snapshots_directory. '
+                     'The file is still used if streaming fails.'),
+    cfg.IntOpt('image_stream_buffer_chunks',
+               default=16,
+               help='Number of Glance chunks read ahead of Docker while '
+                    'streaming an image.'),
+    cfg.IntOpt('snapshot_chunk_size',
+               default=1024 * 1024,
+               help='Bytes read at a time from the Docker image export '
+                    'while uploading a snapshot to Glance.'),
+    cfg.BoolOpt('snapshot_compression',
+                default=False,
+                help='Gzip snapshots on the fly before uploading them. '
+                     'Docker loads compressed images as they are.'),
+    cfg.IntOpt('snapshot_progress_interval',
+               default=10,
+               help='Seconds between snapshot upload progress '
+                    'notifications.'),
+    cfg.IntOpt('vif_concurrency',
+               default=8,
+               help='Number of VIFs of an instance plugged and attached '
+                    'at the same time.'),
+    cfg.IntOpt('commitment_reconcile_interval',
+               default=600,
+               help='Seconds after which the ledger of the vCPUs and memory '
+                    'committed to containers is checked again against the '
+                    'containers of the host.'),
+    cfg.IntOpt('pid_wait_timeout',
+               default=15,
+               help='Seconds to wait for the process of a started container '
+                    'to get a PID before network setup fails.'),
 ]
 
 CONF.register_opts(docker_opts, 'docker')
@@ -104,18 +187,38 @@ LOG = log.getLogger(__name__)
 class DockerDriver(driver.ComputeDriver):
     """Docker hypervisor driver."""
 
+    capabilities = dict(driver.ComputeDriver.capabilities,
+                        has_imagecache=True)
+
     def __init__(self, virtapi):
         super(DockerDriver, self).__init__(virtapi)
         self._docker = None
         vif_class = importutils.import_class(CONF.docker.vif_driver)
         self.vif_driver = vif_class()
+        self._index = container_index.ContainerIndex(lambda: self.docker)
+        container_index.register(self._index)
+        self._info_snapshot = {}
+        self._info_snapshot_time = 0
+        self._info_snapshot_lock = threading.Lock()
+        self._info_refreshes = singleflight.SingleFlight('info_snapshot')
+        self._index.add_listener(self._drop_snapshot_entry)
+        self._cpu_ledger = None
+        self._image_pulls = singleflight.SingleFlight('image_pull')
+        self._image_cache = imagecache.ImageCacheManager(
+            lambda: self.docker, self._fetch_image)
+        self._inventory = inventory.HostInventory()
+        self._cgroup_stats = cgroupstats.CgroupStatsReader()
+        self._commitments = commitment.CommitmentLedger()
+        self._instance_names = commitment.name_pattern(
+            CONF.instance_name_template)
+        self._index.add_listener(self._drop_commitment)
 
     @property
     def docker(self):
         if self._docker is None:
-            self._docker = docker_client.DockerHTTPClient(CONF.docker.host_url,
-                                                          api_version=CONF.docker.api_version,
-                                                          api_timeout=CONF.docker.api_timeout)
+            self._docker = docker_client.get_client(CONF.docker.host_url,
+                                                    api_version=CONF.docker.api_version,
+                                                    api_timeout=CONF.docker.api_timeout)
         return self._docker
 
     def init_host(self, host):
@@ -123,6 +226,38 @@ class DockerDriver(driver.ComputeDriver):
             raise exception.NovaException(
                 _('Docker daemon is not running or is not reachable'
                   ' (check the rights on /var/run/docker.sock)'))
+        if CONF.docker.watch_events:
+            self._index.start()
+        if CONF.docker.docker_cpu_mode in ('cpuset', 'mix'):
+            names_by_id = dict(
+                (ct['Id'], ct['Names'][0][1:])
+                for ct in self.docker.containers() if ct.get('Names'))
+            self.cpu_ledger.rebuild(names_by_id)
+        if CONF.docker.netns_sweep_interval > 0:
+            timer = loopingcall.FixedIntervalLoopingCall(self._sweep_netns)
+            timer.start(interval=CONF.docker.netns_sweep_interval,
+                        initial_delay=CONF.docker.netns_sweep_interval)
+
+    def _sweep_netns(self):
+        try:
+            netns.get_registry().sweep()
+        except Exception as e:
+            LOG.warning(_('Network namespace sweep failed: %s'), e)
+
+    @property
+    def cpu_ledger(self):
+        if self._cpu_ledger is None:
+            policy = CONF.docker.cpuset_sibling_policy
+            if policy not in cpu_topology.SIBLING_POLICIES:
+                LOG.warning(_('Unknown cpuset_sibling_policy %s, '
+                              'ignoring siblings.'), policy)
+                policy = cpu_topology.SIBLINGS_IGNORE
+            self._cpu_ledger = cpuset_info.CpusetLedger(
+                CONF.docker.docker_system_cpuset,
+                CONF.docker.cpuset_cgroup_path,
+                topology=hostfacts.static_facts()['topology'],
+                sibling_policy=policy)
+        return self._cpu_ledger
 
     def _is_daemon_running(self):
         try:
@@ -131,17 +266,10 @@ class DockerDriver(driver.ComputeDriver):
             return False
 
     def list_instances(self):
-        res = []
-        for container in self.docker.containers(all=True):
-            res.append(container['Names'][0][1:])
-        return res
+        return self._index.list_names()
 
     def _exist_container(self,container_name):
-        for container in self.docker.containers(all=True):
-            if container['Names'][0][1:] == container_name:
-                return True
-
-        return False
+        return self._index.exists(container_name)
 
     def resize_container_disk(self, instance, disk_info):
         storage_type = CONF.docker.docker_storage_type
@@ -171,16 +299,43 @@ class DockerDriver(driver.ComputeDriver):
         """Attach an interface to the container."""
         self.vif_driver.plug(instance, vif)
         container_id = self._get_container_id(instance)
-        self.vif_driver.attach(instance, vif, container_id, sec_if=True)
+        try:
+            # Boot time VIFs are named after their position; a hot-plugged
+            # one takes the first name left free by them and earlier
+            # detaches.
+            self.vif_driver.attach(instance, vif, container_id, sec_if=True,
+                                   ifname=network.next_ifname(container_id))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self.vif_driver.unplug(instance, vif)
 
     def detach_interface(self, instance, vif):
         """Detach an interface from the container."""
         self.vif_driver.unplug(instance, vif)
 
+    def _run_per_vif(self, func, network_info):
+        """Run func(index, vif) for every VIF through a bounded pool.
+
+        Every call runs to completion, then the first failure is raised.
+        """
+        pool = greenpool.GreenPool(max(CONF.docker.vif_concurrency, 1))
+        threads = [pool.spawn(func, index, vif)
+                   for index, vif in enumerate(network_info)]
+        failure = None
+        for thread in threads:
+            try:
+                thread.wait()
+            except Exception:
+                if failure is None:
+                    failure = sys.exc_info()
+        if failure:
+            raise failure[0], failure[1], failure[2]
+
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
-        for vif in network_info:
-            self.vif_driver.plug(instance, vif)
+        self._run_per_vif(
+            lambda index, vif: self.vif_driver.plug(instance, vif),
+            network_info)
 
     def _attach_vifs(self, instance, network_info):
         """Plug VIFs into container."""
@@ -190,48 +345,146 @@ class DockerDriver(driver.ComputeDriver):
         if not container_id:
             LOG.warning('Container %s is not existed., attach vifs Failed.')
             return
-        netns_path = '/var/run/netns'
-        if not os.path.exists(netns_path):
-            utils.execute(
-                'mkdir', '-p', netns_path, run_as_root=True)
         nspid = self._find_container_pid(container_id)
         if not nspid:
             msg = _('Cannot find any PID under container "{0}"')
             raise RuntimeError(msg.format(container_id))
-        netns_path = os.path.join(netns_path, container_id)
-        utils.execute(
-            'ln', '-sf', '/proc/{0}/ns/net'.format(nspid),
-            '/var/run/netns/{0}'.format(container_id),
-            run_as_root=True)
-        utils.execute('ip', 'netns', 'exec', container_id, 'ip', 'link',
-                      'set', 'lo', 'up', run_as_root=True)
-
-        for vif in network_info:
-            self.vif_driver.attach(instance, vif, container_id)
+        netns.get_registry().link(container_id, nspid)
+
+        # Interfaces are named after their position, so the first VIF is
+        # always eth0 whatever order they finish in; its default route is
+        # part of its own batch, applied once eth0 is up.
+        self._run_per_vif(
+            lambda index, vif: self.vif_driver.attach(
+                instance, vif, container_id, sec_if=index > 0,
+                ifname='eth%d' % index),
+            network_info)
+
+    def _setup_network(self, instance, network_info, plugged=False):
+        """Plug and attach every VIF, or none of them.
+
+        :param plugged: whether the VIFs are plugged already, only to be
+                        attached
+        """
+        start = time.time()
+        try:
+            if not plugged:
+                self.plug_vifs(instance, network_info)
+            self._attach_vifs(instance, network_info)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # Deleting the host side of a veth removes its peer in the
+                # container as well.
+                try:
+                    self.unplug_vifs(instance, network_info)
+                except Exception:
+                    LOG.exception(_('Cannot roll back the VIFs'),
+                                  instance=instance)
+        metrics.histogram('network_ready_time').observe(time.time() - start)
 
     def unplug_vifs(self, instance, network_info):
         """Unplug VIFs from networks."""
-        for vif in network_info:
-            self.vif_driver.unplug(instance, vif)
+        self._run_per_vif(
+            lambda index, vif: self.vif_driver.unplug(instance, vif),
+            network_info)
 
     def _get_container_id(self, instance):
        return self._find_container_by_name(instance['name']).get('Id')
 
     def _find_container_by_name(self, name):
-        try:
-            containers = self.docker.containers(all=True, filters={'name': name})
-            for ct in containers:
-                if ct and ct['Names'][0][1:] == name:
-                    return self.docker.inspect_container(ct['Id'])
-        except errors.APIError as e:
-            if e.response.status_code != 404:
-                raise
-        return {}
+        return self._index.inspect(name)
+
+    def get_instances_info(self):
+        """Return the info of every container, keyed by container name.
+
+        Built from one containers(all=True) call plus concurrent inspects,
+        so the periodic power state sync costs one pass over the host
+        instead of a list and an inspect per instance.
+        """
+        containers = self.docker.containers(all=True)
+        pool = greenpool.GreenPool(CONF.docker.inspect_concurrency)
+
+        def _inspect(ct):
+            try:
+                return self.docker.inspect_container(ct['Id'])
+            except errors.APIError as e:
+                if e.response.status_code != 404:
+                    raise
+
+        inspected = [container
+                     for container in pool.imap(_inspect, containers)
+                     if container]
+        # CPU and memory counters of every container from one pass over
+        # the cgroup directories; only get_diagnostics needs the I/O ones.
+        stats = self._cgroup_stats.read_all(dict(
+            (container['Id'], container['State'].get('Pid'))
+            for container in inspected), io=False)
+        self._reconcile_commitments(inspected)
+        snapshot = {}
+        for container in inspected:
+            self._index.store(container)
+            name = container['Name'].lstrip('/')
+            snapshot[name] = self._container_info(
+                container, stats.get(container['Id']))
+        with self._info_snapshot_lock:
+            self._info_snapshot = snapshot
+            self._info_snapshot_time = time.time()
+        return snapshot
+
+    def _snapshot_is_fresh(self, ttl):
+        with self._info_snapshot_lock:
+            return time.time() - self._info_snapshot_time < ttl
+
+    def _get_snapshot_info(self, name):
+        ttl = CONF.docker.info_cache_ttl
+        if ttl <= 0:
+            return
+        if not self._snapshot_is_fresh(ttl):
+            # Callers finding the snapshot stale together share one rebuild.
+            self._info_refreshes.do('snapshot', self._refresh_snapshot, ttl)
+        with self._info_snapshot_lock:
+            return self._info_snapshot.get(name)
+
+    def _refresh_snapshot(self, ttl):
+        # A caller may only get here once the rebuild of another finished.
+        if not self._snapshot_is_fresh(ttl):
+            self.get_instances_info()
+
+    def _reconcile_commitments(self, containers):
+        added, removed = self._commitments.reconcile(
+            containers,
+            pinned=CONF.docker.docker_cpu_mode in ('cpuset', 'mix'),
+            names=self._instance_names)
+        if added or removed:
+            LOG.info(_('Resource ledger reconciled: %(added)s not recorded, '
+                       '%(removed)s gone'),
+                     {'added': added, 'removed': removed})
+
+    def _drop_commitment(self, name):
+        if name and not self._index.exists(name):
+            self._commitments.release(name)
+
+    def _drop_snapshot_entry(self, name):
+        with self._info_snapshot_lock:
+            self._info_snapshot.pop(name, None)
 
     def get_info(self, instance):
+        info = self._get_snapshot_info(instance['name'])
+        if info:
+            return dict(info)
+        # Not in the snapshot, e.g. created since it was taken.
+        container, stats = self._container_stats(instance, io=False)
+        return self._container_info(container, stats)
+
+    def _container_stats(self, instance, io=True):
         container = self._find_container_by_name(instance['name'])
         if not container:
             raise exception.InstanceNotFound(instance_id=instance['name'])
+        stats = self._cgroup_stats.read(container['Id'],
+                                        container['State'].get('Pid'), io=io)
+        return container, stats
+
+    def _container_info(self, container, stats=None):
         running = container['State'].get('Running')
         mem = container['Config'].get('Memory', 0)
 
@@ -239,23 +492,83 @@ class DockerDriver(driver.ComputeDriver):
         #                  see: _get_cpu_shares for further explaination
         num_cpu = container['Config'].get('CpuShares', 0) / 1024
 
-        # FIXME(ewindisch): Improve use of statistics:
-        #                   For 'mem', we should expose memory.stat.rss, and
-        #                   for cpu_time we should expose cpuacct.stat.system,
-        #                   but these aren't yet exposed by Docker.
-        #
-        #                   Also see:
-        #                    docker/docs/sources/articles/runmetrics.md
+        # Docker does not expose usage counters, they are read from the
+        # container's cgroups: memory.stat rss and cpuacct.usage.
+        #   See: docker/docs/sources/articles/runmetrics.md
         info = {
-            'max_mem': mem,
-            'mem': mem,
+            'max_mem': mem / units.Ki,
+            'mem': cgroupstats.memory_rss(stats) / units.Ki if stats else 0,
             'num_cpu': num_cpu,
-            'cpu_time': 0
+            'cpu_time': stats.cpu_time if stats else 0
         }
         info['state'] = (power_state.RUNNING if running
                          else power_state.SHUTDOWN)
         return info
 
+    def get_diagnostics(self, instance):
+        """Return the resource usage of a container, libvirt style."""
+        container, stats = self._container_stats(instance)
+        diags = {'memory': container['Config'].get('Memory', 0) / units.Ki}
+        # Bytes written to the writable layer, for disk accounting.
+        rootfs_used = hostinfo.get_container_disk_usage(container['Id'])
+        if rootfs_used is not None:
+            diags['rootfs_used'] = rootfs_used
+        if not stats:
+            return diags
+        diags['cpu0_time'] = stats.cpu_time
+        diags['memory-actual'] = stats.memory_usage / units.Ki
+        diags['memory-rss'] = cgroupstats.memory_rss(stats) / units.Ki
+        diags['memory-cache'] = stats.memory_stat.get('cache', 0) / units.Ki
+        for device, blkio in stats.blkio.items():
+            diags[device + '_read'] = blkio.read_bytes
+            diags[device + '_read_req'] = blkio.read_ops
+            diags[device + '_write'] = blkio.write_bytes
+            diags[device + '_write_req'] = blkio.write_ops
+        for ifname, net in stats.net.items():
+            diags[ifname + '_rx'] = net.rx_bytes
+            diags[ifname + '_rx_packets'] = net.rx_packets
+            diags[ifname + '_rx_errors'] = net.rx_errors
+            diags[ifname + '_rx_drop'] = net.rx_drop
+            diags[ifname + '_tx'] = net.tx_bytes
+            diags[ifname + '_tx_packets'] = net.tx_packets
+            diags[ifname + '_tx_errors'] = net.tx_errors
+            diags[ifname + '_tx_drop'] = net.tx_drop
+        return diags
+
+    def get_instance_diagnostics(self, instance):
+        """Return the resource usage of a container as Diagnostics."""
+        container, stats = self._container_stats(instance)
+        info = self._container_info(container, stats)
+        diags = diagnostics.Diagnostics(
+            state=power_state.STATE_MAP[info['state']], driver='docker',
+            hypervisor_os='linux')
+        diags.memory_details.maximum = info['max_mem'] / units.Ki
+        if not stats:
+            return diags
+        diags.memory_details.used = cgroupstats.memory_rss(stats) / units.Mi
+        diags.add_cpu(time=stats.cpu_time)
+        for device, blkio in sorted(stats.blkio.items()):
+            diags.add_disk(id=device, read_bytes=blkio.read_bytes,
+                           read_requests=blkio.read_ops,
+                           write_bytes=blkio.write_bytes,
+                           write_requests=blkio.write_ops)
+        for ifname, net in sorted(stats.net.items()):
+            diags.add_nic(rx_octets=net.rx_bytes, rx_errors=net.rx_errors,
+                          rx_drop=net.rx_drop, rx_packets=net.rx_packets,
+                          tx_octets=net.tx_bytes, tx_errors=net.tx_errors,
+                          tx_drop=net.tx_drop, tx_packets=net.tx_packets)
+        return diags
+
+    def _invalidate_container(self, container_id):
+        # Only this container's entry goes, get_info reads it directly
+        # until the next rebuild of the snapshot.
+        self._drop_snapshot_entry(self._index.get_name(container_id))
+        self._index.invalidate(container_id)
+
+    def _forget_container(self, container_id):
+        self._drop_snapshot_entry(self._index.get_name(container_id))
+        self._index.forget(container_id)
+
     def get_host_stats(self, refresh=False):
         hostname = socket.gethostname()
         stats = self.get_available_resource(hostname)
@@ -276,16 +589,19 @@ class DockerDriver(driver.ComputeDriver):
                         ) % {'old': self._nodename,
                              'new': nodename})
 
+        LOG.debug('Docker API connection pools: %s',
+                  docker_client.get_pool_stats())
+        LOG.debug('Docker driver metrics: %s', metrics.snapshot())
         memory = hostinfo.get_memory_usage()
-        docker_info = self.docker.info()
-        disk = hostinfo.get_disk_usage(docker_info)
+        disk = hostinfo.get_disk_usage()
         vcpu_total = hostinfo.get_cpu_info() * int(CONF.docker.docker_allocation_ratio)
+        committed, overhead = self._committed_resources(memory)
 
         stats = {
             'vcpus': int(vcpu_total),
-            'vcpus_used': 0,
+            'vcpus_used': committed.vcpus,
             'memory_mb': memory['total'] / units.Mi,
-            'memory_mb_used': memory['used'] / units.Mi,
+            'memory_mb_used': (overhead + committed.memory) / units.Mi,
             'local_gb': disk['total'] / units.Gi,
             'local_gb_used': disk['used'] / units.Gi,
             'disk_available_least': disk['available'] / units.Gi,
@@ -300,23 +616,57 @@ class DockerDriver(driver.ComputeDriver):
         }
         return stats
 
+    def _committed_resources(self, memory):
+        """Resources committed to the containers, and the host overhead.
+
+        The overhead is the memory the host uses besides what the
+        containers use; the memory used is reported as that overhead plus
+        the memory limits of the containers, whether they use it yet or
+        not.
+
+        :returns: (commitment.Totals, overhead in bytes)
+        """
+        interval = CONF.docker.commitment_reconcile_interval
+        if time.time() - self._commitments.reconciled_at >= interval:
+            try:
+                self.get_instances_info()
+            except Exception as e:
+                LOG.warning(_('Cannot reconcile the resource ledger: %s'), e)
+        ids = self._commitments.container_ids()
+        stats = self._cgroup_stats.read_all(
+            dict((container_id, None) for container_id in ids.values()),
+            io=False)
+        usage = dict((name, cgroupstats.memory_rss(stats[container_id]))
+                     for name, container_id in ids.items()
+                     if container_id in stats)
+        committed = self._commitments.totals(usage)
+        overhead = max(memory['used'] - sum(usage.values()), 0)
+        LOG.debug('Committed to %(containers)d containers: %(vcpus)d vCPUs, '
+                  '%(memory)d MB, %(pinned)d pinned CPUs; host overhead '
+                  '%(overhead)d MB',
+                  {'containers': committed.containers,
+                   'vcpus': committed.vcpus,
+                   'memory': committed.memory / units.Mi,
+                   'pinned': committed.pinned_cpus,
+                   'overhead': overhead / units.Mi})
+        return committed, overhead
+
     def _find_container_pid(self, container_id):
-        n = 0
-        while True:
-            # NOTE(samalba): We wait for the process to be spawned inside the
-            # container in order to get the the "container pid". This is
-            # usually really fast. To avoid race conditions on a slow
-            # machine, we allow 10 seconds as a hard limit.
-            if n > 15:
-                return
-            info = self.docker.inspect_container(container_id)
-            if info:
-                pid = info['State']['Pid']
-                # Pid is equal to zero if it isn't assigned yet
-                if pid:
-                    return pid
-            time.sleep(1)
-            n += 1
+        # NOTE(samalba): We wait for the process to be spawned inside the
+        # container in order to get the the "container pid". This is
+        # usually really fast, start events and a short backing off poll
+        # pick it up as soon as it is there.
+        start = time.time()
+        pid = self._index.wait_for_pid(container_id,
+                                       CONF.docker.pid_wait_timeout)
+        elapsed = time.time() - start
+        if pid:
+            metrics.histogram('container_time_to_pid').observe(elapsed)
+        else:
+            metrics.counter('container_pid_timeouts').inc()
+        LOG.debug('Container %(id)s PID %(pid)s found in %(time).3fs',
+                  {'id': container_id, 'pid': pid, 'time': elapsed})
+        return pid
 
     def _get_memory_limit_bytes(self, instance):
         if isinstance(instance, objects.Instance):
@@ -364,10 +714,58 @@ class DockerDriver(driver.ComputeDriver):
         ret =  {"log_volume" : log_volume, "data_volume" : data_volume, "other_volume" : other_volume}
         return ret
 
+    def _fetch_image(self, context, image_meta, instance):
+        """Load a missing image once, however many spawns want it.
+
+        Concurrent callers in this process wait for the load already in
+        progress; other processes on the host are kept out by a lock file
+        and find the image loaded once they get it.
+        """
+        return self._image_pulls.do(image_meta['id'],
+                                    self._fetch_image_locked,
+                                    context, image_meta, instance)
+
+    def _fetch_image_locked(self, context, image_meta, instance):
+        @utils.synchronized('docker-image-%s' % image_meta['id'],
+                            external=True)
+        def fetch():
+            try:
+                info = self.docker.inspect_image(
+                    self._encode_utf8(image_meta['name']))
+            except errors.APIError:
+                info = None
+            if info:
+                return info
+            return self._pull_missing_image(context, image_meta, instance)
+        return fetch()
+
+    def _stream_image(self, context, image_meta):
+        """Load a Glance image into Docker without a temporary file."""
+        image_service, image_id = glance.get_remote_image_service(
+            context, image_meta['id'])
+        chunks = image_service.download(context, image_id)
+        self.docker.load_image(imagestream.verified_stream(
+            chunks, image_id=image_id, checksum=image_meta.get('checksum'),
+            max_chunks=CONF.docker.image_stream_buffer_chunks))
+
     def _pull_missing_image(self, context, image_meta, instance):
         msg = 'Image name "%s" does not exist, fetching it...'
         LOG.debug(msg % image_meta['name'])
 
+        if CONF.docker.image_stream:
+            start = time.time()
+            try:
+                self._stream_image(context, image_meta)
+                metrics.histogram('image_stream_load_time').observe(
+                    time.time() - start)
+                return self.docker.inspect_image(
+                    self._encode_utf8(image_meta['name']))
+            except Exception as e:
+                metrics.counter('image_stream_fallbacks').inc()
+                LOG.warning(_('Streaming load of image %(name)s failed, '
+                              'falling back to a temporary file: %(err)s'),
+                            {'name': image_meta['name'], 'err': e})
+
         # passing but that seems a bit complex right now.
         snapshot_directory = CONF.docker.snapshots_directory
         #if snapshot is not existed,create it.
@@ -389,41 +787,95 @@ class DockerDriver(driver.ComputeDriver):
 
         return self.docker.inspect_image(self._encode_utf8(image_meta['name']))
 
+    def manage_image_cache(self, context, all_instances):
+        """Evict unused images over budget and prefetch wanted ones."""
+        self._image_cache.run(context)
+
     def spawn(self, context, instance, image_meta, injected_files,
               admin_password, network_info=None, block_device_info=None):
+        # The image, the host side of the VIFs and the CPUs of the
+        # container do not depend on each other: only the stages which
+        # need the container wait for them.
+        stages = pipeline.Pipeline('spawn')
+        stages.start('image', self._prepare_image, context, instance,
+                     image_meta)
+        stages.start('cpuset', self._get_cpu_set, instance)
+        if network_info:
+            stages.start('plug', self.plug_vifs, instance, network_info)
+        try:
+            image_name, image_inspect_info = stages.wait('image')
+            stages.start('volumes', self._create_volume_containers,
+                         instance, image_name, image_meta, network_info)
+            args = self._create_container_args(
+                instance, image_meta, image_inspect_info, network_info,
+                block_device_info, cpuset=stages.wait('cpuset'))
+            if stages.wait('volumes'):
+                args['volumes_from'] = instance['name'] + '_vol'
+
+            container_id = stages.run('create', self._create_container,
+                                      instance, image_name, args)
+            if not container_id:
+                raise exception.InstanceDeployFailure(
+                    _('Cannot create container'),
+                    instance_id=instance['name'])
 
-        #get Image and image info.
+            if network_info:
+                stages.wait('plug')
+            #self.resize_container_disk(instance, "test")
+            stages.run('start', self._start_container, container_id,
+                       instance, network_info, plugged=True)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                stages.wait_all()
+                self._abort_spawn(instance, network_info)
+                LOG.warning(_('Spawn failed after %(total).1fs: %(stages)s'),
+                            {'total': stages.finish(),
+                             'stages': stages.summary()},
+                            instance=instance)
+        LOG.info(_('Spawned in %(total).1fs: %(stages)s'),
+                 {'total': stages.finish(), 'stages': stages.summary()},
+                 instance=instance)
+
+    def _prepare_image(self, context, instance, image_meta):
+        """Make the image of an instance available locally.
+
+        :returns: (image name, image inspect info)
+        """
         image_name = self._get_image_name(context, instance, image_meta)
         try:
             image_inspect_info = self.docker.inspect_image(image_name)
         except errors.APIError:
             image_inspect_info = None
+        self._image_cache.record_lookup(image_meta,
+                                        hit=bool(image_inspect_info))
         if not image_inspect_info:
-            image_inspect_info = self._pull_missing_image(context, image_meta, instance)
+            image_inspect_info = self._fetch_image(context, image_meta, instance)
 
         self._tag_image_name(image_meta, image_name)
+        return image_name, image_inspect_info
 
-        args = self._create_container_args(instance, image_meta, image_inspect_info, network_info, block_device_info)
-        have_vol = self._create_volume_containers(instance, image_name, image_meta, network_info)
-        if have_vol:
-            vol_ct_name =  instance['name'] + '_vol'
-            args['volumes_from'] = vol_ct_name
-
-        container_id = self._create_container(instance, image_name, args)
-        if not container_id:
-            raise exception.InstanceDeployFailure(
-                _('Cannot create container'),
-                instance_id=instance['name'])
-
-        #self.resize_container_disk(instance, "test")
-        self._start_container(container_id, instance, network_info)
+    def _abort_spawn(self, instance, network_info):
+        """Undo the plug and cpuset stages of a failed spawn.
 
-    def _create_container_args(self, instance, image_meta, image_inspect_info, network_info=None, block_device_info=None):
+        A start which failed to set up the network has unplugged the VIFs
+        already; unplugging them again finds nothing left to delete.
+        """
+        if network_info:
+            try:
+                self.unplug_vifs(instance, network_info)
+            except Exception:
+                LOG.exception(_('Cannot roll back the VIFs'),
+                              instance=instance)
+        self._release_cpu_set(instance)
+
+    def _create_container_args(self, instance, image_meta, image_inspect_info, network_info=None, block_device_info=None, cpuset=None):
+        if cpuset is None:
+            cpuset = self._get_cpu_set(instance)
         args = {
             'hostname': instance['hostname'],
             'mem_limit': self._get_memory_limit_bytes(instance),
             'cpu_shares': self._get_cpu_shares(instance),
-            'cpuset': self._get_cpu_set(instance),
+            'cpuset': cpuset,
             'network_mode': 'none',
             'privileged': True,
         }
@@ -440,6 +892,10 @@ class DockerDriver(driver.ComputeDriver):
             pass
             #FIXME: it's not nice to set all metadata to container env.
             #args['environment'] = nova_utils.instance_meta(instance)
+        # Lets the resource ledger tell the containers of instances and
+        # their vCPUs apart after a restart.
+        args['environment'] = commitment.instance_env(
+            instance, flavors.extract_flavor(instance)['vcpus'])
 
         dns_list = network.find_dns(network_info)
         if not dns_list:
@@ -479,8 +935,9 @@ class DockerDriver(driver.ComputeDriver):
             all_volumes.append(other_volume)
             all_binds.append(other_bind)
 
-        self.docker.create_container(image_name, name=vol_ct_name, network_disabled=True,volumes=all_volumes,
+        vol_ct = self.docker.create_container(image_name, name=vol_ct_name, network_disabled=True,volumes=all_volumes,
                                      host_config=self.docker.create_host_config(binds=all_binds))
+        self._index.refresh(vol_ct)
         return True
 
     def _destroy_volume_container(self,instance, network_info=None):
@@ -489,6 +946,7 @@ class DockerDriver(driver.ComputeDriver):
         vol_ct_name = nova_name + '_vol'
         if self._exist_container(vol_ct_name):
             self.docker.remove_container(vol_ct_name, force=True, v=True)
+            self._forget_container(vol_ct_name)
             host_dir = CONF.docker.dir_volume_path
             log_host_dir = host_dir + '/log/' + nova_name + '_' + first_ip
             data_host_dir = host_dir + '/data/' + nova_name + '_' + first_ip
@@ -513,16 +971,19 @@ class DockerDriver(driver.ComputeDriver):
         environment = args.pop('environment', None)
         command = args.pop('command', None)
         host_config = docker_utils.create_host_config(**args)
-        return self.docker.create_container(image_name,
-                                            name=self._encode_utf8(name),
-                                            hostname=hostname,
-                                            cpu_shares=cpu_shares,
-                                            cpuset=cpuset,
-                                            environment=environment,
-                                            command=command,
-                                            host_config=host_config)
-
-    def _start_container(self, container_id, instance, network_info=None):
+        container = self.docker.create_container(image_name,
+                                                 name=self._encode_utf8(name),
+                                                 hostname=hostname,
+                                                 cpu_shares=cpu_shares,
+                                                 cpuset=cpuset,
+                                                 environment=environment,
+                                                 command=command,
+                                                 host_config=host_config)
+        self._index.refresh(container)
+        return container
+
+    def _start_container(self, container_id, instance, network_info=None,
+                         plugged=False):
         #get mem_list/network_mode/privileged/dns/cpuset/cpu_shares
         mem_limit = self._get_memory_limit_bytes(instance)
         network_mode = 'none'
@@ -543,17 +1004,21 @@ class DockerDriver(driver.ComputeDriver):
             network_mode=network_mode, privileged=privileged,
             dns=dns_list, cpu_shares=cpu_shares, cpuset=cpuset,
             volumes_from=volumes_from)
+        self._invalidate_container(container_id)
+        self._set_cpuset_mems(container_id, cpuset)
+        self._record_commitment(instance, container_id, mem_limit, cpuset)
 
         if not network_info:
             return
         try:
-            self.plug_vifs(instance, network_info)
-            self._attach_vifs(instance, network_info)
+            self._setup_network(instance, network_info, plugged)
         except Exception as e:
             LOG.warning(_('Cannot setup network: %s'),
                         e, instance=instance, exc_info=True)
             msg = _('Cannot setup network: {0}')
             self.docker.kill(container_id)
+            self._invalidate_container(container_id)
+            self._release_cpu_set(instance)
             # Why destroy container here!! it's Dangerous.
             #self.docker.remove_container(container_id, force=True)
             raise exception.InstanceDeployFailure(msg.format(e),
@@ -569,6 +1034,9 @@ class DockerDriver(driver.ComputeDriver):
                 raise
             self.docker.unpause(container_id)
             self.docker.stop(container_id, timeout)
+        finally:
+            self._invalidate_container(container_id)
+            self._release_cpu_set(instance)
 
     #destroy container network
     def _network_delete(self, instance, network_info, container_id):
@@ -586,11 +1054,14 @@ class DockerDriver(driver.ComputeDriver):
     def cleanup(self, context, instance, network_info, block_device_info=None,
                 destroy_disks=True):
         """Cleanup after instance being destroyed by Hypervisor."""
+        self._release_cpu_set(instance)
         container_id = self._get_container_id(instance)
         if not container_id:
             self.unplug_vifs(instance, network_info)
             return
         self.docker.remove_container(container_id, force=True)
+        self._forget_container(container_id)
+        self._commitments.release(instance['name'])
         self._network_delete(instance, network_info, container_id)
 
     def destroy(self, context, instance, network_info, block_device_info=None,
@@ -632,6 +1103,7 @@ class DockerDriver(driver.ComputeDriver):
         try:
             container_id = self._get_container_id(instance)
             self.docker.pause(container_id)
+            self._invalidate_container(container_id)
         except Exception as e:
             msg = _('Cannot pause container: {0}')
             raise exception.NovaException(msg.format(e),
@@ -645,6 +1117,7 @@ class DockerDriver(driver.ComputeDriver):
         try:
             container_id = self._get_container_id(instance)
             self.docker.unpause(container_id)
+            self._invalidate_container(container_id)
         except Exception as e:
             msg = _('Cannot unpause container: {0}')
             raise exception.NovaException(msg.format(e),
@@ -702,18 +1175,51 @@ class DockerDriver(driver.ComputeDriver):
         if instance['os_type']:
             metadata['properties']['os_type'] = instance['os_type']
 
+        raw = None
         try:
             raw = self.docker.get_image(commit_name)
-            # Patch the seek/tell as urllib3 throws UnsupportedOperation
-            raw.seek = lambda x=None, y=None: None
-            raw.tell = lambda: None
-            image_service.update(context, image_href, metadata, raw)
+            stream = imagestream.UploadStream(
+                raw, chunk_size=CONF.docker.snapshot_chunk_size,
+                compress=CONF.docker.snapshot_compression,
+                progress=functools.partial(self._snapshot_progress, context,
+                                           instance, image_id),
+                progress_interval=CONF.docker.snapshot_progress_interval)
+            if stream.compressed:
+                metadata['properties']['docker_compression'] = 'gzip'
+            image_service.update(context, image_href, metadata, stream)
+            uploaded = image_service.show(context, image_id)
+            if (uploaded.get('checksum') and
+                    uploaded['checksum'] != stream.checksum):
+                raise imagestream.ChecksumMismatch(
+                    image_id=image_id, actual=uploaded['checksum'],
+                    expected=stream.checksum)
         except Exception as e:
             LOG.debug(_('Error saving image: %s'),
                       e, instance=instance, exc_info=True)
             msg = _('Error saving image: {0}')
             raise exception.NovaException(msg.format(e),
                                           instance_id=instance['name'])
+        finally:
+            if raw is not None:
+                imagestream.close_stream(raw)
+
+    def _snapshot_progress(self, context, instance, image_id,
+                           bytes_read, bytes_sent, elapsed, done):
+        rate = bytes_read / elapsed if elapsed else 0
+        payload = {'instance_id': instance['uuid'],
+                   'image_id': image_id,
+                   'bytes_read': bytes_read,
+                   'bytes_sent': bytes_sent,
+                   'bytes_per_second': rate,
+                   'done': done}
+        LOG.debug('Snapshot upload of %(image_id)s: %(bytes_read)d bytes '
+                  'read, %(bytes_sent)d sent, %(bytes_per_second).0f B/s',
+                  payload, instance=instance)
+        if done:
+            metrics.counter('snapshot_upload_bytes').inc(bytes_sent)
+            metrics.histogram('snapshot_upload_time').observe(elapsed)
+        rpc.get_notifier('compute', CONF.host).info(
+            context, 'compute.instance.snapshot.progress', payload)
 
     def _get_cpu_shares(self, instance):
         """Get allocated CPUs from configured flavor.
@@ -743,24 +1249,45 @@ class DockerDriver(driver.ComputeDriver):
         if cpu_mode == 'cpuset' or cpu_mode == 'mix':
             flavor = flavors.extract_flavor(instance)
             cpu_num = int(flavor['vcpus'])
-            cpustats = cpuset_info.CpusetStatsMap(system_cpuset)
-            cpustats.get_map()
-            ori_list = cpustats.less_set_cpus(cpu_num)
-            set_str = ori_list[0][3:]
-            for cpu in ori_list[1:]:
-                set_str = set_str  +  ',' +  cpu[3:]
-            return set_str
+            # The allocation is kept until the container stops, so the
+            # create and the start of a container agree on its CPUs.
+            cpus = self.cpu_ledger.allocate(instance['name'], cpu_num)
+            return cpuset_info.format_cpuset(cpus)
         else:
             if system_cpuset != '-1':
-                cpustats = cpuset_info.CpusetStatsMap(system_cpuset)
-                ori_list = cpustats.get_unsystem_cpu()
-                set_str = ori_list[0][3:]
-                for cpu in ori_list[1:]:
-                    set_str = set_str  +  ',' +  cpu[3:]
-                return set_str
+                return cpuset_info.format_cpuset(
+                    self.cpu_ledger.usable_cpus())
             else:
                 return
 
+    def _set_cpuset_mems(self, container_id, cpuset):
+        if (not cpuset or
+                CONF.docker.docker_cpu_mode not in ('cpuset', 'mix')):
+            return
+        cpus = cpuset_info.parse_cpuset(cpuset)
+        mems = self.cpu_ledger.mems_for(cpus)
+        if not mems:
+            return
+        try:
+            self.cpu_ledger.set_mems(
+                container_index.container_ref(container_id), mems)
+        except Exception as e:
+            LOG.warning(_('Cannot set cpuset.mems of container %(id)s: '
+                          '%(err)s'),
+                        {'id': container_id, 'err': e})
+
+    def _record_commitment(self, instance, container_id, mem_limit, cpuset):
+        pinned = CONF.docker.docker_cpu_mode in ('cpuset', 'mix')
+        vcpus = flavors.extract_flavor(instance)['vcpus']
+        self._commitments.record(
+            instance['name'], container_index.container_ref(container_id),
+            vcpus, mem_limit,
+            cpuset_info.parse_cpuset(cpuset) if cpuset and pinned else ())
+
+    def _release_cpu_set(self, instance):
+        if self._cpu_ledger is not None:
+            self._cpu_ledger.release(instance['name'])
+
     def get_host_uptime(self, host):
         return hostutils.sys_uptime()
 
@@ -769,20 +1296,7 @@ class DockerDriver(driver.ComputeDriver):
         """ get information
         :return: A dict
         """
-        monitor_info = {}
-        cpu_info = host_monitor.get_cpu_info()
-        mem_info = host_monitor.get_mem_info()
-        disk_info = host_monitor.get_disk_info()
-        bios_info = host_monitor.get_bios_info()
-        chassis_info = host_monitor.get_chassis_info()
-        soft_info = host_monitor.get_software_info()
-        monitor_info["cpu_info"] = cpu_info
-        monitor_info["mem_info"] = mem_info
-        monitor_info["disk_info"] = disk_info
-        monitor_info["bios_info"] = bios_info
-        monitor_info["chassis_info"] = chassis_info
-        monitor_info["soft_info"] = soft_info
-        return monitor_info
+        return self._inventory.collect()
 
     def _encode_utf8(self, value):
         return unicode(value).encode('utf-8')
@@ -813,15 +1327,26 @@ class DockerDriver(driver.ComputeDriver):
                 raise exception.InstanceFaultRollback(
                     exception.ResizeError(reason=reason))
 
+        image_tar_name = migrate_src + instance['name'] + '.tar'
         try:
+            if CONF.docker.migration_transport == 'stream':
+                # Straight into the destination's Docker, nothing is
+                # written to disk and finish_migration has nothing to load.
+                self._stream_migration(instance, container_id, dest,
+                                       timeout, retry_interval)
+                return None
+
+            self.docker.commit(container = container_id, repository= instance['name'], tag='latest')
             #commit to migrate_src
             utils.execute('mkdir', '-p', migrate_src)
-            self.docker.commit(container = container_id, repository= instance['name'], tag='latest')
             image = self.docker.get_image(image=instance['name'])
-            image_tar_name = migrate_src + instance['name']+ '.tar'
-            image_tar = open(image_tar_name, 'w')
-            image_tar.write(image.data)
-            image_tar.close()
+            try:
+                with open(image_tar_name, 'w') as image_tar:
+                    for chunk in iter(lambda: image.read(
+                            CONF.docker.migration_chunk_size), ''):
+                        image_tar.write(chunk)
+            finally:
+                imagestream.close_stream(image)
 
             #Stop the Container
             self.power_off(instance, timeout, retry_interval)
@@ -830,11 +1355,47 @@ class DockerDriver(driver.ComputeDriver):
             hostutils.copy_image(migrate_src, migrate_dest, host=dest)
         except Exception:
             with excutils.save_and_reraise_exception():
-                self._cleanup_migration(dest, image_tar_name, image_name = instance['name'])
+                self._cleanup_migration(image_tar_name, image_name = instance['name'])
 
         return None
 
 
+    def _send_migration_image(self, image, dest, incremental):
+        skip = None
+        if incremental:
+            skip = migration.remote_layers(dest)
+        return migration.stream_image(self.docker, image, dest,
+                                      skip_layers=skip)
+
+    def _stream_migration(self, instance, container_id, dest, timeout,
+                          retry_interval):
+        name = instance['name']
+        if not CONF.docker.migration_precopy:
+            self.docker.commit(container=container_id, repository=name,
+                               tag='latest')
+            self._send_migration_image(name, dest,
+                                       CONF.docker.migration_incremental)
+            self.power_off(instance, timeout, retry_interval)
+            return
+
+        # Phase one, the container still runs: send the image it was
+        # created from, minus the layers the destination already has.
+        base_image = self._find_container_by_name(name).get('Image')
+        if base_image:
+            self._send_migration_image(base_image, dest, True)
+
+        # Phase two: stop, commit the final state and send what the
+        # destination still lacks, i.e. the container's writable layer.
+        stopped = time.time()
+        self.power_off(instance, timeout, retry_interval)
+        self.docker.commit(container=container_id, repository=name,
+                           tag='latest')
+        self._send_migration_image(name, dest, True)
+        downtime = time.time() - stopped
+        metrics.histogram('migration_precopy_downtime').observe(downtime)
+        LOG.info(_('Container stopped for %.1fs during migration'),
+                 downtime, instance=instance)
+
     def _cleanup_migration(self, migrate_src, image_name):
         """Used only for cleanup in case migrate_disk_and_power_off fails."""
         try:
@@ -854,11 +1415,12 @@ class DockerDriver(driver.ComputeDriver):
         image_name = instance['name']
         image_tar_name = migrate_dest + image_name + '.tar'
 
-        #get Image and image info
-        self.docker.load_repository_file(
-                    image_name,
-                    image_tar_name
-                )
+        #get Image and image info, a streamed image is already loaded.
+        if os.path.exists(image_tar_name):
+            self.docker.load_repository_file(
+                        image_name,
+                        image_tar_name
+                    )
         image_inspect_info = self.docker.inspect_image(image_name)
 
         args = self._create_container_args(instance, image_meta, image_inspect_info, network_info, block_device_info)
@@ -870,7 +1432,8 @@ class DockerDriver(driver.ComputeDriver):
 
         #self.resize_container_disk(instance, "test")
         self._start_container(container_id, instance, network_info)
-        utils.execute('rm', '-rf', image_tar_name, delay_on_retry=True,
+        if os.path.exists(image_tar_name):
+            utils.execute('rm', '-rf', image_tar_name, delay_on_retry=True,
                           attempts=5)
 
     def confirm_migration(self, migration, instance, network_info):
@@ -886,6 +1449,7 @@ class DockerDriver(driver.ComputeDriver):
             return
         self._stop_container(container_id, instance, 10)
         self.docker.remove_container(container_id, force=True)
+        self._forget_container(container_id)
         self._network_delete(instance, network_info, container_id)
 
 
@@ -919,39 +1483,33 @@ class ContainerUtils(object):
     """ tools for container """
     def __init__(self):
         self._docker = None
+        self._own_index = None
 
     @property
     def docker(self):
         if self._docker is None:
-            self._docker = docker_client.DockerHTTPClient(CONF.docker.host_url,
-                                                          api_version=CONF.docker.api_version,
-                                                          api_timeout=CONF.docker.api_timeout)
+            self._docker = docker_client.get_client(CONF.docker.host_url,
+                                                    api_version=CONF.docker.api_version,
+                                                    api_timeout=CONF.docker.api_timeout)
         return self._docker
 
+    @property
+    def index(self):
+        # Share the driver's index when one is registered, so lookups made
+        # by the VIF drivers are served from the same event-fed cache.
+        index = container_index.get_registered()
+        if index is not None:
+            return index
+        if self._own_index is None:
+            self._own_index = container_index.ContainerIndex(
+                lambda: self.docker)
+        return self._own_index
+
     def get_container_id(self, instance):
        return self.find_container_by_name(instance['name']).get('Id')
 
     def find_container_by_name(self, name):
-        try:
-            containers = self.docker.containers(all=True, filters={'name': name})
-            for ct in containers:
-                if ct and ct['Names'][0][1:] == name:
-                    return self.docker.inspect_container(ct['Id'])
-        except errors.APIError as e:
-            if e.response.status_code != 404:
-                raise
-        return {}
+        return self.index.inspect(name)
 
     def container_is_running(self, instance):
-        name = instance['name']
-        try:
-            containers = self.docker.containers(all=True, filters={'name': name})
-            for ct in containers:
-                if ct and ct['Names'][0][1:] == name:
-                    if 'Up' in ct['Status']:
-                        return True
-                    else:
-                        return False
-        except errors.APIError as e:
-            if e.response.status_code != 404:
-                raise
\ No newline at end of file
+        return self.index.is_running(instance['name'])
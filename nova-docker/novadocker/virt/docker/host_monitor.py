@@ -18,153 +18,234 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+"""
+Host hardware and software information for get_monitor_info.
+
+The get_*_info functions run the tools and parse their output; the
+parse_* functions only turn outputs already captured into the
+get_monitor_info fields, through hostparsers, so that a caller such as
+the inventory collector can run each tool once and share its output.
+"""
+
 import os
 import sys
-import commands
 
+from oslo.utils import units
+
+from nova.openstack.common import processutils
 from nova import utils
+from novadocker.virt.docker import hostfacts
+from novadocker.virt.docker import hostparsers
+
+DMI_BIOS = 0
+DMI_CHASSIS = 3
+DMI_PROCESSOR = 4
+DMI_MEMORY_DEVICE = 17
+
+# dmidecode -t keywords collected
+DMI_KEYWORDS = ('bios', 'chassis', 'memory', 'processor')
 
 
 def execute(*args, **kwargs):
     return utils.execute(*args, **kwargs)
 
+
+def _first_word(value):
+    words = value.split()
+    return words[0] if words else ''
+
+
+def dmidecode(*keywords):
+    """Run dmidecode once for every keyword.
+
+    :returns: list of hostparsers.DmiRecord
+    """
+    args = []
+    for keyword in keywords:
+        args.extend(['-t', keyword])
+    out, err = execute('dmidecode', *args, run_as_root=True)
+    return hostparsers.parse_dmidecode(out)
+
+
+def parse_cpu_info(lscpu_out, dmi):
+    cpu = hostparsers.parse_lscpu(lscpu_out)
+    cpu_info = {}
+    cpu_info["arch"] = cpu.architecture
+    cpu_info["vendor"] = cpu.vendor
+    cpu_info["cpus"] = cpu.fields.get('CPU(s)', '')
+    cpu_info["socket"] = cpu.fields.get('Socket(s)', '')
+    cpu_info["core_per_socket"] = cpu.fields.get('Core(s) per socket', '')
+    cpu_info["thread_per_core"] = cpu.fields.get('Thread(s) per core', '')
+    cpu_info["numa_nodes"] = cpu.fields.get('NUMA node(s)', '')
+    cpu_info["cpu_mhz"] = cpu.fields.get('CPU MHz', '')
+    cpu_info["virtualization"] = cpu.virtualization
+    cpu_info["version"] = hostparsers.dmi_value(dmi, DMI_PROCESSOR, 'Version')
+    return cpu_info
+
+
 # add by liuhaibin for get cpu information 2016-03-01
 def get_cpu_info():
     """Get host cpu info .. add by syswin liuhaibin"""
-    cpu_info = {}   
     out, err = execute("lscpu", run_as_root=True)
-    out_ret = out.split('\n')
-    cpu_info["arch"] = out_ret[0].split(':')[1].lstrip()
-    cpu_info["vendor"]  = out_ret[9].split(':')[1].lstrip()
-    cpu_info["cpus"] = out_ret[3].split(':')[1].lstrip()
-    cpu_info["socket"] = out_ret[7].split(':')[1].lstrip()
-    cpu_info["core_per_socket"] = out_ret[6].split(':')[1].lstrip()
-    cpu_info["thread_per_core"] = out_ret[5].split(':')[1].lstrip()
-    cpu_info["numa_nodes"] = out_ret[8].split(':')[1].lstrip()
-    cpu_info["cpu_mhz"] = out_ret[13].split(':')[1].lstrip()
-    cpu_info["virtualization"] = out_ret[15].split(':')[1].lstrip()
-    out_version, err = execute("dmidecode", "-t", "processor", run_as_root=True)
-    status, output = commands.getstatusoutput("echo '%s'|grep Version|awk -F':' 'NR==1 {print $2}'"%(out_version))
-    cpu_info["version"] = output.lstrip()
-    return cpu_info
+    return parse_cpu_info(out, dmidecode('processor'))
+
+
+def parse_mem_info(dmi):
+    mem_info = {}
+    # Same figures as 'free -g': total, and free counting buffers/cache.
+    memory = hostfacts.memory_usage()
+    mem_info["total"] = str(memory['total'] // units.Gi)
+    mem_info["free"] = str(memory['available'] // units.Gi)
+    slots = hostparsers.dmi_records(dmi, DMI_MEMORY_DEVICE)
+    mem_info["total_slots"] = str(len(slots))
+    mem_info["unused_slots"] = str(len(
+        [slot for slot in slots
+         if slot.properties.get('Rank') == 'Unknown']))
+    return mem_info
 
 
 # add by liuhaibin for get memory information 2016-03-01
 def get_mem_info():
     """Get host memory info .. add by syswin liuhaibin"""
-    mem_info = {}
-    status, output_total = commands.getstatusoutput("free -g|awk 'NR==2{print $2}'")
-    status, output_free = commands.getstatusoutput("free -g|awk 'NR==3{print $4}'")
-    mem_info["total"] = output_total
-    mem_info["free"] = output_free
-    out_mem, err = execute("dmidecode", "-t", "memory", run_as_root=True)
-    
-    mem_info["total_slots"] = commands.getstatusoutput("echo '%s' |grep 'Memory Device'|wc -l" %(out_mem))[1]
-    mem_info["unused_slots"] = commands.getstatusoutput("echo '%s' |grep 'Rank: Unknown'|wc -l" %(out_mem))[1]
-    
-    return mem_info
+    return parse_mem_info(dmidecode('memory'))
 
-   
-# add by liuhaibin for get disk information 2016-03-01
-def get_disk_info():
-    """Get host disk info ... add by syswin liuhaibin"""
+
+def chassis_vendor(dmi):
+    return _first_word(hostparsers.dmi_value(dmi, DMI_CHASSIS,
+                                             'Manufacturer'))
+
+
+def disk_command(vendor):
+    """The command listing the physical disks on hosts of vendor, or None."""
+    if vendor == "Inspur":
+        return ("storcli64", "/c0/eall/sall", "show")
+    elif vendor == "HP":
+        return ("hpssacli", "controller", "slot=0", "physicaldrive", "all",
+                "show", "status")
+
+
+def parse_disk_info(vendor, out):
     disk_info = {}
-    out_vendor, err = execute("dmidecode", "-t", "chassis", run_as_root=True)
-    status, output = commands.getstatusoutput("echo '%s' | grep Manufacturer|awk '{print $2}'"%(out_vendor))
     disk_info["disk_map"] = []
     disk_info["disk_size"] = []
     disk_info["disk_type"] = []
     disk_info["disk_state"] = []
-    
-    if output == "Inspur":
-        out_disk, err = execute("storcli64", "/c0/eall/sall", "show", run_as_root=True)
-        output_disk = commands.getstatusoutput("echo '%s'|grep -A 10  EID:Slt|sed -n '1,2!{$!p}'"%(out_disk))[1]
-        disk_info["num"] = commands.getstatusoutput("echo '%s' |wc -l" %(output_disk))[1]
-        for i in range(1,int(disk_info["num"])+1):
-            status, output_map = commands.getstatusoutput("echo '%s'|sed -n $'%s',1p|awk '{print $1}'" %(output_disk,i))
-            disk_info["disk_map"].append(output_map)
-            status, output_size = commands.getstatusoutput("echo '%s'|sed -n $'%s',1p|awk '{print $5}'" %(output_disk,i))
-            disk_info["disk_size"].append(output_size)
-            status, output_type = commands.getstatusoutput("echo '%s'|sed -n $'%s',1p|awk '{print $7}'" %(output_disk,i))
-            disk_info["disk_type"].append(output_type)
-            status, output_state = commands.getstatusoutput("echo '%s'|sed -n $'%s',1p|awk '{print $3}'" %(output_disk,i))
-            disk_info["disk_state"].append(output_state)
-        
-    elif output == "HP":
-        out_disk, err = execute("hpssacli", "controller", "slot=0", "physicaldrive", "all", "show", "status", run_as_root=True)
-        output_disk = commands.getstatusoutput("echo '%s'|grep physicaldrive"%(out_disk))[1]
-        disk_info["num"] = commands.getstatusoutput("echo '%s' |wc -l" %(output_disk))[1]
-        for i in range(1,int(disk_info["num"])+1):
-            status, output_map = commands.getstatusoutput("echo '%s'|sed -n $'%s',1p|awk '{print $2}'" %(output_disk,i))
-            disk_info["disk_map"].append(output_map)
-            status, output_size = commands.getstatusoutput("echo '%s'|sed -n $'%s',1p|awk '{print $7}'" %(output_disk,i))
-            disk_info["disk_size"].append(output_size)
+
+    if vendor == "Inspur":
+        drives = hostparsers.parse_storcli_drives(out)
+        for drive in drives:
+            disk_info["disk_map"].append(drive.slot)
+            disk_info["disk_size"].append(_first_word(drive.size))
+            disk_info["disk_type"].append(drive.interface)
+            disk_info["disk_state"].append(drive.state)
+        disk_info["num"] = str(len(drives))
+
+    elif vendor == "HP":
+        drives = hostparsers.parse_hpssacli_drives(out)
+        for drive in drives:
+            disk_info["disk_map"].append(drive.location)
+            disk_info["disk_size"].append(_first_word(drive.size))
             disk_info["disk_type"].append("")
-            status, output_state = commands.getstatusoutput("echo '%s'|sed -n $'%s',1p|awk '{print $9}'" %(output_disk,i))
-            disk_info["disk_state"].append(output_state)
-       
-    else:
-        pass
+            disk_info["disk_state"].append(drive.status)
+        disk_info["num"] = str(len(drives))
+
     return disk_info
-    
+
+
+# add by liuhaibin for get disk information 2016-03-01
+def get_disk_info():
+    """Get host disk info ... add by syswin liuhaibin"""
+    vendor = chassis_vendor(dmidecode('chassis'))
+    cmd = disk_command(vendor)
+    out = execute(*cmd, run_as_root=True)[0] if cmd else ''
+    return parse_disk_info(vendor, out)
+
+
+def parse_bios_info(dmi):
+    bios_info = {}
+    bios_info["vendor"] = hostparsers.dmi_value(dmi, DMI_BIOS, 'Vendor')
+    bios_info["version"] = hostparsers.dmi_value(dmi, DMI_BIOS, 'Version')
+    bios_info["runtime_size"] = _first_word(
+        hostparsers.dmi_value(dmi, DMI_BIOS, 'Runtime Size'))
+    bios_info["rom_size"] = _first_word(
+        hostparsers.dmi_value(dmi, DMI_BIOS, 'ROM Size'))
+    return bios_info
+
 
 # add by liuhaibin for get bios information 2016-03-01
 def get_bios_info():
     """Get host bios info .. add by syswin liuhaibin"""
-    bios_info = {}
-    output, err = execute("dmidecode", "-t", "bios", run_as_root=True)
-    bios_info["vendor"] = commands.getstatusoutput("echo '%s' |grep Vendor|awk -F':' '{print $2}'" %(output))[1].lstrip()
-    bios_info["version"] = commands.getstatusoutput("echo '%s' |grep Version|awk -F':' '{print $2}'" %(output))[1].lstrip()
-    bios_info["runtime_size"] = commands.getstatusoutput("echo '%s' |grep Runtime|awk '{print $3}'" %(output))[1]
-    bios_info["rom_size"] = commands.getstatusoutput("echo '%s' |grep 'ROM Size'|awk '{print $3}'" %(output))[1]
-    return bios_info
- 
+    return parse_bios_info(dmidecode('bios'))
 
-# add by liuhaibin for get chassis information 2016-03-01
-def get_chassis_info():
-    """Get host chassis info ... add by syswin liuhaibin"""
+
+def power_command(vendor):
+    """The command reading the power sensors on hosts of vendor, or None."""
+    if vendor in ("Inspur", "HP"):
+        return ("ipmitool", "sensor")
+
+
+def _reading(sensors, name):
+    sensor = sensors.get(name)
+    return sensor.reading if sensor is not None else ''
+
+
+def parse_chassis_info(dmi, sensors_out):
     chassis_info = {}
-    output, err = execute("dmidecode", "-t", "chassis", run_as_root=True)
-    chassis_info["vendor"] = commands.getstatusoutput("echo '%s' |grep Manufacturer|awk '{print $2}'" %(output))[1]
-    chassis_info["bootup_state"] = commands.getstatusoutput("echo '%s' |grep Boot-up|awk '{print $3}'" %(output))[1]
-    chassis_info["power_supply_state"] = commands.getstatusoutput("echo '%s' |grep Supply |awk '{print $4}'" %(output))[1]
-    chassis_info["thermal_state"] = commands.getstatusoutput("echo '%s' |grep Thermal |awk '{print $3}'" %(output))[1]
+    chassis_info["vendor"] = chassis_vendor(dmi)
+    chassis_info["bootup_state"] = hostparsers.dmi_value(
+        dmi, DMI_CHASSIS, 'Boot-up State')
+    chassis_info["power_supply_state"] = hostparsers.dmi_value(
+        dmi, DMI_CHASSIS, 'Power Supply State')
+    chassis_info["thermal_state"] = hostparsers.dmi_value(
+        dmi, DMI_CHASSIS, 'Thermal State')
+    sensors = hostparsers.parse_ipmi_sensors(sensors_out)
     if chassis_info["vendor"] == "Inspur":
-        output, err = execute("ipmitool", "sensor", run_as_root=True)
-        chassis_info["total_power"] = commands.getstatusoutput("echo '%s'|grep Total_Power|awk '{print $3}'"%(output))[1]
+        chassis_info["total_power"] = _reading(sensors, 'Total_Power')
         chassis_info["power1"] = "0"
         chassis_info["power2"] = "0"
-        
+
     elif chassis_info["vendor"] == "HP":
-        output1, err = execute("ipmitool", "sensor", run_as_root=True)
-        output2, err = execute("ipmitool", "sensor", run_as_root=True)
-        chassis_info["power1"] = commands.getstatusoutput("echo '%s'|grep 'Power Supply 1'|awk '{print $5}'"%(output1))[1]
-        chassis_info["power2"] = commands.getstatusoutput("echo '%s'|grep 'Power Supply 2'|awk '{print $5}'"%(output2))[1]
-        total = float(chassis_info["power1"]) + float(chassis_info["power2"])
-        chassis_info["total_power"] = str(total)
-       
+        chassis_info["power1"] = _reading(sensors, 'Power Supply 1')
+        chassis_info["power2"] = _reading(sensors, 'Power Supply 2')
+        total = sum(sensors[name].value or 0.0
+                    for name in ('Power Supply 1', 'Power Supply 2')
+                    if name in sensors)
+        chassis_info["total_power"] = str(float(total))
+
     else:
         chassis_info["total_power"] = "0"
         chassis_info["power1"] = "0"
         chassis_info["power2"] = "0"
-    
- 
+
     return chassis_info
 
 
+# add by liuhaibin for get chassis information 2016-03-01
+def get_chassis_info():
+    """Get host chassis info ... add by syswin liuhaibin"""
+    dmi = dmidecode('chassis')
+    cmd = power_command(chassis_vendor(dmi))
+    sensors = execute(*cmd, run_as_root=True)[0] if cmd else ''
+    return parse_chassis_info(dmi, sensors)
+
+
+def _version(*cmd):
+    try:
+        out, err = execute(*cmd, run_as_root=True)
+    except (processutils.ProcessExecutionError, OSError):
+        # Not every docker host has libvirt or qemu installed.
+        return ''
+    return out[:-1]
+
+
 # add by liuhaibin for get software information 2016-03-01
 def get_software_info():
     """Get software info, such as libvirt,kernel etc ..add by syswin liuhaibin"""
-   
-    soft_info={}
-    out_kernel, err = execute("uname", "-r", run_as_root=True)
-    soft_info["kernel_version"] = out_kernel[:-1]
-    out_libvirt, err = execute("libvirtd", "--version", run_as_root=True)
-    soft_info["libvirt_version"] = out_libvirt[:-1]
-    out_qemu, err = execute("qemu-kvm", "--version", run_as_root=True)
-    soft_info["qemu_version"] = out_qemu[:-1]
+    soft_info = {}
+    soft_info["kernel_version"] = os.uname()[2]
+    soft_info["libvirt_version"] = _version("libvirtd", "--version")
+    soft_info["qemu_version"] = _version("qemu-kvm", "--version")
     soft_info["python_version"] = sys.version.split('\n')[0]
-    out_system, err = execute("cat", "/etc/issue", run_as_root=True)
-    list_system = out_system.split('\n')
-    soft_info["system"] = list_system[0]
+    with open('/etc/issue') as f:
+        soft_info["system"] = f.read().split('\n')[0]
     return soft_info
@@ -0,0 +1,153 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cheap access to host facts from /proc.
+
+Static facts (CPU count, model, topology) are read once per process.
+Dynamic counters are read from /proc files that are kept open and
+re-read with seek(0), parsing only the lines that are asked for.
+"""
+
+import collections
+import threading
+
+from novadocker.virt.docker import cpu_topology
+
+HostSnapshot = collections.namedtuple(
+    'HostSnapshot', ['cpus', 'memory_total', 'memory_used',
+                     'memory_available', 'load_average'])
+
+_MEMINFO_KEYS = ('MemTotal', 'MemFree', 'Buffers', 'Cached')
+
+_lock = threading.Lock()
+_files = {}
+_static = {}
+
+
+class _ProcFile(object):
+    """A /proc file kept open and re-read from the start on every read."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def read(self):
+        for attempt in (0, 1):
+            try:
+                if self._file is None:
+                    self._file = open(self.path)
+                self._file.seek(0)
+                return self._file.read()
+            except (IOError, OSError, ValueError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except (IOError, OSError):
+                pass
+            self._file = None
+
+
+def _proc_file(path):
+    with _lock:
+        proc_file = _files.get(path)
+        if proc_file is None:
+            proc_file = _files[path] = _ProcFile(path)
+        return proc_file
+
+
+def reset():
+    """Close the cached files and forget the static facts."""
+    with _lock:
+        for proc_file in _files.values():
+            proc_file.close()
+        _files.clear()
+        _static.clear()
+
+
+def read_fields(path, keys):
+    """Return the values of the 'Key: value' lines of a /proc file.
+
+    Only the lines for keys are split, and reading stops as soon as all
+    of them have been seen.
+    """
+    wanted = set(keys)
+    values = {}
+    for line in _proc_file(path).read().splitlines():
+        key, sep, value = line.partition(':')
+        if not sep or key not in wanted:
+            continue
+        parts = value.split()
+        values[key] = parts[0] if parts else ''
+        if len(values) == len(wanted):
+            break
+    return values
+
+
+def _cpuinfo():
+    cpus = 0
+    model = None
+    with open('/proc/cpuinfo') as f:
+        for line in f.read().splitlines():
+            if line.startswith('processor'):
+                cpus += 1
+            elif model is None and line.startswith('model name'):
+                model = line.partition(':')[2].strip()
+    return {'cpus': cpus if cpus > 1 else 1, 'model_name': model}
+
+
+def static_facts():
+    """Facts which cannot change while the process runs, read once."""
+    with _lock:
+        if not _static:
+            _static.update(_cpuinfo())
+            _static['topology'] = cpu_topology.HostTopology.from_sysfs()
+        return dict(_static)
+
+
+def cpu_count():
+    return static_facts()['cpus']
+
+
+def memory_usage():
+    fields = read_fields('/proc/meminfo', _MEMINFO_KEYS)
+    total = int(fields['MemTotal'])
+    avail = (int(fields['MemFree']) + int(fields['Buffers']) +
+             int(fields['Cached']))
+    return {
+        'total': total * 1024,
+        'used': (total - avail) * 1024,
+        'available': avail * 1024,
+    }
+
+
+def load_average():
+    return tuple(float(v)
+                 for v in _proc_file('/proc/loadavg').read().split()[:3])
+
+
+def snapshot():
+    """Return a HostSnapshot of the current CPU and memory state."""
+    memory = memory_usage()
+    return HostSnapshot(cpus=cpu_count(),
+                        memory_total=memory['total'],
+                        memory_used=memory['used'],
+                        memory_available=memory['available'],
+                        load_average=load_average())
@@ -14,82 +14,27 @@
 #    under the License.
 
 import os
-import string
 
+from novadocker.virt.docker import hostfacts
+from novadocker.virt.docker import storage
 
-def get_disk_usage(docker_info):
-    driver_info = docker_info['DriverStatus']
-    data_total_num = 0
-    data_used_num = 0
-    data_total_unit = ''
-    data_used_unit = ''
 
-    for key,value in driver_info:
-        if not cmp(key, 'Data Space Total'):
-            data_total_raw = value.split()
-            data_total_num = string.atof(data_total_raw[0])
-            data_total_unit = data_total_raw[1]
-        elif not cmp(key, 'Data Space Used'):
-            data_used_raw = value.split()
-            data_used_unit = data_used_raw[1]
-            data_used_num = string.atof(data_used_raw[0])
+def get_disk_usage():
+    """Return total, used and available bytes of the Docker storage."""
+    return storage.get_probe().usage()
 
-    if data_total_unit == 'TB':
-        data_total = data_total_num * 1024 * 1024 * 1024 * 1024
-    elif data_total_unit == 'GB':
-        data_total = data_total_num * 1024 * 1024 * 1024
-    elif data_total_unit == 'MB':
-        data_total = data_total_num * 1024 * 1024
-    elif data_total_unit == 'KB':
-        data_total = data_total_num * 1024
-    else:
-        data_total = 0
 
-    if data_used_unit == 'TB':
-        data_used = data_used_num * 1024 * 1024 * 1024 * 1024
-    elif data_used_unit == 'GB':
-        data_used = data_used_num * 1024 * 1024 * 1024
-    elif data_used_unit == 'MB':
-        data_used = data_used_num * 1024 * 1024
-    elif data_used_unit == 'KB':
-        data_used = data_used_num * 1024
-    else:
-        data_used = 0
-
-    data_total = int(data_total)
-    data_used = int(data_used)
-
-    return {
-        'total': data_total,
-        'available': data_total - data_used,
-        'used': data_used
-    }
+def get_container_disk_usage(container_id):
+    """Bytes used by the writable layer of a container, None if unknown."""
+    return storage.get_probe().container_usage(container_id)
 
 
 def get_memory_usage():
-    with open('/proc/meminfo') as f:
-        m = f.read().split()
-        idx1 = m.index('MemTotal:')
-        idx2 = m.index('MemFree:')
-        idx3 = m.index('Buffers:')
-        idx4 = m.index('Cached:')
-
-        total = int(m[idx1 + 1])
-        avail = int(m[idx2 + 1]) + int(m[idx3 + 1]) + int(m[idx4 + 1])
-
-    return {
-        'total': total * 1024,
-        'used': (total - avail) * 1024
-    }
+    return hostfacts.memory_usage()
 
 def get_cpu_info():
-    with open('/proc/cpuinfo') as f:
-       pcpu_total = 0
-       m = f.read().split()
-       for i in range(len(m)):
-           if m[i] == 'processor':
-               pcpu_total = pcpu_total + 1
-    return pcpu_total if pcpu_total > 1 else 1
+    # The number of processors cannot change under us, it is read once.
+    return hostfacts.cpu_count()
 
 def get_mounts():
     with open('/proc/mounts') as f:
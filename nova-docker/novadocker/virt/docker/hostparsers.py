@@ -0,0 +1,235 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Parsers for the output of the host hardware tools.
+
+Every parser takes the text a tool printed and returns records whose
+fields are found by key, a property name or a table column header, never
+by line number or column index, so they keep working when a new version
+of a tool adds, removes or reorders lines. None of them runs a process.
+"""
+
+import collections
+import re
+
+DmiRecord = collections.namedtuple(
+    'DmiRecord', ['handle', 'type', 'name', 'properties'])
+
+CpuInfo = collections.namedtuple(
+    'CpuInfo', ['architecture', 'vendor', 'cpus', 'threads_per_core',
+                'cores_per_socket', 'sockets', 'numa_nodes', 'mhz',
+                'virtualization', 'fields'])
+
+StorcliDrive = collections.namedtuple(
+    'StorcliDrive', ['slot', 'state', 'size', 'interface', 'medium',
+                     'model', 'columns'])
+
+HpDrive = collections.namedtuple(
+    'HpDrive', ['location', 'port', 'box', 'bay', 'size', 'status'])
+
+Sensor = collections.namedtuple(
+    'Sensor', ['name', 'value', 'unit', 'status', 'reading'])
+
+_DMI_HEADER = re.compile(r'^Handle (0x[0-9A-Fa-f]+), DMI type (\d+)')
+_HP_DRIVE = re.compile(r'^\s*physicaldrive\s+(\S+)\s+\((.*)\)(?::\s*(.*?))?\s*$')
+_SIZE = re.compile(r'^[\d.]+\s*[KMGTP]B$')
+
+
+def parse_dmidecode(output):
+    """Parse dmidecode output into a list of DmiRecord.
+
+    properties maps each 'Key: value' line of a record to its value; a
+    key introducing an indented list, such as 'Characteristics:', maps to
+    the list of its items.
+    """
+    records = []
+    record = None
+    key = None
+    for line in output.splitlines():
+        match = _DMI_HEADER.match(line)
+        if match:
+            record = DmiRecord(match.group(1), int(match.group(2)), None,
+                               collections.OrderedDict())
+            records.append(record)
+            key = None
+            continue
+        if record is None or not line.strip():
+            continue
+        if not line.startswith('\t'):
+            # The line after the header names the record.
+            record = record._replace(name=line.strip())
+            records[-1] = record
+            continue
+        if line.startswith('\t\t'):
+            if isinstance(record.properties.get(key), list):
+                record.properties[key].append(line.strip())
+            continue
+        key, sep, value = line.strip().partition(':')
+        value = value.strip()
+        record.properties[key] = value if value or not sep else []
+    return records
+
+
+def dmi_records(records, *types):
+    """The records of the given DMI types, in output order."""
+    return [record for record in records if record.type in types]
+
+
+def dmi_value(records, dmi_type, key, default=''):
+    """A property of the first record of a DMI type which has it."""
+    for record in dmi_records(records, dmi_type):
+        value = record.properties.get(key)
+        if isinstance(value, basestring):
+            return value
+    return default
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_lscpu(output):
+    """Parse lscpu output into a CpuInfo, by field name."""
+    fields = collections.OrderedDict()
+    for line in output.splitlines():
+        key, sep, value = line.partition(':')
+        if sep:
+            fields[key.strip()] = value.strip()
+    return CpuInfo(architecture=fields.get('Architecture', ''),
+                   vendor=fields.get('Vendor ID', ''),
+                   cpus=_int(fields.get('CPU(s)')),
+                   threads_per_core=_int(fields.get('Thread(s) per core')),
+                   cores_per_socket=_int(fields.get('Core(s) per socket')),
+                   sockets=_int(fields.get('Socket(s)')),
+                   numa_nodes=_int(fields.get('NUMA node(s)')),
+                   mhz=_float(fields.get('CPU MHz')),
+                   virtualization=fields.get('Virtualization', ''),
+                   fields=fields)
+
+
+def _is_rule(line):
+    line = line.strip()
+    return bool(line) and not line.strip('-')
+
+
+def _storcli_columns(header, tokens):
+    # Only Size ('558.406 GB') and Model may span several tokens: the
+    # columns left of Size and between Size and Model take one each, the
+    # columns right of Model are counted from the end of the row.
+    size = header.index('Size')
+    model = header.index('Model')
+    after = len(header) - model - 1
+    if len(tokens) < len(header) + 1 or after >= len(tokens):
+        return None
+    columns = dict(zip(header[:size], tokens[:size]))
+    columns['Size'] = ' '.join(tokens[size:size + 2])
+    rest = tokens[size + 2:]
+    columns.update(zip(header[size + 1:model], rest[:model - size - 1]))
+    tail = rest[model - size - 1:]
+    columns['Model'] = ' '.join(tail[:len(tail) - after])
+    columns.update(zip(header[model + 1:], tail[len(tail) - after:]))
+    return columns
+
+
+def parse_storcli_drives(output):
+    """Parse the drive table of 'storcli64 /cX/eall/sall show'."""
+    drives = []
+    lines = output.splitlines()
+    for i, line in enumerate(lines):
+        header = line.split()
+        if 'EID:Slt' not in header:
+            continue
+        if 'Size' not in header or 'Model' not in header:
+            break
+        for row in lines[i + 1:]:
+            if _is_rule(row):
+                if drives:
+                    break
+                continue
+            if not row.strip():
+                break
+            columns = _storcli_columns(header, row.split())
+            if columns is None:
+                continue
+            drives.append(StorcliDrive(slot=columns.get('EID:Slt', ''),
+                                       state=columns.get('State', ''),
+                                       size=columns.get('Size', ''),
+                                       interface=columns.get('Intf', ''),
+                                       medium=columns.get('Med', ''),
+                                       model=columns.get('Model', ''),
+                                       columns=columns))
+        break
+    return drives
+
+
+def parse_hpssacli_drives(output):
+    """Parse 'hpssacli ... physicaldrive all show [status]'.
+
+    e.g. 'physicaldrive 1I:1:1 (port 1I:box 1:bay 1, 300 GB): OK', or
+    without 'status', 'physicaldrive 1I:1:1 (port 1I:box 1:bay 1, SAS,
+    300 GB, OK)'
+    """
+    drives = []
+    for line in output.splitlines():
+        match = _HP_DRIVE.match(line)
+        if not match:
+            continue
+        location, details, status = match.groups()
+        attrs = {}
+        size = ''
+        parts = [part.strip() for part in details.split(',')]
+        for part in parts:
+            if ':' in part:
+                for item in part.split(':'):
+                    name, _sep, value = item.strip().partition(' ')
+                    attrs[name] = value.strip()
+            elif _SIZE.match(part):
+                size = part
+        if status is None:
+            status = parts[-1] if len(parts) > 1 else ''
+        drives.append(HpDrive(location=location, port=attrs.get('port', ''),
+                              box=attrs.get('box', ''),
+                              bay=attrs.get('bay', ''),
+                              size=size, status=status))
+    return drives
+
+
+def parse_ipmi_sensors(output):
+    """Parse 'ipmitool sensor' into an ordered dict name -> Sensor.
+
+    value is the reading as a float, None for 'na'; reading is the text
+    printed.
+    """
+    sensors = collections.OrderedDict()
+    for line in output.splitlines():
+        columns = [column.strip() for column in line.split('|')]
+        if len(columns) < 3 or not columns[0]:
+            continue
+        sensors[columns[0]] = Sensor(
+            name=columns[0], value=_float(columns[1]), unit=columns[2],
+            status=columns[3] if len(columns) > 3 else '',
+            reading=columns[1])
+    return sensors
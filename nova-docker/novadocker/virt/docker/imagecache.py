@@ -0,0 +1,321 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Local Docker image cache management.
+
+The images loaded from Glance stay in the local Docker graph. This module
+keeps them within a disk budget by removing the least recently used
+images no container refers to, and warms the cache by loading ahead of
+time the images named in the configuration or spawned recently on the
+host. Sizes are computed per layer, so layers shared with other images
+are not counted as freed by a removal.
+
+It runs from the driver's manage_image_cache, i.e. the compute manager's
+image cache periodic task.
+"""
+
+import os
+import threading
+import time
+
+from oslo.config import cfg
+from oslo.serialization import jsonutils
+from oslo.utils import units
+
+from docker import errors
+from nova.i18n import _
+from nova.image import glance
+from nova.openstack.common import fileutils
+from nova.openstack.common import log
+from nova import utils
+from novadocker.virt.docker import metrics
+
+LOG = log.getLogger(__name__)
+
+imagecache_opts = [
+    cfg.IntOpt('image_cache_max_gb',
+               default=0,
+               help='Disk budget of the local Docker images in GB. Unused '
+                    'images are removed, least recently used first, while '
+                    'the images take more than this. 0 disables eviction.'),
+    cfg.ListOpt('image_prefetch',
+                default=[],
+                help='Glance image ids loaded into Docker ahead of any '
+                     'spawn, and never evicted.'),
+    cfg.IntOpt('image_prefetch_history',
+               default=0,
+               help='Number of the most recently spawned images of this '
+                    'host to keep loaded or load again ahead of time.'),
+    cfg.StrOpt('image_cache_state_file',
+               default='$instances_path/docker_image_cache.json',
+               help='File recording when each image was last used.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(imagecache_opts, 'docker')
+CONF.import_opt('instances_path', 'nova.compute.manager')
+
+
+def normalize_name(name):
+    """Return the repository:tag Docker lists an image name under."""
+    if ':' not in name.rsplit('/', 1)[-1]:
+        name += ':latest'
+    return name
+
+
+class LayerGraph(object):
+    """The image layers of the Docker graph, from images(all=True)."""
+
+    def __init__(self, images):
+        self.layers = {}
+        self.tags = {}
+        for image in images:
+            self.layers[image['Id']] = (image.get('ParentId') or None,
+                                        image.get('Size') or 0,
+                                        image.get('Created') or 0)
+            for tag in image.get('RepoTags') or ():
+                if tag != '<none>:<none>':
+                    self.tags[tag] = image['Id']
+
+    def chain(self, image_id):
+        """Return the ids of the layers an image is made of."""
+        layers = []
+        while image_id and image_id in self.layers:
+            layers.append(image_id)
+            image_id = self.layers[image_id][0]
+        return layers
+
+    def resolve(self, ref):
+        """Return the image id of a tag, id or id prefix."""
+        if ref in self.layers:
+            return ref
+        image_id = self.tags.get(normalize_name(ref))
+        if image_id:
+            return image_id
+        for image_id in self.layers:
+            if len(ref) >= 12 and image_id.startswith(ref):
+                return image_id
+
+    def total_size(self):
+        return sum(size for _parent, size, _created in self.layers.values())
+
+    def created(self, image_id):
+        return self.layers[image_id][2]
+
+
+class ImageCacheManager(object):
+    """LRU eviction and prefetching of the local Docker images."""
+
+    def __init__(self, get_client, pull):
+        """:param get_client: returns the Docker client
+        :param pull: pull(context, image_meta, instance) loads a Glance
+                     image into Docker, e.g. DockerDriver._fetch_image
+        """
+        self._get_client = get_client
+        self._pull = pull
+        self._lock = threading.Lock()
+        self._state = None
+        self._prefetching = False
+
+    @property
+    def docker(self):
+        return self._get_client()
+
+    @property
+    def state(self):
+        """name -> {'id': glance image id, 'last_used': timestamp}"""
+        if self._state is None:
+            self._state = {}
+            path = CONF.docker.image_cache_state_file
+            if os.path.exists(path):
+                try:
+                    with open(path) as f:
+                        self._state = jsonutils.loads(f.read())
+                except (IOError, ValueError) as e:
+                    LOG.warning(_('Cannot read image cache state %(path)s: '
+                                  '%(err)s'), {'path': path, 'err': e})
+        return self._state
+
+    def _save_state(self):
+        path = CONF.docker.image_cache_state_file
+        try:
+            fileutils.ensure_tree(os.path.dirname(path))
+            tmp = path + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(jsonutils.dumps(self.state))
+            os.rename(tmp, path)
+        except (IOError, OSError) as e:
+            LOG.warning(_('Cannot save image cache state %(path)s: %(err)s'),
+                        {'path': path, 'err': e})
+
+    def record_lookup(self, image_meta, hit):
+        """Count a spawn's image lookup and mark the image as used."""
+        if hit:
+            metrics.counter('image_cache_hits').inc()
+        else:
+            metrics.counter('image_cache_misses').inc()
+        with self._lock:
+            self.state[normalize_name(image_meta['name'])] = {
+                'id': image_meta.get('id'),
+                'last_used': time.time()}
+            self._save_state()
+
+    def _wanted_ids(self):
+        """Glance ids of the images to prefetch, most wanted first."""
+        wanted = list(CONF.docker.image_prefetch)
+        history = CONF.docker.image_prefetch_history
+        if history > 0:
+            with self._lock:
+                recent = sorted(self.state.values(),
+                                key=lambda s: s['last_used'], reverse=True)
+            for entry in recent[:history]:
+                if entry.get('id') and entry['id'] not in wanted:
+                    wanted.append(entry['id'])
+        return wanted
+
+    def _pinned_names(self):
+        with self._lock:
+            return set(name for name, entry in self.state.items()
+                       if entry.get('id') in CONF.docker.image_prefetch)
+
+    def evict(self):
+        """Remove unused images until the graph fits in the budget.
+
+        :returns: list of the removed image ids
+        """
+        budget = CONF.docker.image_cache_max_gb * units.Gi
+        if budget <= 0:
+            return []
+        graph = LayerGraph(self.docker.images(all=True))
+        total = graph.total_size()
+        if total <= budget:
+            return []
+
+        keep = set()
+        for ct in self.docker.containers(all=True):
+            image_id = graph.resolve(ct.get('Image') or '')
+            if image_id:
+                keep.add(image_id)
+        for name in self._pinned_names():
+            image_id = graph.resolve(name)
+            if image_id:
+                keep.add(image_id)
+
+        last_used = {}
+        with self._lock:
+            for name, entry in self.state.items():
+                image_id = graph.resolve(name)
+                if image_id:
+                    last_used[image_id] = max(last_used.get(image_id, 0),
+                                              entry['last_used'])
+        heads = set(graph.tags.values())
+        candidates = sorted(
+            (image_id for image_id in heads if image_id not in keep),
+            key=lambda i: last_used.get(i, graph.created(i)))
+
+        removed = []
+        for image_id in candidates:
+            if total <= budget:
+                break
+            others = set()
+            for head in heads:
+                if head != image_id and head not in removed:
+                    others.update(graph.chain(head))
+            freed = sum(graph.layers[layer][1]
+                        for layer in graph.chain(image_id)
+                        if layer not in others)
+            if not self._remove(graph, image_id):
+                continue
+            removed.append(image_id)
+            total -= freed
+            metrics.counter('image_cache_evictions').inc()
+            metrics.counter('image_cache_evicted_bytes').inc(freed)
+        if removed:
+            LOG.info(_('Evicted %(count)d unused images, %(total)d bytes '
+                       'of images left'),
+                     {'count': len(removed), 'total': total})
+        return removed
+
+    def _remove(self, graph, image_id):
+        tags = [tag for tag, tagged in graph.tags.items()
+                if tagged == image_id]
+        try:
+            # Removing the last tag removes the image and its layers.
+            for tag in tags:
+                self.docker.remove_image(tag)
+        except errors.APIError as e:
+            LOG.warning(_('Cannot evict image %(image)s: %(err)s'),
+                        {'image': image_id, 'err': e})
+            return False
+        with self._lock:
+            for tag in tags:
+                self.state.pop(tag, None)
+            self._save_state()
+        return True
+
+    def prefetch(self, context):
+        """Load the wanted images which are missing from Docker."""
+        loaded = []
+        image_service = glance.get_default_image_service()
+        instance = {'user_id': context.user_id,
+                    'project_id': context.project_id}
+        for image_id in self._wanted_ids():
+            try:
+                image_meta = image_service.show(context, image_id)
+                if image_meta.get('container_format') != 'docker':
+                    continue
+                name = image_meta['name']
+                with self._lock:
+                    self.state.setdefault(normalize_name(name),
+                                          {'id': image_id, 'last_used': 0})
+                if self._present(name):
+                    continue
+                LOG.info(_('Prefetching image %s'), name)
+                self._pull(context, image_meta, instance)
+                metrics.counter('image_cache_prefetches').inc()
+                loaded.append(image_id)
+            except Exception as e:
+                LOG.warning(_('Cannot prefetch image %(image)s: %(err)s'),
+                            {'image': image_id, 'err': e})
+        return loaded
+
+    def _present(self, name):
+        try:
+            return bool(self.docker.inspect_image(
+                unicode(name).encode('utf-8')))
+        except errors.APIError:
+            return False
+
+    def _prefetch_in_background(self, context):
+        try:
+            self.prefetch(context)
+        finally:
+            self._prefetching = False
+
+    def run(self, context):
+        """One cache pass: evict, then prefetch in the background."""
+        try:
+            self.evict()
+        except Exception as e:
+            LOG.warning(_('Image cache eviction failed: %s'), e)
+        if not (CONF.docker.image_prefetch or
+                CONF.docker.image_prefetch_history > 0):
+            return
+        with self._lock:
+            if self._prefetching:
+                return
+            self._prefetching = True
+        utils.spawn_n(self._prefetch_in_background, context)
@@ -0,0 +1,197 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Streaming of image data between Glance and Docker.
+
+For loads, a greenthread reads the source chunks into a bounded queue
+while the consumer, typically a chunked HTTP upload to Docker, drains it,
+so both transfers overlap and no more than a few chunks are ever held in
+memory. The MD5 checksum Glance records is verified on the fly. The last
+chunk is only handed over once the checksum matched, so a corrupted image
+never reaches the consumer complete.
+
+For exports, UploadStream wraps the Docker image export as a file-like
+object for the Glance client, optionally gzip compressing it, computing
+its checksum and reporting progress as it is read.
+"""
+
+import hashlib
+import time
+import zlib
+
+import eventlet
+from eventlet import greenthread
+from eventlet import queue
+
+from nova import exception
+from nova.i18n import _
+
+_END = object()
+
+
+def close_stream(source):
+    """Close a Docker image export, handing its connection back to the pool.
+
+    An export left unread holds a connection of the bounded API pool
+    until it is released.
+    """
+    source.close()
+    release_conn = getattr(source, 'release_conn', None)
+    if release_conn is not None:
+        release_conn()
+
+
+class ChecksumMismatch(exception.NovaException):
+    msg_fmt = _('Image %(image_id)s checksum %(actual)s does not match '
+                '%(expected)s')
+
+
+class _Failure(object):
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def _produce(chunks, buf):
+    try:
+        for chunk in chunks:
+            if chunk:
+                buf.put(chunk)
+        buf.put(_END)
+    except Exception as e:
+        buf.put(_Failure(e))
+
+
+def verified_stream(chunks, image_id=None, checksum=None, max_chunks=16):
+    """Yield the chunks of an iterable read ahead by a greenthread.
+
+    :param chunks: iterable of image data, e.g. a Glance download
+    :param checksum: expected MD5 hex digest, not verified when None
+    :param max_chunks: most chunks buffered ahead of the consumer
+    :raises ChecksumMismatch: before the last chunk, if data is corrupted
+    """
+    buf = queue.Queue(maxsize=max(max_chunks, 1))
+    producer = eventlet.spawn(_produce, chunks, buf)
+    md5 = hashlib.md5()
+    held = None
+    try:
+        while True:
+            chunk = buf.get()
+            if chunk is _END:
+                break
+            if isinstance(chunk, _Failure):
+                raise chunk.exc
+            md5.update(chunk)
+            if held is not None:
+                yield held
+            held = chunk
+        if checksum and md5.hexdigest() != checksum:
+            raise ChecksumMismatch(image_id=image_id,
+                                   actual=md5.hexdigest(),
+                                   expected=checksum)
+        if held is not None:
+            yield held
+    finally:
+        # The consumer may give up early, do not leave the reader blocked.
+        producer.kill()
+
+
+class UploadStream(object):
+    """File-like view of an image export, read in fixed size chunks.
+
+    :param source: object with read(size), e.g. the response of get_image
+    :param chunk_size: bytes read from source at a time
+    :param compress: gzip the data on the fly
+    :param progress: progress(bytes_read, bytes_sent, seconds, done)
+                     called at most every progress_interval seconds and
+                     once at the end
+    """
+
+    def __init__(self, source, chunk_size=65536, compress=False,
+                 progress=None, progress_interval=10):
+        self._source = source
+        self.chunk_size = chunk_size
+        self._compressor = (zlib.compressobj(6, zlib.DEFLATED,
+                                             16 + zlib.MAX_WBITS)
+                            if compress else None)
+        self._progress = progress
+        self._progress_interval = progress_interval
+        self._md5 = hashlib.md5()
+        self._buffer = []
+        self._buffered = 0
+        self._eof = False
+        self.bytes_read = 0
+        self.bytes_sent = 0
+        self._start = time.time()
+        self._last_report = self._start
+
+    @property
+    def compressed(self):
+        return self._compressor is not None
+
+    @property
+    def checksum(self):
+        """MD5 hex digest of the data returned so far."""
+        return self._md5.hexdigest()
+
+    # The Glance client probes the size with seek/tell, which the export
+    # response does not support; an unknown size makes it send chunked.
+    def seek(self, offset=None, whence=None):
+        pass
+
+    def tell(self):
+        return None
+
+    def _fill(self, size):
+        while not self._eof and (size < 0 or self._buffered < size):
+            chunk = self._source.read(self.chunk_size)
+            if chunk:
+                self.bytes_read += len(chunk)
+                if self._compressor:
+                    chunk = self._compressor.compress(chunk)
+            else:
+                self._eof = True
+                if self._compressor:
+                    chunk = self._compressor.flush()
+            if chunk:
+                self._buffer.append(chunk)
+                self._buffered += len(chunk)
+            # Compression is CPU bound, let other greenthreads run.
+            greenthread.sleep(0)
+
+    def read(self, size=-1):
+        self._fill(size)
+        data = ''.join(self._buffer)
+        if size < 0 or size >= len(data):
+            rest = ''
+        else:
+            data, rest = data[:size], data[size:]
+        self._buffer = [rest] if rest else []
+        self._buffered = len(rest)
+        self._md5.update(data)
+        self.bytes_sent += len(data)
+        self._report(done=self._eof and not rest)
+        return data
+
+    def _report(self, done=False):
+        if not self._progress:
+            return
+        now = time.time()
+        if done or now - self._last_report >= self._progress_interval:
+            self._last_report = now
+            self._progress(self.bytes_read, self.bytes_sent,
+                           now - self._start, done)
+            if done:
+                self._progress = None
@@ -0,0 +1,135 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cached host inventory behind get_monitor_info.
+
+Every hardware tool runs at most once per refresh: a single dmidecode
+run covers the BIOS, chassis, processor and memory records, a single
+ipmitool run the power sensors. The tools which do not depend on each
+other run concurrently. Static facts (DMI records, lscpu, software
+versions) are collected once per process; the power sensors and the disk
+states are refreshed on their own TTLs. Concurrent callers share a
+refresh in progress instead of running the tools again.
+"""
+
+import threading
+import time
+
+from eventlet import greenpool
+from oslo.config import cfg
+
+from nova.i18n import _
+from nova.openstack.common import log
+from novadocker.virt.docker import host_monitor
+from novadocker.virt.docker import metrics
+from novadocker.virt.docker import singleflight
+
+LOG = log.getLogger(__name__)
+
+inventory_opts = [
+    cfg.IntOpt('inventory_power_ttl',
+               default=60,
+               help='Seconds the power sensor readings of the host '
+                    'inventory are reused before ipmitool runs again.'),
+    cfg.IntOpt('inventory_disk_ttl',
+               default=300,
+               help='Seconds the physical disk states of the host '
+                    'inventory are reused before the RAID tool runs '
+                    'again.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(inventory_opts, 'docker')
+
+
+def _output(*cmd):
+    out, err = host_monitor.execute(*cmd, run_as_root=True)
+    return out
+
+
+class HostInventory(object):
+    """Host hardware and software information, in get_monitor_info form."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._flights = singleflight.SingleFlight('host_inventory')
+
+    def _cached(self, name, ttl, fetch, *args):
+        """Return fetch(*args), reused for ttl seconds, forever if None.
+
+        A failed refresh is not cached: the previous value is returned if
+        there is one, None otherwise.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(name)
+        if entry is not None and (ttl is None or now - entry[0] < ttl):
+            return entry[1]
+        try:
+            value = self._flights.do(name, fetch, *args)
+        except Exception as e:
+            LOG.warning(_('Cannot collect %(name)s for the host inventory: '
+                          '%(err)s'), {'name': name, 'err': e})
+            return entry[1] if entry is not None else None
+        with self._lock:
+            self._cache[name] = (now, value)
+        return value
+
+    def invalidate(self):
+        """Forget every cached output, static ones included."""
+        with self._lock:
+            self._cache.clear()
+
+    def collect(self):
+        start = time.time()
+        pool = greenpool.GreenPool()
+        dmi = pool.spawn(self._cached, 'dmidecode', None,
+                         host_monitor.dmidecode,
+                         *host_monitor.DMI_KEYWORDS)
+        lscpu = pool.spawn(self._cached, 'lscpu', None, _output, 'lscpu')
+        software = pool.spawn(self._cached, 'software', None,
+                              host_monitor.get_software_info)
+
+        # The vendor tells which tools read the disks and power sensors.
+        dmi = dmi.wait() or []
+        vendor = host_monitor.chassis_vendor(dmi)
+        disk_cmd = host_monitor.disk_command(vendor)
+        power_cmd = host_monitor.power_command(vendor)
+        disks = (pool.spawn(self._cached, 'disks',
+                            CONF.docker.inventory_disk_ttl, _output,
+                            *disk_cmd)
+                 if disk_cmd else None)
+        sensors = (pool.spawn(self._cached, 'sensors',
+                              CONF.docker.inventory_power_ttl, _output,
+                              *power_cmd)
+                   if power_cmd else None)
+
+        lscpu = lscpu.wait()
+        disks = disks.wait() if disks is not None else ''
+        sensors = sensors.wait() if sensors is not None else ''
+        monitor_info = {
+            'cpu_info': (host_monitor.parse_cpu_info(lscpu, dmi)
+                         if lscpu else {}),
+            'mem_info': host_monitor.parse_mem_info(dmi),
+            'disk_info': host_monitor.parse_disk_info(vendor, disks or ''),
+            'bios_info': host_monitor.parse_bios_info(dmi),
+            'chassis_info': host_monitor.parse_chassis_info(dmi,
+                                                            sensors or ''),
+            'soft_info': software.wait() or {},
+        }
+        metrics.histogram('host_inventory_time').observe(time.time() - start)
+        return monitor_info
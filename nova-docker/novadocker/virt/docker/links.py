@@ -0,0 +1,128 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Batched host link management for the VIF drivers.
+
+Existence checks are answered from one listing of /sys/class/net taken
+when a batch is started, instead of a stat per device. Bridges, veth
+pairs and bridge membership are queued and applied by a single
+'ip -batch' run.
+
+Every device of a VIF is named after its id, so plugging and unplugging
+the same VIF is serialized by a lock of its own while other VIFs go
+ahead concurrently. The link dump is a plain directory listing and takes
+no lock.
+"""
+
+import functools
+import os
+
+from oslo.config import cfg
+
+from nova.openstack.common import lockutils
+from nova import utils
+from novadocker.virt.docker import network
+
+CONF = cfg.CONF
+CONF.import_opt('network_device_mtu', 'nova.network.linux_net')
+
+SYS_CLASS_NET = '/sys/class/net'
+LOCK_PREFIX = 'docker-vif-links-'
+
+# Written through sysfs since older iproute2 cannot set them on creation.
+BRIDGE_SYSFS_OFF = ('forward_delay', 'stp_state', 'multicast_snooping')
+
+
+def vif_lock(vif):
+    """Lock, across processes, of the host devices of one VIF."""
+    return lockutils.lock(LOCK_PREFIX + vif['id'][:11],
+                          lock_file_prefix='nova-', external=True)
+
+
+def synchronized(func):
+    """Serialize func(self, instance, vif) with the changes of that VIF."""
+    @functools.wraps(func)
+    def wrapper(self, instance, vif, *args, **kwargs):
+        with vif_lock(vif):
+            return func(self, instance, vif, *args, **kwargs)
+    return wrapper
+
+
+def dump_links(root=SYS_CLASS_NET):
+    """Return the names of the network devices of the host."""
+    try:
+        return set(os.listdir(root))
+    except OSError:
+        return set()
+
+
+class LinkBatch(object):
+    """Link changes queued and applied by one 'ip -batch' call.
+
+    The link dump is kept up to date with the queued changes, so checks
+    made after queuing see the devices about to be created or deleted.
+    """
+
+    def __init__(self, links=None):
+        self.links = dump_links() if links is None else links
+        self.commands = []
+        self._new_bridges = []
+
+    def exists(self, name):
+        return name in self.links
+
+    def add_bridge(self, name):
+        self.commands.append(['link', 'add', 'name', name, 'type', 'bridge'])
+        self.links.add(name)
+        self._new_bridges.append(name)
+
+    def add_veth(self, name, peer, promisc=False):
+        self.commands.append(['link', 'add', 'name', name, 'type', 'veth',
+                              'peer', 'name', peer])
+        self.links.update((name, peer))
+        for dev in (name, peer):
+            self.set_up(dev)
+            if promisc:
+                self.commands.append(['link', 'set', dev, 'promisc', 'on'])
+            if CONF.network_device_mtu:
+                self.commands.append(['link', 'set', dev, 'mtu',
+                                      CONF.network_device_mtu])
+
+    def set_master(self, name, bridge):
+        self.commands.append(['link', 'set', name, 'master', bridge])
+
+    def set_up(self, name):
+        self.commands.append(['link', 'set', name, 'up'])
+
+    def set_down(self, name):
+        self.commands.append(['link', 'set', name, 'down'])
+
+    def delete(self, name):
+        self.commands.append(['link', 'delete', name])
+        self.links.discard(name)
+
+    def run(self):
+        """Apply the queued changes, at most two processes."""
+        if self.commands:
+            network.ip_batch(self.commands)
+        if self._new_bridges:
+            paths = ['/sys/class/net/%s/bridge/%s' % (bridge, attr)
+                     for bridge in self._new_bridges
+                     for attr in BRIDGE_SYSFS_OFF]
+            utils.execute('tee', *paths, process_input='0',
+                          run_as_root=True, check_exit_code=[0, 1])
+        self.commands = []
+        self._new_bridges = []
@@ -0,0 +1,103 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Process wide counters and histograms of the Docker driver.
+
+Metrics are kept in memory and exported through snapshot(), which the
+driver logs with the periodic resource report.
+"""
+
+import bisect
+import threading
+
+# Seconds, suited to latencies from a few milliseconds to tens of seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30)
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+class Counter(object):
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def as_dict(self):
+        return {'value': self.value}
+
+
+class Histogram(object):
+    """Cumulative bucket histogram, the last bucket being +Inf."""
+
+    def __init__(self, name, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def as_dict(self):
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self.count, self.sum
+        buckets = []
+        running = 0
+        for bound, hits in zip(self.buckets + ('+Inf',), counts):
+            running += hits
+            buckets.append((bound, running))
+        return {'count': count, 'sum': total, 'buckets': buckets}
+
+
+def _get(name, factory, *args):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = factory(name, *args)
+        return metric
+
+
+def counter(name):
+    return _get(name, Counter)
+
+
+def histogram(name, buckets=DEFAULT_BUCKETS):
+    return _get(name, Histogram, buckets)
+
+
+def snapshot():
+    """Return the current value of every metric, keyed by name."""
+    with _lock:
+        metrics = list(_metrics.values())
+    return dict((m.name, m.as_dict()) for m in metrics)
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
@@ -0,0 +1,216 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Image transport for cold migration.
+
+The committed image is streamed from the local Docker export straight
+into 'docker load' on the destination over ssh, the same channel the
+rsync/scp copy used. Nothing is written to disk on either side and only
+one chunk is held in memory: writes to the ssh pipe block while the
+destination catches up.
+
+The layers the destination already has, typically every layer below the
+committed one, are left out of the stream.
+"""
+
+import tarfile
+import time
+import zlib
+
+from eventlet import greenthread
+from eventlet.green import subprocess
+from oslo.config import cfg
+
+from nova.i18n import _
+from nova.openstack.common import excutils
+from nova.openstack.common import log
+from nova.openstack.common import processutils
+from nova import utils
+from novadocker.virt.docker import imagestream
+from novadocker.virt.docker import metrics
+
+LOG = log.getLogger(__name__)
+
+migration_opts = [
+    cfg.StrOpt('migration_transport',
+               default='stream',
+               help='How images are moved on cold migration: stream '
+                    '(pipe docker save into docker load on the '
+                    'destination over ssh) or file (tarball copied with '
+                    'rsync/scp).'),
+    cfg.BoolOpt('migration_compression',
+                default=True,
+                help='Gzip streamed migration images on the fly.'),
+    cfg.IntOpt('migration_chunk_size',
+               default=1024 * 1024,
+               help='Bytes sent at a time when streaming a migration '
+                    'image.'),
+    cfg.StrOpt('migration_load_command',
+               default='docker load',
+               help='Command run over ssh on the destination to load a '
+                    'streamed migration image from its standard input.'),
+    cfg.BoolOpt('migration_incremental',
+                default=True,
+                help='Only stream the image layers the destination does '
+                     'not have yet.'),
+    cfg.BoolOpt('migration_precopy',
+                default=False,
+                help='Migrate in two phases when streaming: send the '
+                     'image layers while the container still runs, then '
+                     'stop it and send only its committed writable layer, '
+                     'so downtime depends on the changed data rather than '
+                     'on the image size.'),
+    cfg.StrOpt('migration_layers_command',
+               default='docker images -a -q --no-trunc',
+               help='Command run over ssh on the destination to list the '
+                    'ids of its image layers, one per line.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(migration_opts, 'docker')
+
+
+def _ssh(host, command):
+    return ['ssh', '-o', 'BatchMode=yes', host, command]
+
+
+def remote_layers(host):
+    """Return the ids of the image layers the Docker of host already has.
+
+    An empty set, i.e. a full transfer, if they cannot be listed.
+    """
+    try:
+        out, _err = utils.execute(*_ssh(host,
+                                        CONF.docker.migration_layers_command))
+    except processutils.ProcessExecutionError as e:
+        LOG.warning(_('Cannot list the image layers of %(host)s, sending '
+                      'every layer: %(err)s'), {'host': host, 'err': e})
+        return set()
+    return set(line.strip() for line in out.splitlines() if line.strip())
+
+
+class _Writer(object):
+    """Counts, and optionally gzips, what is written to a file."""
+
+    def __init__(self, target, compress):
+        self._target = target
+        self._compressor = (zlib.compressobj(6, zlib.DEFLATED,
+                                             16 + zlib.MAX_WBITS)
+                            if compress else None)
+        self.bytes_in = 0
+        self.bytes_sent = 0
+
+    def _send(self, data):
+        if data:
+            self._target.write(data)
+            self.bytes_sent += len(data)
+
+    def write(self, data):
+        self.bytes_in += len(data)
+        if self._compressor:
+            data = self._compressor.compress(data)
+        self._send(data)
+        greenthread.sleep(0)
+
+    def flush(self):
+        if self._compressor:
+            self._send(self._compressor.flush())
+            self._compressor = None
+
+
+def filter_layers(source, target, skip):
+    """Copy a 'docker save' tarball without the layers listed in skip.
+
+    Each layer of the tarball is a '<layer id>/' directory; leaving out
+    the ones the destination has makes 'docker load' keep its own copy.
+
+    :returns: set of the layer ids left out
+    """
+    skipped = set()
+    tar_in = tarfile.open(fileobj=source, mode='r|')
+    tar_out = tarfile.open(fileobj=target, mode='w|')
+    for member in tar_in:
+        layer = member.name.split('/', 1)[0]
+        if layer in skip:
+            skipped.add(layer)
+            continue
+        data = tar_in.extractfile(member) if member.isfile() else None
+        tar_out.addfile(member, data)
+    tar_out.close()
+    tar_in.close()
+    return skipped
+
+
+def stream_image(docker, image_name, host, skip_layers=None):
+    """Send a local image into the Docker daemon of host.
+
+    :param skip_layers: ids of layers host already has, not sent
+    :returns: number of bytes sent over the wire
+    :raises ProcessExecutionError: if the remote load fails
+    """
+    cmd = _ssh(host, CONF.docker.migration_load_command)
+    start = time.time()
+    source = docker.get_image(image_name)
+    try:
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        # Drain the output while writing: a remote writing more than a
+        # pipe buffer would otherwise block, and the write with it.
+        out_reader = greenthread.spawn(proc.stdout.read)
+        err_reader = greenthread.spawn(proc.stderr.read)
+        writer = _Writer(proc.stdin, CONF.docker.migration_compression)
+        skipped = set()
+        try:
+            if skip_layers:
+                skipped = filter_layers(source, writer, skip_layers)
+            else:
+                chunk_size = CONF.docker.migration_chunk_size
+                for chunk in iter(lambda: source.read(chunk_size), ''):
+                    writer.write(chunk)
+            writer.flush()
+            proc.stdin.close()
+            out = out_reader.wait()
+            err = err_reader.wait()
+            exit_code = proc.wait()
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+                # The pipes reach their end with the process.
+                for reader in (out_reader, err_reader):
+                    try:
+                        reader.wait()
+                    except Exception:
+                        pass
+    finally:
+        imagestream.close_stream(source)
+    if exit_code:
+        raise processutils.ProcessExecutionError(
+            stdout=out, stderr=err, exit_code=exit_code, cmd=' '.join(cmd))
+
+    elapsed = time.time() - start
+    metrics.counter('migration_stream_bytes').inc(writer.bytes_sent)
+    metrics.counter('migration_layers_skipped').inc(len(skipped))
+    metrics.histogram('migration_stream_time').observe(elapsed)
+    LOG.info(_('Streamed image %(image)s to %(host)s: %(read)d bytes, '
+               '%(sent)d on the wire, %(skipped)d layers already there, '
+               'in %(time).1fs'),
+             {'image': image_name, 'host': host, 'read': writer.bytes_in,
+              'sent': writer.bytes_sent, 'skipped': len(skipped),
+              'time': elapsed})
+    return writer.bytes_sent
@@ -0,0 +1,173 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Registry of the container network namespace links in /var/run/netns.
+
+Each container gets a /var/run/netns/<container id> symlink to
+/proc/<pid>/ns/net so that 'ip netns exec' can enter it. The registry
+indexes the links in memory from one directory listing, and manages them
+with plain file operations when the directory is writable by nova. Only
+otherwise does it fall back to rootwrap, with one process per link and
+one 'ip -batch' run for a whole stale sweep.
+"""
+
+import errno
+import os
+import threading
+
+from nova.i18n import _
+from nova.openstack.common import log
+from nova import utils
+
+LOG = log.getLogger(__name__)
+
+NETNS_DIR = '/var/run/netns'
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def _pid_of(target):
+    # /proc/<pid>/ns/net
+    parts = target.split('/')
+    if (len(parts) == 5 and parts[1] == 'proc' and parts[3:] == ['ns', 'net']
+            and parts[2].isdigit()):
+        return int(parts[2])
+
+
+def _pid_alive(pid):
+    return os.path.exists('/proc/%d' % pid)
+
+
+class NetnsRegistry(object):
+    """In-memory index of the netns links, keyed by container id."""
+
+    def __init__(self, root=NETNS_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _writable(self):
+        return os.access(self.root, os.W_OK | os.X_OK)
+
+    def _scan(self):
+        """Map every entry of the directory to the PID it links to.
+
+        Entries which are not /proc links, such as namespaces made by
+        'ip netns add', map to None.
+        """
+        entries = {}
+        try:
+            names = os.listdir(self.root)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return entries
+        for name in names:
+            try:
+                entries[name] = _pid_of(os.readlink(self._path(name)))
+            except OSError:
+                entries[name] = None
+        return entries
+
+    @property
+    def entries(self):
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._scan()
+            return self._entries
+
+    def exists(self, name):
+        return name in self.entries
+
+    def link(self, name, pid):
+        """Point the netns link of a container at the namespace of pid."""
+        target = '/proc/%d/ns/net' % int(pid)
+        path = self._path(name)
+        if not os.path.isdir(self.root):
+            try:
+                os.makedirs(self.root)
+            except OSError:
+                utils.execute('mkdir', '-p', self.root, run_as_root=True)
+        if self._writable():
+            # Same result as 'ln -sf', atomically.
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            os.symlink(target, tmp)
+            os.rename(tmp, path)
+        else:
+            utils.execute('ln', '-sf', target, path, run_as_root=True)
+        self.entries[name] = int(pid)
+
+    def unlink(self, name):
+        """Remove the netns link of a container, False if there is none."""
+        if not self.exists(name):
+            return False
+        if self._writable():
+            try:
+                os.unlink(self._path(name))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        else:
+            utils.execute('ip', 'netns', 'delete', name, run_as_root=True)
+        self.entries.pop(name, None)
+        return True
+
+    def find_stale(self):
+        """Return the links whose process is gone.
+
+        The directory is listed again so that links made or removed by
+        anything else than this registry are taken into account.
+        """
+        entries = self._scan()
+        with self._lock:
+            self._entries = entries
+        return sorted(name for name, pid in entries.items()
+                      if pid is not None and not _pid_alive(pid))
+
+    def sweep(self):
+        """Remove every stale link in one pass."""
+        stale = self.find_stale()
+        if not stale:
+            return []
+        if self._writable():
+            for name in stale:
+                try:
+                    os.unlink(self._path(name))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+        else:
+            script = ''.join('netns delete %s\n' % name for name in stale)
+            utils.execute('ip', '-batch', '-', process_input=script,
+                          run_as_root=True)
+        for name in stale:
+            self.entries.pop(name, None)
+        LOG.info(_('Removed %d stale network namespace links'), len(stale))
+        return stale
+
+
+def get_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = NetnsRegistry()
+        return _registry
@@ -18,6 +18,7 @@ from nova.i18n import _
 from nova.openstack.common import log
 from nova.openstack.common import processutils
 from nova import utils
+from novadocker.virt.docker import netns
 
 LOG = log.getLogger(__name__)
 
@@ -25,17 +26,49 @@ LOG = log.getLogger(__name__)
 def teardown_network(container_id):
     #if delete netns ,the veth pair will be deleted auto.
     try:
-        output, err = utils.execute('ip', '-o', 'netns', 'list')
-        for line in output.split('\n'):
-            if container_id == line.strip():
-                utils.execute('ip', 'netns', 'delete', container_id,
-                              run_as_root=True)
-                break
-    except processutils.ProcessExecutionError:
+        netns.get_registry().unlink(container_id)
+    except (processutils.ProcessExecutionError, OSError):
         LOG.warning(_('Cannot remove network namespace, netns id: %s'),
                     container_id)
 
 
+def ip_batch(commands, netns=None):
+    """Run several ip(8) commands through a single 'ip -batch' call.
+
+    :param commands: list of ip commands, each a list of arguments
+                     without the leading 'ip'
+    :param netns: network namespace to run the commands in
+    """
+    script = ''.join(' '.join(str(arg) for arg in cmd) + '\n'
+                     for cmd in commands)
+    args = ('ip', '-batch', '-')
+    if netns:
+        args = ('ip', 'netns', 'exec', netns) + args
+    return utils.execute(*args, process_input=script, run_as_root=True)
+
+
+def list_interfaces(netns):
+    """Return the names of the network interfaces of a namespace."""
+    out, _err = utils.execute('ip', 'netns', 'exec', netns,
+                              'ip', '-o', 'link', 'show', run_as_root=True)
+    names = set()
+    for line in out.splitlines():
+        # <index>: <name>[@<peer>]: <flags> ...
+        fields = line.split(': ', 2)
+        if len(fields) > 1:
+            names.add(fields[1].split('@', 1)[0])
+    return names
+
+
+def next_ifname(netns, prefix='eth'):
+    """Return the first <prefix><N> not used in a namespace yet."""
+    used = list_interfaces(netns)
+    index = 0
+    while '%s%d' % (prefix, index) in used:
+        index += 1
+    return '%s%d' % (prefix, index)
+
+
 def find_fixed_ip(instance, network_info):
     for subnet in network_info['subnets']:
         netmask = subnet['cidr'].split('/')[1]
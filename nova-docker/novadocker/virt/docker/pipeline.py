@@ -0,0 +1,90 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Timed stages of one operation, some of them run concurrently.
+
+Stages which do not depend on each other are started in green threads
+and waited for by the stages which need their result; the others run in
+the caller. Every stage is timed, so a slow operation shows which stage
+it spent its time in.
+"""
+
+import time
+
+from eventlet import greenpool
+
+from novadocker.virt.docker import metrics
+
+
+class Pipeline(object):
+    """Stages of one operation, timed as they run."""
+
+    def __init__(self, name):
+        """:param name: prefix of the <name>_time and <name>_<stage>_time
+                     metrics
+        """
+        self.name = name
+        self._pool = greenpool.GreenPool()
+        self._threads = {}
+        self._done = set()
+        self._started_at = time.time()
+        self.timings = []
+
+    def _timed(self, stage, func, args, kwargs):
+        start = time.time()
+        try:
+            result = func(*args, **kwargs)
+            self._done.add(stage)
+            return result
+        finally:
+            elapsed = time.time() - start
+            self.timings.append((stage, elapsed))
+            metrics.histogram('%s_%s_time' % (self.name, stage)).observe(
+                elapsed)
+
+    def start(self, stage, func, *args, **kwargs):
+        """Run a stage in the background."""
+        self._threads[stage] = self._pool.spawn(self._timed, stage, func,
+                                                args, kwargs)
+
+    def wait(self, stage):
+        """Result of a stage started in the background, or its exception."""
+        return self._threads[stage].wait()
+
+    def run(self, stage, func, *args, **kwargs):
+        """Run a stage in the caller."""
+        return self._timed(stage, func, args, kwargs)
+
+    def wait_all(self):
+        """Wait for the stages still running, ignoring their failures."""
+        for thread in self._threads.values():
+            try:
+                thread.wait()
+            except Exception:
+                pass
+
+    def succeeded(self, stage):
+        return stage in self._done
+
+    def finish(self):
+        """Record the total time of the operation and return it."""
+        elapsed = time.time() - self._started_at
+        metrics.histogram('%s_time' % self.name).observe(elapsed)
+        return elapsed
+
+    def summary(self):
+        """Time of each stage, in the order they ended."""
+        return ', '.join('%s %.2fs' % timing for timing in self.timings)
@@ -0,0 +1,74 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Single-flight execution of duplicate calls.
+
+While a call for a key is in progress, further calls for the same key
+wait for it and share its result or exception instead of running again.
+"""
+
+import sys
+import threading
+
+from eventlet import event
+
+from novadocker.virt.docker import metrics
+
+
+class SingleFlight(object):
+    """Coalesce concurrent calls sharing a key into one."""
+
+    def __init__(self, name):
+        """:param name: prefix of the <name>_calls and <name>_coalesced
+                     metrics
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def waiters(self, key):
+        """Number of callers waiting on the call in progress for key."""
+        with self._lock:
+            call = self._calls.get(key)
+            return call[1] if call else 0
+
+    def do(self, key, func, *args, **kwargs):
+        """Run func, or wait for the run already in progress for key."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [event.Event(), 0]
+            else:
+                call[1] += 1
+        if not leader:
+            metrics.counter('%s_coalesced' % self.name).inc()
+            return call[0].wait()
+
+        metrics.counter('%s_calls' % self.name).inc()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            exc_info = sys.exc_info()
+            with self._lock:
+                del self._calls[key]
+            if call[1]:
+                call[0].send_exception(*exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        with self._lock:
+            del self._calls[key]
+        call[0].send(result)
+        return result
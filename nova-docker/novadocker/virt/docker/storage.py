@@ -0,0 +1,214 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Storage usage probes for the Docker graph driver backing store.
+
+Usage is read straight from the backing store instead of parsing the
+human readable DriverStatus of ``docker info``: devicemapper thin pool
+statistics come from ``dmsetup status``, overlay usage from statvfs on
+the Docker root. The probe is chosen by ``docker_storage_type``.
+"""
+
+import os
+import threading
+import time
+
+from oslo.config import cfg
+
+from nova import exception
+from nova.i18n import _
+from nova.openstack.common import log
+from nova.openstack.common import processutils
+from nova import utils
+
+LOG = log.getLogger(__name__)
+
+storage_opts = [
+    cfg.StrOpt('docker_root',
+               default='/var/lib/docker',
+               help='Docker root directory, used by the overlayfs storage '
+                    'probe.'),
+    cfg.StrOpt('thinpool_name',
+               default='',
+               help='devicemapper thin pool used by Docker. Discovered with '
+                    'dmsetup when empty.'),
+    cfg.IntOpt('storage_usage_cache_time',
+               default=30,
+               help='Seconds the host storage usage is cached for.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(storage_opts, 'docker')
+
+SECTOR = 512
+
+_probe = None
+_probe_lock = threading.Lock()
+
+
+def statvfs(path):
+    return os.statvfs(path)
+
+
+class StorageProbe(object):
+    """Base class of the storage usage probes."""
+
+    def __init__(self):
+        self._usage = None
+        self._usage_time = 0
+        self._lock = threading.Lock()
+
+    def usage(self):
+        """Return total, used and available bytes, cached for a while."""
+        with self._lock:
+            age = time.time() - self._usage_time
+            ttl = CONF.docker.storage_usage_cache_time
+            if self._usage is None or age >= ttl:
+                try:
+                    usage = self._read_usage()
+                except (exception.NovaException,
+                        processutils.ProcessExecutionError) as e:
+                    # Not cached, the next call tries again.
+                    LOG.warning(_('Unable to read the Docker storage '
+                                  'usage: %s'), e)
+                    return {'total': 0, 'used': 0, 'available': 0}
+                self._usage = usage
+                self._usage_time = time.time()
+            return dict(self._usage)
+
+    def _read_usage(self):
+        raise NotImplementedError()
+
+    def container_usage(self, container_id):
+        """Bytes used by a container's writable layer, None if unknown."""
+        return None
+
+
+class NullProbe(StorageProbe):
+    def _read_usage(self):
+        return {'total': 0, 'used': 0, 'available': 0}
+
+
+class DeviceMapperProbe(StorageProbe):
+    """Usage of the devicemapper thin pool behind Docker."""
+
+    def __init__(self, pool_name=None):
+        super(DeviceMapperProbe, self).__init__()
+        self._pool_name = pool_name
+        self._block_sectors = None
+
+    @property
+    def pool_name(self):
+        if not self._pool_name:
+            out, _err = utils.execute('dmsetup', 'ls', '--target',
+                                      'thin-pool', run_as_root=True)
+            for line in out.splitlines():
+                name = line.split('\t')[0].split(' ')[0]
+                if name.startswith('docker-'):
+                    self._pool_name = name
+                    break
+            else:
+                raise exception.NovaException(
+                    _('No devicemapper thin pool used by Docker found'))
+        return self._pool_name
+
+    def _data_block_sectors(self):
+        # <start> <len> thin-pool <meta dev> <data dev> <block size> ...
+        if self._block_sectors is None:
+            out, _err = utils.execute('dmsetup', 'table', self.pool_name,
+                                      run_as_root=True)
+            self._block_sectors = int(out.split()[5])
+        return self._block_sectors
+
+    def _read_usage(self):
+        # <start> <len> thin-pool <transaction> <used>/<total meta blocks>
+        # <used>/<total data blocks> ...
+        out, _err = utils.execute('dmsetup', 'status', self.pool_name,
+                                  run_as_root=True)
+        used_blocks, total_blocks = out.split()[5].split('/')
+        block_size = self._data_block_sectors() * SECTOR
+        total = int(total_blocks) * block_size
+        used = int(used_blocks) * block_size
+        return {'total': total, 'used': used, 'available': total - used}
+
+    def container_usage(self, container_id):
+        try:
+            # Thin devices are named after the pool: docker-<dev>-<ino>-<id>.
+            prefix = self.pool_name[:-len('-pool')]
+            out, _err = utils.execute('dmsetup', 'status',
+                                      '%s-%s' % (prefix, container_id),
+                                      run_as_root=True)
+        except (exception.NovaException,
+                processutils.ProcessExecutionError) as e:
+            LOG.warning(_('Unable to read the disk usage of container '
+                          '%(id)s: %(err)s'), {'id': container_id, 'err': e})
+            return None
+        # <start> <len> thin <mapped sectors> <highest mapped sector>
+        fields = out.split()
+        if len(fields) < 4 or fields[2] != 'thin' or fields[3] == '-':
+            return None
+        return int(fields[3]) * SECTOR
+
+
+class OverlayProbe(StorageProbe):
+    """Usage of the filesystem holding the overlay graph."""
+
+    def __init__(self, root=None):
+        super(OverlayProbe, self).__init__()
+        self.root = root or CONF.docker.docker_root
+
+    def _read_usage(self):
+        st = statvfs(self.root)
+        total = st.f_blocks * st.f_frsize
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        return {'total': total, 'used': used,
+                'available': st.f_bavail * st.f_frsize}
+
+    def container_usage(self, container_id):
+        upper = os.path.join(self.root, 'overlay', container_id, 'upper')
+        if not os.path.isdir(upper):
+            return None
+        used = 0
+        for dirpath, dirnames, filenames in os.walk(upper):
+            for name in dirnames + filenames:
+                try:
+                    used += os.lstat(os.path.join(dirpath, name)).st_blocks
+                except OSError:
+                    pass
+        return used * SECTOR
+
+
+PROBES = {
+    'device_mapper': DeviceMapperProbe,
+    'overlayfs': OverlayProbe,
+}
+
+
+def get_probe():
+    """Return the probe of the configured docker_storage_type."""
+    global _probe
+    with _probe_lock:
+        if _probe is None:
+            storage_type = CONF.docker.docker_storage_type
+            if storage_type == 'device_mapper':
+                _probe = DeviceMapperProbe(CONF.docker.thinpool_name)
+            elif storage_type in PROBES:
+                _probe = PROBES[storage_type]()
+            else:
+                LOG.warning(_('No storage probe for %s, disk usage will '
+                              'be reported as zero.'), storage_type)
+                _probe = NullProbe()
+        return _probe
@@ -0,0 +1,183 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Bounded keep-alive connection pools for the Docker API.
+
+docker-py gives every client its own unix socket pool holding a single
+connection, so concurrent greenthreads either serialize on it or open and
+throw away extra connections. The adapters here hold one bounded pool
+per endpoint, make callers wait for a free connection instead of
+discarding them, and keep counters that can be exported per endpoint.
+
+A caller waits at most pool_timeout seconds for a connection; the event
+stream and the image transfers hold theirs for minutes, so waiting
+without a bound would hang every other call once they use them all.
+"""
+
+import threading
+import time
+
+from docker import unixconn
+from requests import adapters
+
+try:
+    import requests.packages.urllib3 as urllib3
+except ImportError:
+    import urllib3
+
+
+class PoolStats(object):
+    """Usage counters of one connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.acquired = 0
+        self.created = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.exhausted = 0
+
+    def on_acquire(self, waited):
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def on_release(self):
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+    def on_exhausted(self):
+        with self._lock:
+            self.exhausted += 1
+
+    def on_create(self):
+        with self._lock:
+            self.created += 1
+
+    def as_dict(self, idle):
+        with self._lock:
+            acquired = self.acquired
+            reused = max(acquired - self.created, 0)
+            return {
+                'in_use': self.in_use,
+                'idle': idle,
+                'acquired': acquired,
+                'created': self.created,
+                'wait_time': self.wait_time,
+                'avg_wait_time': self.wait_time / acquired if acquired else 0,
+                'max_wait_time': self.max_wait_time,
+                'reuse_rate': float(reused) / acquired if acquired else 0,
+                'exhausted': self.exhausted,
+            }
+
+
+class _InstrumentedPoolMixin(object):
+
+    def _get_conn(self, timeout=None):
+        # requests never passes a timeout, which would wait forever.
+        if timeout is None:
+            timeout = self.pool_timeout
+        start = time.time()
+        try:
+            conn = super(_InstrumentedPoolMixin, self)._get_conn(timeout)
+        except urllib3.exceptions.EmptyPoolError:
+            self.stats.on_exhausted()
+            raise urllib3.exceptions.EmptyPoolError(
+                self, 'All %d connections to the Docker API are in use, '
+                      'none was freed within %ss' % (self.pool.maxsize,
+                                                     timeout))
+        self.stats.on_acquire(time.time() - start)
+        return conn
+
+    def _put_conn(self, conn):
+        # urllib3 also puts back None when a connection was dropped, which
+        # frees the slot all the same.
+        super(_InstrumentedPoolMixin, self)._put_conn(conn)
+        self.stats.on_release()
+
+    def _new_conn(self):
+        self.stats.on_create()
+        return super(_InstrumentedPoolMixin, self)._new_conn()
+
+    def idle(self):
+        return len([c for c in list(self.pool.queue) if c is not None])
+
+
+class HTTPConnectionPool(_InstrumentedPoolMixin,
+                         urllib3.connectionpool.HTTPConnectionPool):
+
+    def __init__(self, host, port, timeout, maxsize, pool_timeout=None):
+        super(HTTPConnectionPool, self).__init__(host, port=port,
+                                                 timeout=timeout,
+                                                 maxsize=maxsize, block=True)
+        self.pool_timeout = pool_timeout
+        self.stats = PoolStats()
+
+
+class UnixHTTPConnectionPool(_InstrumentedPoolMixin,
+                             urllib3.connectionpool.HTTPConnectionPool):
+
+    def __init__(self, base_url, socket_path, timeout, maxsize,
+                 pool_timeout=None):
+        super(UnixHTTPConnectionPool, self).__init__('localhost',
+                                                     timeout=timeout,
+                                                     maxsize=maxsize,
+                                                     block=True)
+        self.pool_timeout = pool_timeout
+        self.base_url = base_url
+        self.socket_path = socket_path
+        self.stats = PoolStats()
+
+    def _new_conn(self):
+        self.stats.on_create()
+        return unixconn.UnixHTTPConnection(self.base_url, self.socket_path,
+                                           self.timeout)
+
+
+class PooledAdapter(adapters.HTTPAdapter):
+    """Transport adapter sending every request through one shared pool."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        super(PooledAdapter, self).__init__()
+
+    def get_connection(self, url, proxies=None):
+        return self.pool
+
+    def request_url(self, request, proxies):
+        return request.path_url
+
+    def close(self):
+        self.pool.close()
+
+
+def make_pool(url, timeout, maxsize, pool_timeout=None):
+    """Build the connection pool for a unix:// or tcp:// Docker endpoint.
+
+    :param pool_timeout: seconds to wait for a free connection before
+                         raising EmptyPoolError, forever if None
+    """
+    if url.startswith('unix://'):
+        socket_path = '/' + url[len('unix://'):].lstrip('/')
+        return UnixHTTPConnectionPool(url, socket_path, timeout, maxsize,
+                                      pool_timeout)
+    address = url.split('://', 1)[-1].rstrip('/')
+    host, _sep, port = address.partition(':')
+    return HTTPConnectionPool(host, int(port or 2375), timeout, maxsize,
+                              pool_timeout)
@@ -20,9 +20,11 @@ from nova.i18n import _
 from nova.network import linux_net
 from nova.network import manager
 from nova.network import model as network_model
+from nova.openstack.common import excutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import processutils
 from nova import utils
+from novadocker.virt.docker import links
 from novadocker.virt.docker import network
 from oslo.config import cfg
 from novadocker.virt.docker.driver import ContainerUtils
@@ -109,6 +111,7 @@ class DockerGenericVIFDriver(object):
             msg = _('Failed to setup the network, rolling back')
             undo_mgr.rollback_and_reraise(msg=msg, instance=instance)
 
+    @links.synchronized
     def plug_ovs_hybird(self, instance, vif):
         undo_mgr = utils.UndoManager()
         iface_id = vif['id'][:11]
@@ -119,42 +122,40 @@ class DockerGenericVIFDriver(object):
         if_bridge = 'qbr%s' % iface_id
         ovs_bridge = vif['network']['bridge']
 
+        # Existence checks come from one link dump, every change below is
+        # applied by a single 'ip -batch' run.
+        batch = links.LinkBatch()
+        create_ovs_port = False
         try:
-            if not linux_net.device_exists(if_bridge):
-                utils.execute('brctl', 'addbr', if_bridge, run_as_root=True)
-                utils.execute('brctl', 'setfd', if_bridge, 0, run_as_root=True)
-                utils.execute('brctl', 'stp', if_bridge, 'off', run_as_root=True)
-                utils.execute('tee',
-                              ('/sys/class/net/%s/bridge/multicast_snooping' %
-                               if_bridge),
-                              process_input='0',
-                              run_as_root=True,
-                              check_exit_code=[0, 1])
-
-
-            if not linux_net.device_exists(v2_name):
-                linux_net._create_veth_pair(v1_name, v2_name)
-                utils.execute('ip', 'link', 'set', if_bridge, 'up', run_as_root=True)
-                utils.execute('brctl', 'addif', if_bridge, v1_name, run_as_root=True)
-                linux_net.create_ovs_vif_port(ovs_bridge,
-                                              v2_name, vif['id'], vif['address'],
-                                              instance['uuid'])
-
-            if self._container_utils.container_is_running(instance) and linux_net.device_exists(if_local_name) and not linux_net.device_exists(if_remote_name):
+            if not batch.exists(if_bridge):
+                batch.add_bridge(if_bridge)
+
+            if not batch.exists(v2_name):
+                if batch.exists(v1_name):
+                    batch.delete(v1_name)
+                batch.add_veth(v1_name, v2_name, promisc=True)
+                batch.set_up(if_bridge)
+                batch.set_master(v1_name, if_bridge)
+                create_ovs_port = True
+
+            if (batch.exists(if_local_name) and
+                    not batch.exists(if_remote_name) and
+                    self._container_utils.container_is_running(instance)):
                     container_id = self._container_utils.get_container_id(instance)
                     ct_netinfo = utils.execute('ip','netns','exec', container_id, 'ip' , 'link', 'show')[0]
                     if if_local_name not in ct_netinfo and 'eth0' not in ct_netinfo:
                         LOG.warning('Mars Gu Try to delete tap device to fix the network error.')
-                        utils.execute('ip', 'link', 'delete', if_local_name, run_as_root=True)
-
-            if not linux_net.device_exists(if_local_name):
-                utils.execute('ip', 'link', 'add', 'name', if_local_name, 'type',
-                              'veth', 'peer', 'name', if_remote_name,
-                              run_as_root=True)
-                utils.execute('ip', 'link', 'set', if_local_name, 'up',
-                              run_as_root=True)
-                utils.execute('brctl', 'addif', if_bridge, if_local_name,
-                              run_as_root=True)
+                        batch.delete(if_local_name)
+
+            if not batch.exists(if_local_name):
+                batch.add_veth(if_local_name, if_remote_name)
+                batch.set_master(if_local_name, if_bridge)
+
+            batch.run()
+            if create_ovs_port:
+                linux_net.create_ovs_vif_port(ovs_bridge,
+                                              v2_name, vif['id'], vif['address'],
+                                              instance['uuid'])
         except Exception:
             LOG.exception("Failed to configure network in hybird type.")
             msg = _('Failed to setup the network, rolling back')
@@ -253,6 +254,7 @@ class DockerGenericVIFDriver(object):
             LOG.debug('ovs type is direct')
             self.unplug_ovs_bridge(instance, vif)
 
+    @links.synchronized
     def unplug_ovs_hybird(self, instance, vif):
         """Unplug the VIF by deleting the port from the ovs hybird ovs mode."""
         iface_id = vif['id'][:11]
@@ -261,19 +263,17 @@ class DockerGenericVIFDriver(object):
         v2_name = 'qvo%s' % iface_id
         if_bridge = 'qbr%s' % iface_id
         ovs_bridge = vif['network']['bridge']
+        batch = links.LinkBatch()
         try:
-            #del linux br
-            if linux_net.device_exists(if_bridge):
-                utils.execute('brctl', 'delif', if_bridge, v1_name, run_as_root=True)
-                utils.execute('ip', 'link', 'set', if_bridge, 'down', run_as_root=True)
-                utils.execute('brctl', 'delbr', if_bridge, run_as_root=True)
-            #del tap veth pair
-            if linux_net.device_exists(if_local_name):
-                utils.execute('ip', 'link', 'delete', if_local_name, run_as_root=True)
-           #del qvb veth pair
-            if linux_net.device_exists(v1_name):
-                utils.execute('ip', 'link', 'delete', v1_name, run_as_root=True)
-            #ip link delete pair1
+            #del linux br, this releases its ports as well
+            if batch.exists(if_bridge):
+                batch.set_down(if_bridge)
+                batch.delete(if_bridge)
+            #del tap and qvb veth pairs
+            for dev in (if_local_name, v1_name):
+                if batch.exists(dev):
+                    batch.delete(dev)
+            batch.run()
             linux_net.delete_ovs_vif_port(ovs_bridge,v2_name)
         except processutils.ProcessExecutionError:
             LOG.exception(_("Failed while unplugging vif"), instance=instance)
@@ -292,10 +292,18 @@ class DockerGenericVIFDriver(object):
         # the bridge.
         pass
 
-    def attach(self, instance, vif, container_id, sec_if=False):
+    def attach(self, instance, vif, container_id, sec_if=False, ifname=None):
+        """Move a plugged VIF into the container and configure it.
+
+        Only the primary interface (not sec_if) gets the default route.
+
+        :param ifname: name in the container, eth0 or eth1 by default
+        """
         vif_type = vif['type']
         if_remote_name = 'ns%s' % vif['id'][:11]
-        if not sec_if:
+        if ifname:
+            if_remote_rename = ifname
+        elif not sec_if:
             if_remote_rename = 'eth0'
         else:
             if_remote_rename = 'eth1'
@@ -309,45 +317,50 @@ class DockerGenericVIFDriver(object):
                   {'vif_type': vif_type, 'instance': instance,
                    'vif': vif})
 
+        # The whole in-namespace configuration is applied by a single
+        # 'ip -batch' run instead of one rootwrap'd command per step.
+        commands = []
+        if not sec_if:
+            commands.append(['link', 'set', 'lo', 'up'])
+        commands.extend([
+            ['link', 'set', if_remote_name, 'name', if_remote_rename],
+            ['link', 'set', if_remote_rename, 'address', vif['address']],
+            ['addr', 'add', ip, 'brd', '+', 'dev', if_remote_rename],
+            ['link', 'set', if_remote_rename, 'up'],
+        ])
+        if not sec_if:
+            commands.append(['route', 'replace', 'default', 'via', gateway,
+                             'dev', if_remote_rename])
+            if dhcp_server:
+                commands.append(['route', 'replace', '169.254.169.254/32',
+                                 'via', dhcp_server])
+            else:
+                LOG.warning("Cloudinit Cloud not work for %s, no dhcp_server info "
+                            "in network meta." % container_id)
+
         try:
             utils.execute('ip', 'link', 'set', if_remote_name, 'netns',
                           container_id, run_as_root=True)
-            utils.execute('ip', 'netns', 'exec', container_id, 'ip', 'link',
-                          'set', if_remote_name, 'name', if_remote_rename,
-                          run_as_root=True)
-            utils.execute('ip', 'netns', 'exec', container_id, 'ip', 'link',
-                          'set', if_remote_rename, 'address', vif['address'],
-                          run_as_root=True)
-            utils.execute('ip', 'netns', 'exec', container_id, 'ifconfig',
-                          if_remote_rename, ip, run_as_root=True)
-            utils.execute('ip', 'netns', 'exec', container_id, 'ip', 'link',
-                          'set', if_remote_rename, 'up', run_as_root=True)
-
-
-            if not sec_if:
-                utils.execute('ip', 'netns', 'exec', container_id,
-                              'ip', 'route', 'replace', 'default', 'via',
-                              gateway, 'dev', if_remote_rename, run_as_root=True)
-                if dhcp_server:
-                    utils.execute('ip', 'netns', 'exec', container_id, 'ip', 'route', 'add',
-                                  '169.254.169.254/32', 'via', dhcp_server)
-                else:
-                    LOG.warning("Cloudinit Cloud not work for %s, no dhcp_server info "
-                                "in network meta." % container_id)
-
+            network.ip_batch(commands, netns=container_id)
 
             # Disable TSO, for now no config option
             #utils.execute('ip', 'netns', 'exec', container_id, 'ethtool',
             #              '--offload', if_remote_rename, 'tso', 'off',
             #              run_as_root=True)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                LOG.exception("Failed to attach vif")
 
-            #send free arp avovid apr proxy in switch.
+        # The interface is usable already, the gratuitous ARP does not
+        # need to hold up the attach.
+        utils.spawn_n(self._send_gratuitous_arp, container_id,
+                      if_remote_rename, ip_nocidr)
+
+    def _send_gratuitous_arp(self, container_id, ifname, ip):
+        #send free arp avovid apr proxy in switch.
+        try:
             utils.execute('ip', 'netns', 'exec', container_id,
                           'arping', '-c', '1' ,'-U', '-I',
-                          if_remote_rename, ip_nocidr, run_as_root=True)
-            #Error while ping the gateway, put an init script in docker_init_exc.
-            #utils.execute('ip', 'netns', 'exec', container_id,
-            #             'ping', '-c', '1' ,
-            #            gateway, run_as_root=True)
+                          ifname, ip, run_as_root=True)
         except Exception:
-            LOG.exception("Failed to attach vif")
+            LOG.exception("Failed to send gratuitous arp for %s" % ifname)
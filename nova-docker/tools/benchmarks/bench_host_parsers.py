@@ -0,0 +1,94 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Cost of extracting the host_monitor fields from captured tool output,
+before (echo | grep | awk shell pipelines) and after (hostparsers), on
+the recorded outputs of the test fixtures.
+
+Usage: python tools/benchmarks/bench_host_parsers.py
+"""
+
+import commands
+import os
+import timeit
+
+from novadocker.virt.docker import host_monitor
+from novadocker.virt.docker import hostparsers
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                        'novadocker', 'tests', 'virt', 'docker', 'fixtures')
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+def _shell(cmd):
+    return commands.getstatusoutput(cmd)[1]
+
+
+def legacy_bios(out):
+    return {
+        'vendor': _shell("echo '%s' |grep Vendor|awk -F':' '{print $2}'"
+                         % out).lstrip(),
+        'version': _shell("echo '%s' |grep Version|awk -F':' '{print $2}'"
+                          % out).lstrip(),
+        'runtime_size': _shell("echo '%s' |grep Runtime|awk '{print $3}'"
+                               % out),
+        'rom_size': _shell("echo '%s' |grep 'ROM Size'|awk '{print $3}'"
+                           % out),
+    }
+
+
+def legacy_disks(out):
+    # One sed|awk pipeline per field of every drive, as get_disk_info did.
+    rows = _shell("echo '%s'|grep physicaldrive" % out)
+    num = int(_shell("echo '%s' |wc -l" % rows))
+    disks = []
+    for i in range(1, num + 1):
+        disks.append([_shell("echo '%s'|sed -n $'%s',1p|awk '{print $%d}'"
+                             % (rows, i, field)) for field in (2, 7, 9)])
+    return disks
+
+
+def parsed_bios(out):
+    return host_monitor.parse_bios_info(hostparsers.parse_dmidecode(out))
+
+
+def parsed_disks(out):
+    return host_monitor.parse_disk_info('HP', out)
+
+
+def main():
+    dmi = fixture('dmidecode_hp.txt')
+    # Same shape as a 24-bay host.
+    drives = fixture('hpssacli.txt').strip().splitlines()
+    hpssacli = '\n'.join(drives * 6) + '\n'
+    cases = (
+        ('bios (before)', lambda: legacy_bios(dmi), 20),
+        ('bios (after)', lambda: parsed_bios(dmi), 2000),
+        ('24 disks (before)', lambda: legacy_disks(hpssacli), 2),
+        ('24 disks (after)', lambda: parsed_disks(hpssacli), 2000),
+    )
+    assert len(legacy_disks(hpssacli)) == int(parsed_disks(hpssacli)['num'])
+    for name, func, runs in cases:
+        best = min(timeit.repeat(func, number=runs, repeat=3))
+        print('%-20s %12.1f us/call' % (name, best * 1e6 / runs))
+
+
+if __name__ == '__main__':
+    main()
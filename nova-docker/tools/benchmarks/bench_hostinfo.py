@@ -0,0 +1,66 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Per-call cost of reading CPU count and memory usage from /proc, before
+(full read and split on every call) and after (hostfacts).
+
+Usage: python tools/benchmarks/bench_hostinfo.py
+"""
+
+import timeit
+
+from novadocker.virt.docker import hostfacts
+
+
+def legacy_get_cpu_info():
+    with open('/proc/cpuinfo') as f:
+        pcpu_total = 0
+        m = f.read().split()
+        for i in range(len(m)):
+            if m[i] == 'processor':
+                pcpu_total = pcpu_total + 1
+    return pcpu_total if pcpu_total > 1 else 1
+
+
+def legacy_get_memory_usage():
+    with open('/proc/meminfo') as f:
+        m = f.read().split()
+        idx1 = m.index('MemTotal:')
+        idx2 = m.index('MemFree:')
+        idx3 = m.index('Buffers:')
+        idx4 = m.index('Cached:')
+        total = int(m[idx1 + 1])
+        avail = int(m[idx2 + 1]) + int(m[idx3 + 1]) + int(m[idx4 + 1])
+    return {'total': total * 1024, 'used': (total - avail) * 1024}
+
+
+def main():
+    runs = 2000
+    cases = (
+        ('get_cpu_info (before)', legacy_get_cpu_info),
+        ('cpu_count (after)', hostfacts.cpu_count),
+        ('get_memory_usage (before)', legacy_get_memory_usage),
+        ('memory_usage (after)', hostfacts.memory_usage),
+        ('snapshot (after)', hostfacts.snapshot),
+    )
+    assert legacy_get_cpu_info() == hostfacts.cpu_count()
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=runs, repeat=3))
+        print('%-26s %8.2f us/call' % (name, best * 1e6 / runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compare the old filter_data post-processing of Docker responses with
+decoding straight into CaseInsensitiveDict.
+
+Usage: python tools/benchmarks/bench_response_filter.py [containers]
+"""
+
+import json
+import sys
+import timeit
+
+from novadocker.virt.docker import client
+
+
+def legacy_filter(obj):
+    """The recursive walk filter_data used to do on every response."""
+    if isinstance(obj, list):
+        obj = [legacy_filter(o) for o in obj]
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            if isinstance(k, basestring):
+                obj[k.lower()] = legacy_filter(v)
+    return obj
+
+
+def make_payload(count):
+    containers = []
+    for i in range(count):
+        containers.append({
+            'Id': '%064x' % i,
+            'Names': ['/instance-%08x' % i],
+            'Image': 'ubuntu:14.04',
+            'Command': 'sh -c "while true;do sleep 10;done"',
+            'Created': 1450000000 + i,
+            'Status': 'Up 3 days',
+            'Ports': [],
+            'Labels': {},
+            'HostConfig': {'NetworkMode': 'none'},
+            'State': {'Running': True, 'Pid': 1000 + i, 'ExitCode': 0},
+            'Config': {'Memory': 2147483648, 'CpuShares': 4096,
+                       'Env': None, 'Cmd': ['sh']},
+        })
+    return json.dumps(containers)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    body = make_payload(count)
+    runs = 50
+
+    def legacy():
+        data = legacy_filter(json.loads(body))
+        for ct in data:
+            ct['Names'][0]
+            ct['State']['Running']
+
+    def view():
+        data = json.loads(body,
+                          object_pairs_hook=client.CaseInsensitiveDict)
+        for ct in data:
+            ct['Names'][0]
+            ct['State']['Running']
+
+    for name, func in (('filter_data walk', legacy),
+                       ('CaseInsensitiveDict', view)):
+        best = min(timeit.repeat(func, number=runs, repeat=3))
+        print('%-22s %4d containers: %8.3f ms/response' %
+              (name, count, best * 1000 / runs))
+
+
+if __name__ == '__main__':
+    main()
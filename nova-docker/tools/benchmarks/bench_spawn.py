@@ -0,0 +1,86 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Spawn time of an instance with its stages run one after the other
+(before) and through the driver's spawn pipeline (after). Every stage is
+replaced by a green sleep of its duration; the image fetch is the one
+given, the others typical ones.
+
+Usage: python tools/benchmarks/bench_spawn.py [image fetch time in s]
+"""
+
+import sys
+import time
+
+import eventlet
+import mock
+
+from novadocker.virt.docker import driver as docker_driver
+
+# Seconds spent in each stage besides the image fetch.
+STAGES = {'plug': 0.4, 'cpuset': 0.05, 'volumes': 0.2, 'create': 0.3,
+          'start': 0.5}
+
+
+def stage(name, result=None):
+    def run(*args, **kwargs):
+        eventlet.sleep(STAGES[name])
+        return result
+    return run
+
+
+def legacy_spawn(driver, instance, network_info):
+    driver._prepare_image(None, instance, {})
+    driver._get_cpu_set(instance)
+    driver._create_volume_containers(instance, 'image', {}, network_info)
+    driver._create_container(instance, 'image', {})
+    driver.plug_vifs(instance, network_info)
+    driver._start_container('fake_id', instance, network_info)
+
+
+def main():
+    fetch = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    STAGES['image'] = fetch
+
+    driver = docker_driver.DockerDriver(object)
+    instance = {'name': 'fake_instance', 'uuid': 'fake_uuid'}
+    network_info = [{'id': 'vif1'}]
+    with mock.patch.object(driver, '_prepare_image',
+                           side_effect=stage('image', ('image', {}))), \
+            mock.patch.object(driver, '_get_cpu_set',
+                              side_effect=stage('cpuset')), \
+            mock.patch.object(driver, 'plug_vifs',
+                              side_effect=stage('plug')), \
+            mock.patch.object(driver, '_create_volume_containers',
+                              side_effect=stage('volumes', True)), \
+            mock.patch.object(driver, '_create_container_args',
+                              return_value={}), \
+            mock.patch.object(driver, '_create_container',
+                              side_effect=stage('create', 'fake_id')), \
+            mock.patch.object(driver, '_start_container',
+                              side_effect=stage('start')):
+        start = time.time()
+        legacy_spawn(driver, instance, network_info)
+        before = time.time() - start
+        start = time.time()
+        driver.spawn(None, instance, {}, None, None, network_info)
+        after = time.time() - start
+    print('%15s %12s %12s' % ('image fetch (s)', 'before (s)', 'after (s)'))
+    print('%15.1f %12.3f %12.3f' % (fetch, before, after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Network-ready time of an instance (plug_vifs then _attach_vifs) against
+its number of VIFs, one VIF at a time (before) and through the driver's
+VIF pool (after). Every command is replaced by a green sleep of the
+typical cost of a rootwrap'd subprocess.
+
+Usage: python tools/benchmarks/bench_vifs.py [command latency in ms]
+"""
+
+import sys
+import time
+
+import eventlet
+import mock
+
+from nova.network import model as network_model
+from novadocker.virt.docker import driver as docker_driver
+from novadocker.virt.docker import netns
+
+
+def make_vif(index):
+    vif_id = '%08x-0000-0000-0000-000000000000' % index
+    return {'network': {'bridge': 'br100',
+                        'subnets': [{'gateway': {'address': '10.%d.0.1'
+                                                 % index},
+                                     'cidr': '10.%d.0.0/24' % index,
+                                     'ips': [{'address': '10.%d.0.3' % index,
+                                              'type': 'fixed',
+                                              'version': 4}],
+                                     'meta': {'dhcp_server': '10.%d.0.2'
+                                              % index}}],
+                        'meta': {'bridge_interface': 'eth0'}},
+            'address': '00:11:22:33:44:%02x' % index,
+            'type': network_model.VIF_TYPE_BRIDGE,
+            'id': vif_id}
+
+
+def legacy_network_ready(driver, instance, network_info):
+    for vif in network_info:
+        driver.vif_driver.plug(instance, vif)
+    for index, vif in enumerate(network_info):
+        driver.vif_driver.attach(instance, vif, 'fake_id',
+                                 sec_if=index > 0, ifname='eth%d' % index)
+
+
+def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.02
+
+    def fake_execute(*cmd, **kwargs):
+        eventlet.sleep(latency)
+        return '', ''
+
+    driver = docker_driver.DockerDriver(object)
+    instance = {'name': 'fake_instance', 'uuid': 'fake_uuid'}
+    with mock.patch('nova.utils.execute', side_effect=fake_execute), \
+            mock.patch('nova.utils.spawn_n'), \
+            mock.patch('nova.network.linux_net.device_exists',
+                       return_value=False), \
+            mock.patch('nova.network.linux_net.LinuxBridgeInterfaceDriver.'
+                       'ensure_bridge'), \
+            mock.patch.object(netns, 'get_registry'), \
+            mock.patch.object(driver, '_get_container_id',
+                              return_value='fake_id'), \
+            mock.patch.object(driver, '_find_container_pid',
+                              return_value=1234):
+        print('%5s %12s %12s' % ('vifs', 'before (s)', 'after (s)'))
+        for count in (1, 2, 4, 8):
+            network_info = [make_vif(i) for i in range(count)]
+            start = time.time()
+            legacy_network_ready(driver, instance, network_info)
+            before = time.time() - start
+            start = time.time()
+            driver._setup_network(instance, network_info)
+            after = time.time() - start
+            print('%5d %12.3f %12.3f' % (count, before, after))
+
+
+if __name__ == '__main__':
+    main()